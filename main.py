@@ -18,9 +18,13 @@ from myuwtesting.functions import isCardVisible, isVisibleFast, \
 from myuwtesting.handler import mainMyuwHandler
 
 from myuwtesting.tests import mainMyuwTestCase, autoDateMyuwTestCase, \
-    jsonMyuwTestCase
+    runSingleWorker, runQueueWorker
+from myuwtesting.dispatch import parseAddress
 
 from myuwtesting.tests import getTestDates
+from myuwtesting.reduction import reduceTestDates, reductionReport
+from myuwtesting import matrix
+from myuwtesting.matrix import visibilityMatrix
 
 # This import is different depending on whether we're using this as a package
 # or not.
@@ -64,14 +68,10 @@ if __name__ == '__main__':
             else:
 
                 try:
-                    pairs = argv[2:]
-                    testDates = {}
-                    for pair in pairs:
+                    pairs = []
+                    for pair in argv[2:]:
                         user, date = pair.split(':', 1)
-                        if user not in testDates:
-                            testDates[user] = []
-                        testDates[user].append(date)
-                    users = testDates.keys()
+                        pairs.append((user, date))
 
                 except:
 
@@ -80,21 +80,52 @@ if __name__ == '__main__':
 
                 else:
 
-                    # Make test case with our specific dates and users
-                    class singleTestCase(jsonMyuwTestCase):
-                        '''Test class for --single mode'''
-                        testDates = testDates
-                        usersToTest = users
-
                     # Run the test with json output
-                    runner = unittest.TextTestRunner()
-                    runner.run(singleTestCase('_test_json_out'))
+                    runSingleWorker(pairs)
+
+        elif argv[1] == '--queue':
+            # Worker for queue dispatch mode, which takes its pairs from
+            # the dispatcher at the given address
+
+            if len(argv) != 3:
+                print 'Please specify the dispatcher address. '
+                print 'Example: main.py --queue 127.0.0.1:50000'
+
+            else:
+
+                runQueueWorker(parseAddress(argv[2]))
 
         elif argv[1] == '--dump-dates':
             testUsers = getTestDates()
             for user, dates in testUsers.items():
                 print 'Test dates for user %s:' % user
                 print '    ' + ', '.join([str(date) for date in dates])
+            reduced, removed = reduceTestDates(testUsers)
+            print reductionReport(testUsers, removed,
+                                  mainMyuwTestCase.pairEstimator())
+            if not testconfig.reduceDates:
+                print 'Set reduceDates in testconfig to skip these dates'
+            # The visibility matrix needs numpy
+            if matrix.numpy is not None:
+                print visibilityMatrix.build().summary()
+
+        elif argv[1] == '--dump-matrix':
+            # Save the card x date visibility matrix, as CSV if the file
+            # name ends in .csv and as a numpy .npz file otherwise
+
+            if len(argv) != 3:
+                print 'Please specify a file to save the matrix to. '
+                print 'Example: main.py --dump-matrix visibility.csv'
+
+            else:
+
+                visMatrix = visibilityMatrix.build()
+                if argv[2].endswith('.csv'):
+                    with open(argv[2], 'wb') as f:
+                        visMatrix.writeCsv(f)
+                else:
+                    visMatrix.save(argv[2])
+                print visMatrix.summary()
 
         elif argv[1] == '--debug':
 
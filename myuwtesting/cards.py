@@ -6,8 +6,13 @@ from selenium.common.exceptions import NoSuchElementException
 
 from .functions import isCardVisible, packElement, formatDiffs, \
     rangesToSigDates, filterListVis
+from .diffs import noteDiff
+from .extract import fieldText, fieldTexts, fieldAttr, fieldExists, \
+    fieldList, hasClass
 from .dates import *
 from .classes import *
+from . import intervals
+from .perf import span
 from .data import stuHuskyCardLink, empHuskyCardLink
 
 # Dictionary of IDs to card classes
@@ -112,6 +117,32 @@ class HFSCard(myuwCard):
 
         return cls(balanceDict, linkUrl, titleText)
 
+    extractSchema = {
+        'title': fieldText('./div[@data-type="card"]/h3'),
+        'balances': fieldList('(.//ul[@class="card_list"])[1]/li/div', {
+            'label': fieldText(
+                './/div' + hasClass('pull-left') +
+                '//h4' + hasClass('card-badge-label')),
+            'balance': fieldText('.//*' + hasClass('pull-right')),
+        }),
+        'addFundsUrl': fieldAttr('.//div[@class="card-badge-action"]/a',
+                                 'href'),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        balanceDict = {}
+        for bal in data['balances']:
+            label = bal['label']
+            try:
+                balanceId = balanceLabels[label]
+            except KeyError:
+                raise Exception('Unknown husky card balance %s' % label)
+
+            balanceDict[balanceId] = bal['balance']
+
+        return cls(balanceDict, data['addFundsUrl'], data['title'])
+
     autoDiffs = {
         'title': 'HFS Card Title',
         'balanceDict': 'HFS Card Balances',
@@ -138,6 +169,13 @@ class EmpFacStudentCard(myuwCard):
         instructor = 'Instructor or TA for a class' in innerText
         return cls(stuEmp, instructor)
 
+    @classmethod
+    def fromData(cls, data, date):
+        innerText = data['text']
+        stuEmp = 'Student Employees' in innerText
+        instructor = 'Instructor or TA for a class' in innerText
+        return cls(stuEmp, instructor)
+
     autoDiffs = {
         'stuEmp': 'Student Employee Section',
         'instructor': 'Instructor Section',
@@ -170,20 +208,41 @@ class FutureQuarterCard(myuwCard):
             titleEl = qtrEl.find_element_by_xpath('.//h4')
             qtrName = titleEl.text
             subElements = qtrEl.find_elements_by_xpath('.//p/span')
-            creditsText, sectionsText = [el.text for el in subElements]
-            credits_re = re.search('registered for (.*) credit', creditsText)
-            credits = credits_re.groups()[0]
-            sections = re.search('\((.*) section', sectionsText).groups()[0]
-            credits = int(credits)
-            sections = int(sections)
-
-            qtrDict = {
-                'credits': credits,
-                'sections': sections
-            }
-            qtrs[qtrName] = qtrDict
+            spanTexts = [el.text for el in subElements]
+            qtrs[qtrName] = cls.parseQtr(spanTexts)
         return cls(qtrs)
 
+    extractSchema = {
+        'qtrs': fieldList('.//div[@data-name="FutureCard"]', {
+            'qtrName': fieldText('.//h4'),
+            'spans': fieldTexts('.//p/span'),
+        }),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        qtrs = {}
+        for qtr in data['qtrs']:
+            qtrs[qtr['qtrName']] = cls.parseQtr(qtr['spans'])
+        return cls(qtrs)
+
+    @staticmethod
+    def parseQtr(spanTexts):
+        '''Turn the credits and sections lines for a quarter into
+        a dictionary of credits and sections. '''
+        creditsText, sectionsText = spanTexts
+        credits_re = re.search('registered for (.*) credit', creditsText)
+        credits = credits_re.groups()[0]
+        sections = re.search('\((.*) section', sectionsText).groups()[0]
+        credits = int(credits)
+        sections = int(sections)
+
+        qtrDict = {
+            'credits': credits,
+            'sections': sections
+        }
+        return qtrDict
+
     autoDiffs = {'qtrs': 'Future Quarter Data'}
 
 
@@ -204,6 +263,13 @@ class SummerEFSCard(myuwCard):
         efs = 'Consider Early Fall Start' in text
         return cls(sumReg, efs)
 
+    @classmethod
+    def fromData(cls, data, date):
+        text = data['text']
+        sumReg = 'Review Critical Summer' in text
+        efs = 'Consider Early Fall Start' in text
+        return cls(sumReg, efs)
+
     autoDiffs = {
         'sumReg': 'Has Summer Reg Info section',
         'efs': 'Has EFS Section',
@@ -235,6 +301,45 @@ class GradeCard(myuwCard):
     @classmethod
     @packElement
     def fromElement(cls, e, date):
+        qtr = cls.gradeQuarter(date)
+
+        qtrEls = e.find_elements_by_xpath('.//li[@class="clearfix"]')
+        thisQtrDict = {}
+        for el in qtrEls:
+            leftEl = el.find_element_by_xpath('.//div[@class="pull-left"]')
+            rightEl = el.find_element_by_xpath('.//div[@class="pull-right"]')
+            className = leftEl.text
+            classGrade = rightEl.text
+            thisQtrDict[className] = classGrade
+
+        qtrDict = {
+            qtr: thisQtrDict
+        }
+        newObj = cls(qtrDict)
+        newObj.quarter = qtr
+        return newObj
+
+    extractSchema = {
+        'grades': fieldList('.//li[@class="clearfix"]', {
+            'className': fieldText('.//div[@class="pull-left"]'),
+            'grade': fieldText('.//div[@class="pull-right"]'),
+        }),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        qtr = cls.gradeQuarter(date)
+        thisQtrDict = {}
+        for grade in data['grades']:
+            thisQtrDict[grade['className']] = grade['grade']
+
+        newObj = cls({qtr: thisQtrDict})
+        newObj.quarter = qtr
+        return newObj
+
+    @staticmethod
+    def gradeQuarter(date):
+        '''Figure out which quarter's grades are shown on date. '''
         # We have to adjust the date a bit, since the final grades
         # card will appear a bit past the end of the quarter
 
@@ -252,21 +357,10 @@ class GradeCard(myuwCard):
             else:
                 qtr = 'SA13'
 
-        qtrEls = e.find_elements_by_xpath('.//li[@class="clearfix"]')
-        thisQtrDict = {}
-        for el in qtrEls:
-            leftEl = el.find_element_by_xpath('.//div[@class="pull-left"]')
-            rightEl = el.find_element_by_xpath('.//div[@class="pull-right"]')
-            className = leftEl.text
-            classGrade = rightEl.text
-            thisQtrDict[className] = classGrade
+        return qtr
 
-        qtrDict = {
-            qtr: thisQtrDict
-        }
-        newObj = cls(qtrDict)
-        newObj.quarter = qtr
-        return newObj
+    def dateState(self, date):
+        return self.gradeQuarter(date)
 
     def getGradesForQuarter(self, qtr):
         '''Get the final grades for a specific quarter. Returns
@@ -279,7 +373,7 @@ class GradeCard(myuwCard):
 
     def findDiffs(self, other):
         '''Find quarter to compare, then compare data. '''
-        diffs = ''
+        diffs = []
         trueQtr = self.quarter or other.quarter
 
         gradesA = self.getGradesForQuarter(trueQtr)
@@ -344,30 +438,22 @@ class RegStatusCard(myuwCard):
         if holds:
             self.visCheck = visAlways
 
+    # Classes of the holds banner link, in order of preference
+    bannerClasses = [
+        'reg_disclosure',
+        'reg_disclosure_summerA',
+        'reg_disclosure_summer1',
+        'show_reg_holds',
+    ]
+
     @classmethod
     def fromElement(cls, e, date):
 
         title = e.find_element_by_tag_name('h3').text
-        # Quarter = middle word of title
-        # Year = last word
-        titleSplit = title.split(' ')
-        qtr = titleSplit[1]
-        year = titleSplit[2]
-        # Abbreviate to 2 letters
-        qtr = qtr[0:2].upper()
-        # Use last 2 digits
-        year = year[2:4]
-        # Assemble date of the form 'SU13'
-        qtrString = qtr + year
-        eleclasses = [
-            'a.reg_disclosure',
-            'a.reg_disclosure_summerA',
-            'a.reg_disclosure_summer1',
-            'a.show_reg_holds'
-        ]
-        for eleclass in eleclasses:
+        qtrString = cls.titleToQtr(title)
+        for eleclass in cls.bannerClasses:
             try:
-                banner = e.find_element_by_css_selector(eleclass)
+                banner = e.find_element_by_css_selector('a.' + eleclass)
                 break
             except NoSuchElementException:
                 continue
@@ -383,6 +469,45 @@ class RegStatusCard(myuwCard):
         return cls(holds=numHolds, qtr=qtrString, date=date,
                    myplanContent=hasMyplan)
 
+    extractSchema = dict(
+        [('title', fieldText('.//h3'))] +
+        [('banner_' + eleclass, fieldText('.//a' + hasClass(eleclass)))
+         for eleclass in bannerClasses]
+    )
+
+    @classmethod
+    def fromData(cls, data, date):
+        qtrString = cls.titleToQtr(data['title'])
+        for eleclass in cls.bannerClasses:
+            bannerText = data['banner_' + eleclass]
+            if bannerText is not None:
+                break
+        else:
+            return cls(holds=0, qtr=qtrString)
+
+        # Need to pull out x from "x holds"
+        numHolds = int(bannerText.split(' ')[-2])
+
+        hasMyplan = 'In MyPlan' in data['text']
+
+        return cls(holds=numHolds, qtr=qtrString, date=date,
+                   myplanContent=hasMyplan)
+
+    @staticmethod
+    def titleToQtr(title):
+        '''Turn the card title into a quarter of the form 'SU13'. '''
+        # Quarter = middle word of title
+        # Year = last word
+        titleSplit = title.split(' ')
+        qtr = titleSplit[1]
+        year = titleSplit[2]
+        # Abbreviate to 2 letters
+        qtr = qtr[0:2].upper()
+        # Use last 2 digits
+        year = year[2:4]
+        # Assemble date of the form 'SU13'
+        return qtr + year
+
     def shouldAppear(self, date):
 
         for qtr in self.qtrs:
@@ -394,10 +519,18 @@ class RegStatusCard(myuwCard):
 
         return False
 
+    def visIntervals(self):
+        return intervals.normalize(
+            [(myuwDate(self.show[qtr]).key, myuwDate(self.hide[qtr]).key)
+             for qtr in self.qtrs])
+
     @classmethod
     def isPeakLoad(cls, date):
         return cls.loadPeriods(date)
 
+    def dateState(self, date):
+        return self.isPeakLoad(date)
+
     def findDiffs(self, other):
         peak = self.isPeakLoad(other.date)
         expVis = self.myplanContent
@@ -405,17 +538,19 @@ class RegStatusCard(myuwCard):
 
         if peak:
             if actualVis:
-                diffs = 'Myplan content appeared during peak load time.\n'
+                diffs = [noteDiff('Myplan content appeared during peak load '
+                                  'time.')]
 
             else:
-                diffs = ''
+                diffs = []
 
         else:
             if actualVis and not expVis:
-                diffs = 'Myplan content showed unexpectedly.\n'
+                diffs = [noteDiff('Myplan content showed unexpectedly.')]
 
             elif expVis and not actualVis:
-                diffs = 'Myplan content did not show but was expected.\n'
+                diffs = [noteDiff('Myplan content did not show but was '
+                                  'expected.')]
 
             else:
                 diffs = formatDiffs('Myplan content visibility',
@@ -469,12 +604,7 @@ class SummerRegStatusCard(RegStatusCard):
 
     @classmethod
     def fromElement(cls, e, date):
-        if getCardName(e) == 'SummerRegStatusCardA':
-            pos = 'top'
-        elif getCardName(e) == 'SummerRegStatusCard1':
-            pos = 'bot'
-        else:
-            pos = 'invalid'
+        pos = cls.namePosition(getCardName(e))
 
         # Need to un-classmethod this
         newCard = RegStatusCard.fromElement.__func__(cls, e, date)
@@ -482,6 +612,22 @@ class SummerRegStatusCard(RegStatusCard):
         # newCard.date = date
         return newCard
 
+    @classmethod
+    def fromData(cls, data, date):
+        newCard = RegStatusCard.fromData.__func__(cls, data, date)
+        newCard.pos = cls.namePosition(data['name'])
+        return newCard
+
+    @staticmethod
+    def namePosition(cardName):
+        '''Which position the card is in, based on its id. '''
+        if cardName == 'SummerRegStatusCardA':
+            return 'top'
+        elif cardName == 'SummerRegStatusCard1':
+            return 'bot'
+        else:
+            return 'invalid'
+
     name = 'SummerRegStatusCard'
     altNames = [
         'SummerRegStatusCardA',
@@ -502,6 +648,9 @@ class SummerRegStatusCard(RegStatusCard):
 
     extraSigDates = topCheck.significantDates
 
+    def dateState(self, date):
+        return (self.isPeakLoad(date), self.topCheck(date))
+
     """
     @property
     def significantDates(self):
@@ -529,7 +678,19 @@ class CriticalInfoCard(myuwCard):
 
         # Find section titles, compare to known values
         titles = [e.text for e in headers]
+        return cls.fromTitles(titles)
 
+    extractSchema = {
+        'titles': fieldTexts('.//span[@class="notice-title"]'),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        return cls.fromTitles(data['titles'])
+
+    @classmethod
+    def fromTitles(cls, titles):
+        '''Make the card from the list of section titles. '''
         email = 'Set Up UW Email' in titles
         directory = 'Update Student Directory' in titles
         residency = 'Non-Resident Classification' in titles
@@ -585,6 +746,30 @@ class VisualScheduleCard(myuwCard):
         newObj.quarter = qtr
         return newObj
 
+    extractSchema = {
+        'noCourses': fieldExists('.//div[@data-name="NoCourseCard"]'),
+        'courseIds': fieldTexts('.//div' + hasClass('visual-course-id')),
+        'courseInfo': fieldTexts('.//div' + hasClass('course-info')),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        if data['noCourses']:
+            return NoCourseCard()
+
+        if 'Early Fall Start' in data['text']:
+            qtr = 'EFS'
+        else:
+            qtr = dateToTerm(date)
+        thisQtrClasses = {}
+        for text in data['courseIds'] + data['courseInfo']:
+            if text:
+                thisQtrClasses[text] = None
+
+        newObj = cls({qtr: thisQtrClasses})
+        newObj.quarter = qtr
+        return newObj
+
     def getQtrInfo(self, qtr):
         if self.quartersDict is None:
             return {}
@@ -595,7 +780,6 @@ class VisualScheduleCard(myuwCard):
         trueQtr = self.quarter or other.quarter
         classesA = self.getQtrInfo(trueQtr)
         classesB = other.getQtrInfo(trueQtr)
-        diffs = ''
         diffs = formatDiffs('Visual Schedule Content', classesA, classesB)
         return diffs
 
@@ -626,6 +810,9 @@ class VisualScheduleCard(myuwCard):
 
     autoDiffs = {'quartersDict': 'Visual Schedule Classes'}
 
+    def dateState(self, date):
+        return dateToTerm(date)
+
 
 @isaCard
 class FinalExamCard(myuwCard):
@@ -643,6 +830,17 @@ class FinalExamCard(myuwCard):
 
         return cls()
 
+    extractSchema = {
+        'noCourses': fieldExists('.//div[@data-name="NoCourseCard"]'),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        if data['noCourses']:
+            return NoCourseCard()
+
+        return cls()
+
 
 def checkNCC(e):
     '''Check if a card element is actually the NoCourseCard
@@ -710,38 +908,63 @@ class GradCommitteeCard(myuwCard):
                 memberLines = member.find_elements_by_xpath('./span')
                 # Get text of each line
                 memberDetails = [e.text for e in memberLines]
-                memberDict = {}
-                # Name is on the first line, along with committee role
-                nameLine = memberDetails[0]
-                nameParts = nameLine.split(', ')
-                # First chunk before a comma (if any) is the name of the person
-                memberDict['name'] = nameParts[0]
-                # Anything after that is a role
-                for role in nameParts[1:]:
-                    if role == 'GSR':
-                        memberDict['gsr'] = True
-                    elif role == 'Reading Committee Member':
-                        memberDict['rcm'] = True
-                    elif role == 'Reading Committee Chair':
-                        memberDict['rcc'] = True
-                    elif role == 'Chair':
-                        memberDict['chair'] = True
-
-                # Other 2 lines are optional
-                # If it contains @, consider it to be the email
-                # Otherwise, consider it to be the department.
-                for line in memberDetails[1:]:
-                    if line.find('@') == -1:
-                        memberDict['dept'] = line
-                    else:
-                        memberDict['email'] = line
-
-                members.append(memberDict)
+                members.append(cls.parseMember(memberDetails))
 
             commDict[commName] = members
 
         return cls(commDict)
 
+    extractSchema = {
+        'committees': fieldList('.//ul[@class="card-list"]/li', {
+            'commName': fieldText('./h4'),
+            'members': fieldList('./ol/li[@class="committee-member"]', {
+                'lines': fieldTexts('./span'),
+            }),
+        }),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        commDict = {}
+        for comm in data['committees']:
+            members = [cls.parseMember(member['lines'])
+                       for member in comm['members']]
+            commDict[comm['commName']] = members
+
+        return cls(commDict)
+
+    @staticmethod
+    def parseMember(memberDetails):
+        '''Turn the lines of text for a committee member into a member
+        dictionary. '''
+        memberDict = {}
+        # Name is on the first line, along with committee role
+        nameLine = memberDetails[0]
+        nameParts = nameLine.split(', ')
+        # First chunk before a comma (if any) is the name of the person
+        memberDict['name'] = nameParts[0]
+        # Anything after that is a role
+        for role in nameParts[1:]:
+            if role == 'GSR':
+                memberDict['gsr'] = True
+            elif role == 'Reading Committee Member':
+                memberDict['rcm'] = True
+            elif role == 'Reading Committee Chair':
+                memberDict['rcc'] = True
+            elif role == 'Chair':
+                memberDict['chair'] = True
+
+        # Other 2 lines are optional
+        # If it contains @, consider it to be the email
+        # Otherwise, consider it to be the department.
+        for line in memberDetails[1:]:
+            if line.find('@') == -1:
+                memberDict['dept'] = line
+            else:
+                memberDict['email'] = line
+
+        return memberDict
+
 
 # Do later
 @isaCard
@@ -798,6 +1021,23 @@ class GradStatusCard(myuwCard):
         fromElement classmethod. '''
         return [reqClass.fromElement(reqEl) for reqEl in reqEls]
 
+    extractSchema = dict([
+        (el_id, fieldList('.//div[@id="%s"]/ul/li/div' % el_id,
+                          gradRequest.extractSchema))
+        for el_id in ('petition-reqs', 'leave-reqs', 'degree-reqs')
+    ])
+
+    @classmethod
+    def fromData(cls, data, date):
+        date = myuwDate(date)
+        petitions = [petRequest.fromData(req)
+                     for req in data['petition-reqs']]
+        leaves = [leaveRequest.fromData(req) for req in data['leave-reqs']]
+        degrees = [degreeRequest.fromData(req)
+                   for req in data['degree-reqs']]
+
+        return cls(petitions, leaves, degrees, date)
+
     # For the expected one, at the top level of each dictionary, rather than
     # specifying an item directly, you can specify
     def filterToDate(self, date):
@@ -813,6 +1053,10 @@ class GradStatusCard(myuwCard):
         newObj.needsFiltering = False
         return newObj
 
+    def dateState(self, date):
+        return tuple([bool(req.shouldAppear(date)) for req in
+                      self.petitions + self.leaves + self.degrees])
+
     autoDiffs = {
         'petitions': 'Petition Requests',
         'leaves':  'Leave Requests',
@@ -867,6 +1111,13 @@ class ThriveCard(myuwCard):
                 return value
         return None
 
+    def dateState(self, date):
+        # Which week's content is expected
+        for key in self.expectedContent.keys():
+            if date in key:
+                return (str(key.startDate), str(key.endDate))
+        return None
+
     def findDiffs(self, other):
 
         if self.actual and not(other.actual):
@@ -901,12 +1152,32 @@ class ThriveCard(myuwCard):
         card = ThriveCard(date, content)
         return card
 
+    extractSchema = {
+        'titles': fieldTexts('.//h4'),
+        'paragraphs': fieldTexts('.//p'),
+        'links': fieldList('.//ul/li/a', link.extractSchema),
+    }
+
+    @classmethod
+    def fromData(cls, data, date):
+        title = data['titles'][0]
+        desc, tryThis = data['paragraphs'][0:2]
+        links = [link.fromData(linkData) for linkData in data['links']]
+
+        content = thriveContent(title, desc, tryThis, links)
+        return ThriveCard(date, content)
+
     def shouldAppear(self, date):
         for key in self.expectedContent.keys():
             if date in key:
                 return True
         return False
 
+    def visIntervals(self):
+        return intervals.normalize(
+            [(key.startDate.key, key.endDate.key)
+             for key in self.expectedContent.keys()])
+
     # Since the keys of the expected content dictionary are date ranges,
     # we can use rangesToSigDates to generate test dates.
     @property
@@ -927,6 +1198,15 @@ class CourseCards(myuwCard):
 
         return cls()
 
+    extractSchema = FinalExamCard.extractSchema
+
+    @classmethod
+    def fromData(cls, data, date):
+        if data['noCourses']:
+            return NoCourseCard()
+
+        return cls()
+
 
 @isaCard
 class NoCourseCard(myuwCard):
@@ -952,11 +1232,20 @@ class uwemail(myuwCard):
 
     @classmethod
     def fromElement(cls, e, date):
+        return cls.fromText(e.text)
 
-        if 'Gmail' in e.text:
+    @classmethod
+    def fromData(cls, data, date):
+        return cls.fromText(data['text'])
+
+    @classmethod
+    def fromText(cls, text):
+        '''Make the card based on which email service the link names. '''
+
+        if 'Gmail' in text:
             emailType = 'gmail'
 
-        elif 'Outlook' in e.text:
+        elif 'Outlook' in text:
             emailType = 'outlook'
 
         else:
@@ -1022,8 +1311,22 @@ def getCardClass(cardName):
         raise UnknownCardError(cardName)
 
 
+errorText = 'An error has occurred'
+
+
 def cardIsError(el):
-    return 'An error has occurred' in el.text
+    return errorText in el.text
+
+
+def errorCardFor(cardName):
+    '''Make an errorCard for a card that showed an error. '''
+    try:
+        baseCardName = getCardClass(cardName).name
+
+    except UnknownCardError:
+        baseCardName = cardName
+
+    return errorCard(baseCardName)
 
 
 def cardFromElement(el, date):
@@ -1031,29 +1334,54 @@ def cardFromElement(el, date):
 
     cardName = getCardName(el)
 
-    if isCardVisible(el):
+    # Time everything done with the card's element, not just fromElement,
+    # so that WebDriver commands checking it are put down to it too
+    with span('fromElement', 'card', card=cardName):
 
-        if cardIsError(el):
+        if isCardVisible(el):
 
-            try:
-                baseCardName = getCardClass(cardName).name
+            if cardIsError(el):
+
+                newCard = errorCardFor(cardName)
+
+            else:
+
+                cardClass = getCardClass(cardName)
+                newCard = cardClass.fromElement(el, date)
+
+                if newCard is None:
+                    raise Exception('%s.fromElement returned None'
+                                    % cardClass)
+
+            retval = {newCard.name: newCard}
+            return retval
+
+        else:
+            return {}
+
+
+def cardFromData(data, date):
+    '''Like cardFromElement, but makes the card from a record returned by
+    the extraction script (see myuwtesting.extract). '''
+
+    cardName = data['name']
+
+    if data['visible'] and data['text']:
 
-            except UnknownCardError:
-                baseCardName = cardName
+        if errorText in data['text']:
 
-            newCard = errorCard(baseCardName)
+            newCard = errorCardFor(cardName)
 
         else:
 
             cardClass = getCardClass(cardName)
-            newCard = cardClass.fromElement(el, date)
+            with span('fromData', 'card', card=cardName):
+                newCard = cardClass.fromData(data, date)
 
             if newCard is None:
-                raise Exception('%s.fromElement returned None' % cardClass)
-            baseCardName = newCard.name
+                raise Exception('%s.fromData returned None' % cardClass)
 
-        retval = {baseCardName: newCard}
-        return retval
+        return {newCard.name: newCard}
 
     else:
         return {}
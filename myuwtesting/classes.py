@@ -1,15 +1,18 @@
 #!/usr/bin/python
 
+from collections import OrderedDict
 import datetime
-from functools import total_ordering
 from UserDict import IterableUserDict
 import time
 
 from .functions import toTimeDelta, packElement, formatDiffs, findDiffs, \
     getCardName, uesc, isCardVisible, isVisibleFast, getCardName
 
+from .diffs import noteDiff
 from .exceptions import MyuwDateTypeError, LandingWaitTimedOut
+from .extract import fieldText, fieldAttr, fieldList, hasClass
 from .testconfig import perf
+from . import intervals
 
 
 def toDate(obj):
@@ -27,79 +30,120 @@ def toDate(obj):
     return obj
 
 
-class myuwDateMeta(type):
-    '''Metaclass to allow us to provide a myuwDate or subclass instance as
-    the argument for myuwDate and having it simply return that input. Useful
-    so that things that use the myuwDate constructor won't choke on
-    and/or mangle myuwDateTime instances. '''
-    def __call__(cls, *args, **kwargs):
-        if len(args) == 1:
-            arg = args[0]
-            if isinstance(arg, myuwDate):
-                return arg
+# Seconds in a day, for myuwDate keys
+daySeconds = 86400
 
-        return super(myuwDateMeta, cls).__call__(*args, **kwargs)
 
+def dateKey(obj):
+    '''Get the myuwDate key (see myuwDate) of a myuwDate, datetime, date or
+    string. '''
+    if isinstance(obj, myuwDate):
+        return obj.key
+    if isinstance(obj, datetime.datetime):
+        return (obj.toordinal() * daySeconds + obj.hour * 3600 +
+                obj.minute * 60 + obj.second)
+    if isinstance(obj, datetime.date):
+        return obj.toordinal() * daySeconds
+    if isinstance(obj, basestring):
+        return myuwDate(obj).key
+    raise MyuwDateTypeError(obj)
 
-@total_ordering
-class myuwDate(object):
-    '''Wrapper around datetime.date that allows easy converion to and
-    from "yyyy-mm-dd" format for myuw. '''
 
-    __metaclass__ = myuwDateMeta
+def parseDateString(arg):
+    '''Parse a "yyyy-mm-dd" or "yyyy-mm-dd hh:mm:ss" string into a
+    datetime. Plain dates get 00:00:01 as the time. '''
+    parts = arg.split(' ')
+    if len(parts) > 2:
+        raise MyuwDateTypeError(arg)
 
-    def __init__(self, arg):
-        '''Arguments are accepted in various forms:
-        myuwDate('yyyy-mm-dd')
-        myuwDate(datetime.date instance)
-        myuwDate(myuwDate instance)
-        '''
+    dateValues = [int(s) for s in parts[0].split('-')]
+    if len(parts) == 2:
+        timeValues = [int(s) for s in parts[1].split(':')]
+    else:
+        timeValues = [0, 0, 1]
 
-        # Interpret yyyy-mm-dd string
-        if isinstance(arg, basestring):
-            try:
+    if not(len(dateValues) == len(timeValues) == 3):
+        raise MyuwDateTypeError(arg)
 
-                parts = arg.split(' ')
-                l = len(parts)
-                if l > 2:
-                    raise MyuwDateTypeError(*args)
+    return datetime.datetime(*(dateValues + timeValues))
 
-                dateStr = parts[0]
-                dateParts = dateStr.split('-')
-                dateValues = [int(s) for s in dateParts]
 
-                if len(parts) == 2:
-                    timeStr = parts[1]
-                    timeParts = timeStr.split(':')
-                    timeValues = [int(s) for s in timeParts]
-                else:
-                    timeValues = [0, 0, 1]
+class myuwDate(object):
+    '''A date (and time) that allows easy converion to and from
+    "yyyy-mm-dd" format for myuw.
+
+    Each date is stored as one integer key, the number of seconds since
+    0001-01-01, so comparing, hashing and adding to dates is integer math.
+    Dates are interned, so there is only ever one myuwDate for each key,
+    and strings are parsed through a small LRU cache. This means anything
+    set on a myuwDate (e.g. nosig) applies to every use of that date.
+
+    Arguments are accepted in various forms:
+    myuwDate('yyyy-mm-dd')
+    myuwDate('yyyy-mm-dd hh:mm:ss')
+    myuwDate(datetime.date or datetime.datetime instance)
+    myuwDate(myuwDate instance), which returns that instance
+    '''
 
-                assert len(dateValues) == len(timeValues) == 3
+    __slots__ = ('key', '_dateObj', 'nosig')
 
-            except Exception:
-                raise
+    # key -> myuwDate
+    interned = {}
+    # Most recently used strings -> myuwDate
+    parseCache = OrderedDict()
+    parseCacheSize = 4096
 
-            else:
-                newArgs = dateValues + timeValues
-                self.dateObj = datetime.datetime(*newArgs)
+    def __new__(cls, arg):
+        if isinstance(arg, myuwDate):
+            return arg
 
-        # If it's a datetime.date, use it directly
-        elif isinstance(arg, datetime.date):
-            self.dateObj = arg
+        if isinstance(arg, basestring):
+            cache = cls.parseCache
+            date = cache.pop(arg, None)
+            if date is None:
+                date = cls.fromDateObj(parseDateString(arg))
+                if len(cache) >= cls.parseCacheSize:
+                    cache.popitem(last=False)
+            cache[arg] = date
+            return date
 
-        else:
-            raise MyuwDateTypeError(arg)
+        if isinstance(arg, datetime.date):
+            return cls.fromDateObj(arg)
 
-        self.yearSanityCheck()
-        # Date sanity check
+        raise MyuwDateTypeError(arg)
 
-    def yearSanityCheck(self):
-        if self.year < 1900:
+    @classmethod
+    def fromDateObj(cls, dateObj):
+        '''Get the myuwDate for a datetime or date. '''
+        if dateObj.year < 1900:
             raise ValueError(
                 'Got %s for year. Did you mean %s?'
-                % (self.year, self.year + 2000)
+                % (dateObj.year, dateObj.year + 2000)
             )
+        return cls.fromKey(dateKey(dateObj))
+
+    @classmethod
+    def fromKey(cls, key):
+        '''Get the myuwDate for a key. '''
+        date = cls.interned.get(key)
+        if date is None:
+            date = object.__new__(cls)
+            date.key = key
+            date._dateObj = None
+            cls.interned[key] = date
+        return date
+
+    def __reduce__(self):
+        return (dateFromKey, (self.key, ))
+
+    @property
+    def dateObj(self):
+        '''The date as a datetime.datetime. '''
+        if self._dateObj is None:
+            days, seconds = divmod(self.key, daySeconds)
+            self._dateObj = datetime.datetime.fromordinal(days) + \
+                datetime.timedelta(seconds=seconds)
+        return self._dateObj
 
     @property
     def year(self):
@@ -121,58 +165,92 @@ class myuwDate(object):
     @property
     def hasTime(self):
         # Plain dates have 00:00:01 as the time
-        return self.dateObj.timetuple()[3:6] != (0, 0, 1)
+        return self.key % daySeconds != 1
 
     # String representation, suitable for use in override page
     def __str__(self):
+        d = self.dateObj
         if self.hasTime:
-            return self.dateObj.strftime('%Y-%m-%d %H:%M:%S')
+            return '%04d-%02d-%02d %02d:%02d:%02d' % (
+                d.year, d.month, d.day, d.hour, d.minute, d.second)
         else:
-            return self.dateObj.strftime('%Y-%m-%d')
+            return '%04d-%02d-%02d' % (d.year, d.month, d.day)
 
     def getDateOverride(self):
-        return self.dateObj.strftime('%Y-%m-%d %H:%M:%S')
+        d = self.dateObj
+        return '%04d-%02d-%02d %02d:%02d:%02d' % (
+            d.year, d.month, d.day, d.hour, d.minute, d.second)
 
     def __repr__(self):
         return '%s("%s")' % (type(self).__name__, str(self))
 
     def __add__(self, other):
-        '''Construct a new myuwDate by taking out own date, converting
-        'other' to a timedelta, and then adding them together.
-        For example, foo = bar + 3 will result in foo being exactly three
-        days after bar. '''
+        '''Make a new myuwDate by converting 'other' to a timedelta and
+        adding it. For example, foo = bar + 3 will result in foo being
+        exactly three days after bar. '''
+        if isinstance(other, int):
+            return myuwDate.fromKey(self.key + other * daySeconds)
         try:
             other = toTimeDelta(other)
-
         except TypeError:
             return NotImplemented
-
-        newDateObj = self.dateObj + other
-        return myuwDate(newDateObj)
+        return myuwDate.fromKey(
+            self.key + other.days * daySeconds + other.seconds)
 
     def __sub__(self, other):
         '''__add__ but goes back in time rather than forwards. '''
         return self.__add__(-1 * other)
 
+    def __hash__(self):
+        return hash(self.key)
+
+    # Comparisons convert other to a key, if it isn't a myuwDate already,
+    # and compare keys
     def __eq__(self, other):
-        '''Try to convert other to a datetime.date, then compare
-        our dateObj to other. '''
+        if isinstance(other, myuwDate):
+            return self.key == other.key
         try:
-            other = toDate(other)
-        except:
+            return self.key == dateKey(other)
+        except Exception:
             return NotImplemented
 
-        return self.dateObj == other
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not(result)
+
+    def __lt__(self, other):
+        if isinstance(other, myuwDate):
+            return self.key < other.key
+        try:
+            return self.key < dateKey(other)
+        except Exception:
+            return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, myuwDate):
+            return self.key <= other.key
+        try:
+            return self.key <= dateKey(other)
+        except Exception:
+            return NotImplemented
 
-    # Define gt and let @total_ordering take care of the rest
     def __gt__(self, other):
-        '''Same logic as __eq__ but checks if our date occurs after other. '''
+        if isinstance(other, myuwDate):
+            return self.key > other.key
         try:
-            other = toDate(other)
-        except:
+            return self.key > dateKey(other)
+        except Exception:
             return NotImplemented
 
-        return self.dateObj > other
+    def __ge__(self, other):
+        if isinstance(other, myuwDate):
+            return self.key >= other.key
+        try:
+            return self.key >= dateKey(other)
+        except Exception:
+            return NotImplemented
 
     @property
     def hour(self):
@@ -201,6 +279,12 @@ class myuwDate(object):
             return self + 1
 
 
+def dateFromKey(key):
+    '''Get the myuwDate for a key. Used for pickling, since classmethods
+    can't be pickled. '''
+    return myuwDate.fromKey(key)
+
+
 class myuwDateRange(object):
     '''Date range class, consisting of a start date and end date.
     Start and end arguments may be specified in any format that the
@@ -239,8 +323,7 @@ class myuwDateRange(object):
     # So for a card that should appear for only one day, you
     # would specify an identical start and end date
     def __contains__(self, element):
-        element = myuwDate(element)
-        return self.startDate <= element < self.endDate
+        return self.startDate.key <= dateKey(element) < self.endDate.key
 
     def __repr__(self):
         return 'myuwDateRange(%s, %s)' % (self.startDate, self.endDate)
@@ -317,18 +400,18 @@ class cardPair(object):
         expectedHung = isinstance(self.expected, hungCardClass)
 
         if self.nameErr:
-            return self.nameErr
+            return [noteDiff(self.nameErr)]
 
         elif actualError and not expectedError:
-            return 'Actual card had unexpected error'
+            return [noteDiff('Actual card had unexpected error')]
         elif expectedError and not actualError:
-            return 'Expected error card, didn\'t get one'
+            return [noteDiff('Expected error card, didn\'t get one')]
 
         elif actualHung and not expectedHung:
             # Already handled elsewhere
-            return 'Actual card did not finish loading'
+            return [noteDiff('Actual card did not finish loading')]
         elif expectedHung and not actualHung:
-            return 'Expected hung card but didn\'t get one'
+            return [noteDiff('Expected hung card but didn\'t get one')]
 
         return self.expected.findDiffs(self.actual)
 
@@ -364,6 +447,12 @@ class multiDate(dict):
 
 
 # Visibility check classes
+#
+# Each visClass can be compiled into an interval list (see intervals.py)
+# of the dates it is True for, which shouldAppear then checks with a
+# bisect rather than walking the tree of vis objects for every date.
+# visCheck is still the plain definition, and is used for any vis which
+# can't be compiled (compileIntervals returns None).
 
 # Most of them need to be called with arguments, but others are
 # singletons thus need to be used directly
@@ -371,7 +460,8 @@ class visClass(object):
     '''New visClass, intended to replace old vis functions with an actual
     class so that significantDates can be rolled into this.
     This class is not meant to be used directly, you should subclass it.
-    Subclasses should override visCheck and the significantDates property.
+    Subclasses should override visCheck and the significantDates property,
+    and compileIntervals if they can.
     Supports +/-/* operations for quick union/intersect/difference ops.
     '''
     def __call__(self, date):
@@ -379,12 +469,43 @@ class visClass(object):
         return self.shouldAppear(date)
 
     def shouldAppear(self, date):
-        return self.visCheck(date)
+        compiled = self.compiled
+        if compiled is None:
+            return self.visCheck(date)
+        return intervals.contains(compiled, dateKey(date))
+
+    def compileIntervals(self):
+        '''Interval list of the dates this is True for, or None if it
+        can't be worked out. '''
+        return None
+
+    @property
+    def compiled(self):
+        '''Compiled interval list, or None. Worked out on first use. '''
+        try:
+            return self._compiled
+        except AttributeError:
+            self._compiled = self.compileIntervals()
+            return self._compiled
 
     @property
     def significantDates(self):
         return self.sigDates
 
+    def allDays(self):
+        '''Every day this is True for, stepping a day at a time from the
+        start of each interval. '''
+        compiled = self.compiled
+        if compiled is None:
+            raise Exception("Can't list days of %r" % self)
+        out = set()
+        for start, end in compiled:
+            if start == intervals.minKey or end == intervals.maxKey:
+                raise Exception("Can't list days of unbounded %r" % self)
+            for key in xrange(start, end, daySeconds):
+                out.add(myuwDate.fromKey(key))
+        return out
+
     def __add__(self, other):
         return visUnion(self, other)
 
@@ -414,12 +535,18 @@ class visException(visClass):
 class visNever(visClass):
     def visCheck(self, date):
         return False
+
+    def compileIntervals(self):
+        return []
     sigDates = []
 
 
 class visAlways(visClass):
     def visCheck(self, date):
         return True
+
+    def compileIntervals(self):
+        return intervals.everything
     sigDates = []
 
 # Turn these into singletons
@@ -455,14 +582,9 @@ class visRanges(visClass):
                 return True
         return False
 
-    def allDays(self):
-        out = []
-        for dr in self.dateRanges:
-            cur = dr.startDate
-            while cur in dr:
-                out.append(cur)
-                cur = cur + 1
-        return set(out)
+    def compileIntervals(self):
+        return intervals.normalize(
+            [(dr.startDate.key, dr.endDate.key) for dr in self.dateRanges])
 
 
 class visCDM(visRanges):
@@ -497,6 +619,9 @@ class visBefore(visClass):
     def visCheck(self, date):
         return self.endDate > date
 
+    def compileIntervals(self):
+        return [(intervals.minKey, self.endDate.key)]
+
 
 class visAfter(visClass):
     '''Vis class which is True for all dates strictly after the start date'''
@@ -508,15 +633,27 @@ class visAfter(visClass):
     def visCheck(self, date):
         return self.afterDate < date
 
+    def compileIntervals(self):
+        # Keys count seconds, so the first date after is one key later
+        return [(self.afterDate.key + 1, intervals.maxKey)]
+
 
 class visCollection(visClass):
-    '''Superclass for visUnion and visIntersect'''
+    '''Superclass for visUnion, visIntersect and visSub'''
     def __init__(self, *children):
         self.children = children
         self.sigDates = []
         for child in children:
             self.sigDates += child.sigDates
 
+    def childIntervals(self):
+        '''Compiled intervals of each child, or None if any of them can't
+        be compiled. '''
+        compiled = [child.compiled for child in self.children]
+        if None in compiled:
+            return None
+        return compiled
+
 
 class visUnion(visCollection):
     '''Visibility union. Returns True if at least one
@@ -527,8 +664,11 @@ class visUnion(visCollection):
                 return True
         return False
 
-    def allDays(self):
-        return set.union(*[child.allDays() for child in self.children])
+    def compileIntervals(self):
+        compiled = self.childIntervals()
+        if compiled is None:
+            return None
+        return intervals.union(*compiled)
 
 
 class visIntersect(visCollection):
@@ -540,23 +680,30 @@ class visIntersect(visCollection):
                 return False
         return True
 
-    def allDays(self):
-        out = sum([child.allDays() for child in self.children], [])
-        out = [date for date in out if self(date)]
-        out = set(out)
+    def compileIntervals(self):
+        compiled = self.childIntervals()
+        if compiled is None:
+            return None
+        return reduce(intervals.intersect, compiled, intervals.everything)
 
 
-class visSub(visClass):
+class visSub(visCollection):
     '''Visibility difference class that will return true if the date is
     in visA but not visB. '''
     def __init__(self, visA, visB):
+        super(visSub, self).__init__(visA, visB)
         self.visA = visA
         self.visB = visB
-        self.sigDates = visA.sigDates + visB.sigDates
 
     def visCheck(self, date):
         return self.visA(date) and not(self.visB(date))
 
+    def compileIntervals(self):
+        compiled = self.childIntervals()
+        if compiled is None:
+            return None
+        return intervals.difference(*compiled)
+
 
 def visQtr(include=[], exclude=[]):
     '''Function to filter by quarter (qtr switch, not start of instruction).
@@ -578,7 +725,8 @@ def visQtr(include=[], exclude=[]):
 
 
 class visQtrIn(visClass):
-    '''Class for restricting visibility to particular quarters. '''
+    '''Class for restricting visibility to particular quarters. Dates
+    outside of the known quarters are in neither visQtrIn nor visQtrEx. '''
 
     def __init__(self, include):
         self.qtrs = include
@@ -595,6 +743,12 @@ class visQtrIn(visClass):
                 return True
         return False
 
+    def compileIntervals(self):
+        from dates import termIntervals
+        return intervals.normalize(
+            [(start, end) for name, start, end in termIntervals()
+             if any([name.startswith(inc) for inc in self.qtrs])])
+
 
 class visQtrEx(visQtrIn):
     '''Class for restricting visibility to everything but the
@@ -602,6 +756,13 @@ class visQtrEx(visQtrIn):
     def visCheck(self, date):
         return not(super(visQtrEx, self).visCheck(date))
 
+    def compileIntervals(self):
+        from dates import termIntervals
+        known = intervals.normalize(
+            [(start, end) for name, start, end in termIntervals()])
+        return intervals.difference(
+            known, super(visQtrEx, self).compileIntervals())
+
 
 class cardProxy(object):
     '''Proxy for attaching additional show/hide logic to a card, for
@@ -642,6 +803,16 @@ class cardProxy(object):
         else:
             return False
 
+    def visIntervals(self):
+        '''Interval list of the dates shouldAppear is True for, or None. '''
+        ours = self._vis.compiled
+        if ours is None or not hasattr(self.card, 'shouldAppear'):
+            return ours
+        theirs = self.card.visIntervals()
+        if theirs is None:
+            return None
+        return intervals.intersect(ours, theirs)
+
     @property
     def significantDates(self):
         '''Get a list of significant dates for this card, by combining
@@ -772,6 +943,16 @@ class myuwCard(autoDiff):
         # Just return as basic an instance as possible by default
         return cls()
 
+    # Subclasses can also define extractSchema (see myuwtesting.extract)
+    # along with a fromData class method, which builds the card from the
+    # record the extraction script returns for it. This lets every card
+    # on the page be read with one execute_script call.
+    extractSchema = {}
+
+    @classmethod
+    def fromData(cls, data, date):
+        return cls()
+
     # Subclasses can use autoDiffs if they wish to have their diffs done
     # automatically. If they don't want this behavior, they should override
     # findDiffs.
@@ -814,10 +995,28 @@ class myuwCard(autoDiff):
         else:
             return True
 
+    # Interval list (see intervals.py) of the dates shouldAppear is True
+    # for, or None if that can't be worked out without calling it. Cards
+    # which override shouldAppear should override this too if they can.
+    def visIntervals(self):
+        if type(self).shouldAppear.__func__ is not \
+                myuwCard.shouldAppear.__func__:
+            return None
+        return getattr(self, 'visCheck', visAlways).compiled
+
+    # Anything about the card's expected content that depends on the date
+    # it is checked on (e.g. which quarter's grades show). Dates on which
+    # a user has the same expected cards with the same dateState would be
+    # checked the same way. Cards whose content depends on the date should
+    # override this.
+    def dateState(self, date):
+        return None
+
     # Significant dates
     @property
     def significantDates(self):
-        sigDates = self.visCheck.significantDates
+        # Copy, so the vis object's own list doesn't grow on every call
+        sigDates = list(self.visCheck.significantDates)
         sigDates += getattr(self, 'extraSigDates', [])
         return sigDates
 
@@ -854,8 +1053,8 @@ class errorCard(myuwCard):
         self.__name__ = self.name + '_error'
 
     def findDiffs(self, other):
-        '''Returns an empty string because this is done elsewhere. '''
-        return ''
+        '''Returns no diffs because this is done elsewhere. '''
+        return []
 
     visCheck = visAlways
 
@@ -865,6 +1064,12 @@ class errorCard(myuwCard):
         else:
             return super(errorCard, self).shouldAppear(date)
 
+    def visIntervals(self):
+        if self.base:
+            return self.base.visIntervals()
+        else:
+            return visAlways.compiled
+
 
 class gradRequest(autoDiff):
     '''Base class for graduate requests. '''
@@ -917,6 +1122,35 @@ class gradRequest(autoDiff):
         req = cls(reqName, decisions, title=title)
         return req
 
+    extractSchema = {
+        'reqName': fieldText('./h5'),
+        'title': fieldText('.//div' + hasClass('degree-title')),
+        'decisions': fieldList('./ul/li', {
+            'label': fieldText('.//span' + hasClass('card-badge-label')),
+            'value': fieldText('.//span' + hasClass('card-badge-value')),
+        }),
+        # For ones with just a 'Status' decision, the label and value are
+        # directly under the request element.
+        'label': fieldText('.//span' + hasClass('card-badge-label')),
+        'value': fieldText('.//span' + hasClass('card-badge-value')),
+    }
+
+    @classmethod
+    def fromData(cls, data):
+        '''Like fromElement, but uses a record from extractSchema. '''
+        decisionData = data['decisions'] or [data]
+        decisions = {}
+        for decision in decisionData:
+            key = decision['label']
+            value = decision['value']
+
+            key = cls.replacements.get(key, key)
+            value = cls.replacements.get(value, value)
+
+            decisions[key] = value
+
+        return cls(data['reqName'], decisions, title=data['title'])
+
     replacements = {}
 
     autoDiffs = {
@@ -982,6 +1216,16 @@ class link(autoDiff):
 
         return cls(label, url, newTab)
 
+    extractSchema = {
+        'label': fieldText('.'),
+        'url': fieldAttr('.', 'href'),
+        'target': fieldAttr('.', 'target'),
+    }
+
+    @classmethod
+    def fromData(cls, data):
+        return cls(data['label'], data['url'], data['target'] == '_blank')
+
     def __repr__(self):
         return 'link(%s, %s, %s)' % (self.label, self.url, self.newTab)
 
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+
+import time
+
+from .cards import cardDict
+from .perf import tracer
+
+# WebDriver command counting
+#
+# Every WebDriver command, whether it is issued through the driver or
+# through a WebElement, ends up in one call to the driver's execute method
+# with the command's name (findElement, getElementText,
+# getElementAttribute, isElementDisplayed, executeScript, ...).
+# instrumentDriver wraps that method on a driver, so each command is
+# counted and timed without changing any of the code that uses the driver,
+# and WebElements stay real WebElements.
+#
+# Each command is put down to the card and phase it was issued for, taken
+# from the timing spans open at the time (see perf.py): the card is the one
+# named by the innermost card span, if any, and the phase is the category
+# of the innermost other span (override, landing, parse, diff, driver).
+# Counting turns spans on, but they are only kept for a trace if perf or
+# traceFile is also set.
+#
+# Workers send their counts to the parent, which adds them all up and
+# prints which card classes cost the most round trips, and how long each
+# kind of command takes.
+
+# Upper bounds (in milliseconds) of the latency histogram buckets. The last
+# bucket is for anything slower.
+latencyBuckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Span categories which are never phases
+notPhases = ('card', 'sleep')
+
+
+def latencyBucket(seconds):
+    '''Index of the histogram bucket for a command taking seconds. '''
+    ms = seconds * 1000
+    for i, bound in enumerate(latencyBuckets):
+        if ms < bound:
+            return i
+    return len(latencyBuckets)
+
+
+def bucketLabels():
+    '''Labels for the histogram buckets, e.g. '<5ms'. '''
+    return ['<%sms' % bound for bound in latencyBuckets] + \
+        ['>=%sms' % latencyBuckets[-1]]
+
+
+def cardClassName(cardName):
+    '''Name of the card class for a card name, or the name itself if it
+    isn't a known card. '''
+    if cardName in cardDict:
+        return cardDict[cardName].__name__
+    return cardName
+
+
+class commandCounter(object):
+    '''Counts and times of WebDriver commands, by card, phase and
+    command. '''
+
+    def __init__(self, tracer = tracer):
+        self.tracer = tracer
+        # (card name, phase, command) -> [count, seconds, histogram]
+        self.counts = {}
+
+    def context(self):
+        '''(card name, phase) for a command issued right now. card name is
+        None if it isn't for a card. '''
+        card = None
+        phase = None
+        for span in reversed(self.tracer.stack):
+            if span.cat == 'card':
+                if card is None:
+                    card = span.args.get('card')
+            elif phase is None and span.cat not in notPhases:
+                phase = span.cat
+        return card, phase or 'other'
+
+    def add(self, command, seconds):
+        '''Count a command which took seconds. '''
+        card, phase = self.context()
+        histogram = [0] * (len(latencyBuckets) + 1)
+        histogram[latencyBucket(seconds)] = 1
+        self.addCounts(card, phase, command, 1, seconds, histogram)
+
+    def addCounts(self, card, phase, command, count, seconds, histogram):
+        entry = self.counts.get((card, phase, command))
+        if entry is None:
+            entry = self.counts[(card, phase, command)] = [
+                0, 0.0, [0] * (len(latencyBuckets) + 1)]
+        entry[0] += count
+        entry[1] += seconds
+        entry[2] = [a + b for a, b in zip(entry[2], histogram)]
+
+    def drain(self):
+        '''Get the counts so far as a list which can be sent as JSON, and
+        forget them. '''
+        out = [[card, phase, command, count, seconds, histogram]
+               for (card, phase, command), (count, seconds, histogram)
+               in sorted(self.counts.items())]
+        self.counts = {}
+        return out
+
+    def merge(self, data):
+        '''Add in counts from drain, e.g. from a worker. '''
+        for card, phase, command, count, seconds, histogram in data:
+            self.addCounts(card, phase, command, count, seconds, histogram)
+
+    def totals(self, keyFunc):
+        '''Add the counts up by keyFunc(card, phase, command). Gives
+        {key: [count, seconds, {command: count}]}. '''
+        out = {}
+        for (card, phase, command), (count, seconds, histogram) \
+                in self.counts.items():
+            total = out.setdefault(keyFunc(card, phase, command),
+                                   [0, 0.0, {}])
+            total[0] += count
+            total[1] += seconds
+            total[2][command] = total[2].get(command, 0) + count
+        return out
+
+    def hotspotReport(self, limit = 20):
+        '''Table of the card classes (and other page work) which cost the
+        most round trips, most time first. '''
+        totals = self.totals(lambda card, phase, command:
+                             cardClassName(card) if card is not None
+                             else '(page, %s)' % phase)
+        lines = ['WebDriver commands by card class:',
+                 '  %-32s %8s %10s %8s  %s' % ('', 'commands', 'total', 'mean',
+                                                'most used')]
+        rows = sorted(totals.items(), key = lambda item: -item[1][1])
+        for name, (count, seconds, commands) in rows[:limit]:
+            mostUsed = sorted(commands.items(), key = lambda item: -item[1])
+            lines.append('  %-32s %8s %9.3fs %6.1fms  %s' % (
+                name, count, seconds, seconds * 1000 / count,
+                ', '.join(['%s x%s' % item for item in mostUsed[:3]])))
+        if len(rows) > limit:
+            lines.append('  (%s more)' % (len(rows) - limit))
+        if not rows:
+            lines.append('  No commands counted')
+        return '\n'.join(lines)
+
+    def phaseReport(self):
+        '''Commands and time in each phase, cards included. '''
+        totals = self.totals(lambda card, phase, command: phase)
+        lines = ['WebDriver commands by phase:']
+        for phase, (count, seconds, commands) in sorted(
+                totals.items(), key = lambda item: -item[1][1]):
+            lines.append('  %-12s %8s commands %9.3fs' % (phase, count,
+                                                         seconds))
+        return '\n'.join(lines)
+
+    def histogramReport(self):
+        '''Latency histogram of each kind of command. '''
+        histograms = {}
+        for (card, phase, command), (count, seconds, histogram) \
+                in self.counts.items():
+            total = histograms.get(command, [0] * len(histogram))
+            histograms[command] = [a + b for a, b in zip(total, histogram)]
+        labels = bucketLabels()
+        lines = ['WebDriver command latency:',
+                 '  %-28s' % '' + ''.join(['%9s' % label
+                                           for label in labels])]
+        for command, histogram in sorted(histograms.items(),
+                                         key = lambda item: -sum(item[1])):
+            lines.append('  %-28s' % command +
+                         ''.join(['%9s' % n for n in histogram]))
+        return '\n'.join(lines)
+
+    def report(self):
+        return '\n'.join([self.hotspotReport(), self.phaseReport(),
+                          self.histogramReport()])
+
+
+# The counter for this process
+counter = commandCounter()
+
+
+def instrumentDriver(driver, counter = counter):
+    '''Count and time every command driver runs, including those run by
+    its WebElements. Returns the driver. '''
+    execute = driver.execute
+
+    def countedExecute(command, params = None):
+        start = time.time()
+        try:
+            return execute(command, params)
+        finally:
+            counter.add(command, time.time() - start)
+
+    driver.execute = countedExecute
+    return driver
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+import json
+import time
+
+from .functions import hostLoad, hostMemoryUsed
+from .history import median
+from .testconfig import concurrencyMaxHostLoad
+
+# Adaptive concurrency for queue mode
+#
+# Too many workers slow down every page load (and cause cards to be
+# reported as hung when they were only slow), while too few leave the
+# server and host idle. Every interval, the controller looks at the pages
+# finished since the last update and at the host, and adjusts how many
+# workers the dispatcher lets work at once: one more if everything looks
+# fine (additive increase), or cut by a factor if anything looks congested
+# (multiplicative decrease).
+
+
+class concurrencyController(object):
+    '''AIMD controller for the number of workers allowed to work at once.
+
+    The system counts as congested if the median landing page load time
+    since the last update is more than slowdown times the best median seen
+    so far, more than maxHungRate of pages had hung cards, the load average
+    per CPU is over maxHostLoad, or more than maxMemory percent of memory is
+    in use. Checks that can't be made (e.g. without psutil) are skipped. '''
+
+    def __init__(self, start, maximum, slowdown=1.5, maxHungRate=0.05,
+                 maxHostLoad=concurrencyMaxHostLoad, maxMemory=90,
+                 decrease=0.7):
+        self.limit = max(1, min(start, maximum))
+        self.maximum = maximum
+        self.slowdown = slowdown
+        self.maxHungRate = maxHungRate
+        self.maxHostLoad = maxHostLoad
+        self.maxMemory = maxMemory
+        self.decrease = decrease
+        # Best (lowest) median load time seen, as a baseline
+        self.baseline = None
+        self.loadTimes = []
+        self.hung = 0
+        self.startTime = time.time()
+        self.lastUpdate = self.startTime
+        # One dictionary per update
+        self.timeline = []
+
+    def addPage(self, loadTime, hung):
+        '''Record a finished page, and whether any of its cards hung. '''
+        self.loadTimes.append(loadTime)
+        if hung:
+            self.hung += 1
+
+    def congestion(self, loadMedian, hungRate, load, memory):
+        '''Get the reason the system looks congested, or None if it
+        doesn't. '''
+        if loadMedian is not None and self.baseline is not None and \
+                loadMedian > self.baseline * self.slowdown:
+            return 'slow pages'
+        if hungRate is not None and hungRate > self.maxHungRate:
+            return 'hung cards'
+        if load is not None and load > self.maxHostLoad:
+            return 'host load'
+        if memory is not None and memory > self.maxMemory:
+            return 'host memory'
+        return None
+
+    def update(self):
+        '''Adjust the limit based on what has happened since the last update.
+        Returns the new limit. '''
+        now = time.time()
+        pages = len(self.loadTimes)
+        loadMedian = median(self.loadTimes) if pages else None
+        hungRate = float(self.hung) / pages if pages else None
+        load = hostLoad()
+        memory = hostMemoryUsed()
+
+        reason = self.congestion(loadMedian, hungRate, load, memory)
+        if loadMedian is not None and \
+                (self.baseline is None or loadMedian < self.baseline):
+            self.baseline = loadMedian
+
+        self.timeline.append({
+            'time': round(now - self.startTime, 1),
+            'limit': self.limit,
+            'pages': pages,
+            'pagesPerMinute': round(pages * 60.0 / (now - self.lastUpdate), 2),
+            'loadMedian': loadMedian,
+            'hungRate': hungRate,
+            'hostLoad': load,
+            'memory': memory,
+            'congestion': reason,
+        })
+
+        if reason:
+            self.limit = max(1, int(self.limit * self.decrease))
+        elif pages:
+            # Only grow once the current limit has been tried
+            self.limit = min(self.maximum, self.limit + 1)
+
+        self.loadTimes = []
+        self.hung = 0
+        self.lastUpdate = now
+        return self.limit
+
+    def writeTimeline(self, path):
+        '''Write the timeline to path, one JSON object per update. '''
+        with open(path, 'w') as f:
+            for entry in self.timeline:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def report(self):
+        '''Summarize throughput at each worker limit, to show where adding
+        workers stops helping. '''
+        byLimit = {}
+        for entry in self.timeline:
+            byLimit.setdefault(entry['limit'], []).append(
+                entry['pagesPerMinute'])
+        lines = ['Workers  Pages/minute  Intervals']
+        for limit, rates in sorted(byLimit.items()):
+            lines.append('%7s  %12.1f  %9s' % (
+                limit, sum(rates) / len(rates), len(rates)))
+        return '\n'.join(lines)
@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
+from bisect import bisect_right
 from datetime import timedelta
 
 from .classes import myuwDate, multiDate
+from . import intervals
 
 # These are in (roughly) chronological order
 
@@ -143,52 +145,111 @@ SummerRegHide = multiDate(SummerRegCardHideDates)
 SummerRegSwitch = RegPd1 + 7
 
 
+# Quarter names go WI, SP, SU, AU within a year
+qtrOrder = ['WI', 'SP', 'SU', 'AU']
+
+
+def previousQtr(qtr):
+    '''Name of the quarter before qtr, e.g. 'AU12' for 'WI13'. '''
+    i = qtrOrder.index(qtr[0:2])
+    if i == 0:
+        return 'AU%02d' % ((int(qtr[2:4]) - 1) % 100)
+    return qtrOrder[i - 1] + qtr[2:4]
+
+
+class academicCalendar(object):
+    '''Index of quarters and summer terms by date, built from the first and
+    last day of every quarter with both, so it covers however many years
+    those have.
+
+    Quarters are kept as sorted lists of start keys, end keys (exclusive)
+    and names, so finding the quarter for a date is a bisect, and each
+    date's quarter and term are cached. Dates before the first quarter are
+    in the quarter before it. '''
+
+    def __init__(self, firstDays, lastDays, bTermStarts):
+        qtrs = sorted([(start.key, (lastDays[qtr] + 1).key, qtr)
+                       for qtr, start in firstDays.items()
+                       if qtr in lastDays])
+        if qtrs:
+            qtrs.insert(0, (intervals.minKey, qtrs[0][0],
+                            previousQtr(qtrs[0][2])))
+        self.starts = [start for start, end, qtr in qtrs]
+        self.ends = [end for start, end, qtr in qtrs]
+        self.names = [qtr for start, end, qtr in qtrs]
+        self.bTermStarts = dict([(qtr, date.key)
+                                 for qtr, date in bTermStarts.items()])
+        # key -> (quarter, term)
+        self.cache = {}
+
+    def lookup(self, date):
+        '''Get (quarter, term) for a date. '''
+        key = myuwDate(date).key
+        found = self.cache.get(key)
+        if found is None:
+            i = bisect_right(self.starts, key) - 1
+            if i < 0 or key >= self.ends[i]:
+                raise Exception("Couldn't find quarter for date %s" % date)
+            qtr = self.names[i]
+            term = qtr
+            if qtr[0:2] == 'SU' and qtr in self.bTermStarts:
+                if key >= self.bTermStarts[qtr]:
+                    term = 'SB' + qtr[2:4]
+                else:
+                    term = 'SA' + qtr[2:4]
+            found = self.cache[key] = (qtr, term)
+        return found
+
+    def dateToQtr(self, date):
+        return self.lookup(date)[0]
+
+    def dateToTerm(self, date):
+        return self.lookup(date)[1]
+
+    def getPastTerm(self, date):
+        date = myuwDate(date)
+        if 'SU' not in self.dateToQtr(date):
+            return self.dateToQtr(date - 40)
+        else:
+            return self.dateToTerm(date - 10)
+
+    def termIntervals(self):
+        '''Every quarter and summer term as (name, startKey, endKey). '''
+        out = []
+        for start, end, qtr in zip(self.starts, self.ends, self.names):
+            out.append((qtr, start, end))
+            if qtr[0:2] == 'SU' and qtr in self.bTermStarts:
+                bStart = self.bTermStarts[qtr]
+                out.append(('SA' + qtr[2:4], start, bStart))
+                out.append(('SB' + qtr[2:4], bStart, end))
+        return out
+
+
+calendar = academicCalendar(FirstDayQtr, LastDayQtr, SummerBTermBegins)
+
+
 def dateToQtr(date):
     '''Try to convert a date to quarter in the form of 'SP13'. '''
-    date = myuwDate(date)
-    # Hack, TODO fix this
-    if date < myuwDate('2013-01-01'):
-        return 'AU12'
-    for qtr, start in FirstDayQtr.items():
-        try:
-            end = LastDayQtr[qtr]
-            if start <= date < end + 1:
-                return qtr
-        except:
-            continue
-    raise Exception("Couldn't find quarter for date %s" % date)
+    return calendar.dateToQtr(date)
 
 
 def dateToTerm(date):
     '''Like dateToQtr, but differentiates between the two
     summer terms. Will return 'SA13' or 'SB13' for summer
     A/B in 2013. '''
-    date = myuwDate(date)
-    qtr = dateToQtr(date)
-    qtrPart = qtr[0:2]
-    year = qtr[2:4]
-
-    if qtr[0:2] == 'SU':
-        bStart = SummerBTermBegins[qtr]
-        if date >= bStart:
-            termPart = 'SB'
-        else:
-            termPart = 'SA'
-        return termPart + year
+    return calendar.dateToTerm(date)
 
-    else:
-        return qtr
+
+def termIntervals():
+    '''Every quarter and summer term as (name, startKey, endKey), covering
+    the same dates dateToQtr and dateToTerm give that name for. Used to
+    compile visQtr. '''
+    return calendar.termIntervals()
 
 
 def getPastTerm(date):
     '''Get the term that you're either in or just finished'''
-    date = myuwDate(date)
-    qtr = dateToQtr(date)
-    if 'SU' not in qtr:
-        qtr = dateToQtr(date - 40)
-    else:
-        qtr = dateToTerm(date - 10)
-    return qtr
+    return calendar.getPastTerm(date)
 
 
 def getAllMultiDates():
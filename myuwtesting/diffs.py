@@ -0,0 +1,251 @@
+#!/usr/bin/python
+
+import json
+from xml.etree import ElementTree
+
+# Diff records
+#
+# Every difference found while testing a pair is a diffRecord rather than a
+# line of text. Card findDiffs methods return lists of them (an empty list
+# meaning no differences), expected.findDiffs fills in which card each one
+# is for, and the test case fills in the user and date when it logs them.
+# Nothing is turned into text until a report is written, and the expected
+# and actual values are kept as they are until then.
+#
+# Kinds of record:
+#     field: a field of a card differs. Has field (its label), expected and
+#            actual.
+#     note: something else about a card's content is wrong. Has text.
+#     unexpected, missing, unexpectedError: card was found but not
+#            expected, was expected but not found, or was found with an
+#            error but not expected at all.
+#     error: something went wrong while testing the pair, e.g. a
+#            traceback. Has text, and card if it happened comparing a card.
+#
+# Workers send records to the parent with toData/fromData. Values are
+# formatted on the way, since the parent only ever needs their text.
+
+# Kinds which are about the content of one card, and are reported under it
+contentKinds = ('field', 'note', 'error')
+
+# Headers for kinds which are reported as one list of card names
+cardListHeaders = {
+    'unexpected': 'Found the following unexpected cards: %s',
+    'missing': "Didn't find the following expected cards: %s",
+    'unexpectedError': 'Unexpected cards showed with errors: %s',
+}
+
+
+def valueText(value):
+    '''Format a value for a report, escaping unicode. '''
+    if isinstance(value, unicode):
+        value = value.encode('unicode-escape')
+    return '%s' % (value, )
+
+
+class diffRecord(object):
+    '''One difference found while testing a pair. '''
+
+    __slots__ = ('kind', 'card', 'field', 'expected', 'actual', 'text',
+                 'user', 'date')
+
+    def __init__(self, kind, card=None, field=None, expected=None,
+                 actual=None, text=None, user=None, date=None):
+        self.kind = kind
+        self.card = card
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        self.text = text
+        self.user = user
+        self.date = date
+
+    def __repr__(self):
+        return 'diffRecord(%s, %s, %r)' % (self.kind, self.card,
+                                           self.message())
+
+    def message(self):
+        '''The record's own text, without the card it is for. '''
+        if self.kind == 'field':
+            return 'Different %s (%s vs %s)' % (
+                self.field, valueText(self.expected), valueText(self.actual))
+        if self.kind in cardListHeaders:
+            return cardListHeaders[self.kind] % self.card
+        return self.text
+
+    def canonical(self):
+        '''Everything about the record but its user and date, as a tuple
+        which is the same for the same difference on any date. '''
+        if self.kind == 'field':
+            return (self.kind, self.card, self.field,
+                    valueText(self.expected), valueText(self.actual))
+        return (self.kind, self.card, self.text)
+
+    def toData(self):
+        '''Turn the record into a dictionary which can be sent as JSON. '''
+        data = {'kind': self.kind}
+        for attr in ('card', 'field', 'text', 'user'):
+            value = getattr(self, attr)
+            if value is not None:
+                data[attr] = value
+        if self.date is not None:
+            data['date'] = str(self.date)
+        if self.kind == 'field':
+            data['expected'] = valueText(self.expected)
+            data['actual'] = valueText(self.actual)
+        return data
+
+    @classmethod
+    def fromData(cls, data):
+        '''Turn a dictionary from toData back into a record. '''
+        record = cls(data['kind'])
+        for attr in cls.__slots__:
+            if attr in data and attr != 'kind':
+                setattr(record, attr, data[attr])
+        if record.kind == 'field':
+            # Values came through JSON as unicode. Put them back the way
+            # valueText made them, so they aren't escaped twice.
+            record.expected = record.expected.encode('utf-8')
+            record.actual = record.actual.encode('utf-8')
+        return record
+
+
+def fieldDiff(label, expected, actual):
+    '''Record for a field which differs. '''
+    return diffRecord('field', field=label, expected=expected, actual=actual)
+
+
+def noteDiff(text):
+    '''Record for a problem with a card's content which isn't a simple
+    field difference. '''
+    return diffRecord('note', text=text)
+
+
+def errorDiff(text, card=None):
+    '''Record for an error while testing a pair. '''
+    return diffRecord('error', card=card, text=text)
+
+
+def formatRecords(records):
+    '''Format a pair's records as a list of lines. Consecutive records
+    listing cards of the same kind share a line, and records about a card's
+    content go indented under a line naming the card. '''
+    lines = []
+    i = 0
+    while i < len(records):
+        record = records[i]
+        j = i + 1
+        if record.kind in cardListHeaders:
+            while j < len(records) and records[j].kind == record.kind:
+                j += 1
+            names = ', '.join([str(r.card) for r in records[i:j]])
+            lines.append(cardListHeaders[record.kind] % names)
+        elif record.kind in contentKinds and record.card is not None:
+            while (j < len(records) and records[j].card == record.card and
+                   records[j].kind in contentKinds):
+                j += 1
+            lines.append('Found differences in card %s:' % record.card)
+            for r in records[i:j]:
+                lines.extend(['\t' + line
+                              for line in r.message().splitlines()])
+        else:
+            lines.extend([line for line in record.message().splitlines()
+                          if line])
+        i = j
+    return lines
+
+
+def diffRuns(dates, testedDates=None):
+    '''Group a user's records ({date: [records]}) by the runs of
+    consecutive tested dates they appear on. A date in testedDates (every
+    date tested for the user, by default just those in dates) without a
+    record breaks its run. Returns a list of (first date, last date, number
+    of dates, records) in date order, with the dates as given in dates. '''
+    # Imported here since classes imports this module indirectly
+    from .classes import myuwDate
+    if testedDates is None:
+        testedDates = dates.keys()
+    order = sorted(set([myuwDate(date)
+                        for date in list(testedDates) + dates.keys()]))
+    position = dict([(date, i) for i, date in enumerate(order)])
+
+    # canonical key -> [position, date, index in date's records, record]
+    # for each date it appears on
+    seen = {}
+    for date, records in dates.items():
+        pos = position[myuwDate(date)]
+        for i, record in enumerate(records):
+            seen.setdefault(record.canonical(), []).append(
+                (pos, date, i, record))
+
+    # (first position, last position) -> [first date, last date, count,
+    # [(position, index, record)]]
+    runs = {}
+    for key, found in seen.items():
+        found.sort()
+        start = 0
+        for j in range(1, len(found) + 1):
+            if j < len(found) and found[j][0] <= found[j - 1][0] + 1:
+                continue
+            first = found[start]
+            last = found[j - 1]
+            run = runs.setdefault((first[0], last[0]),
+                                  [first[1], last[1], last[0] - first[0] + 1,
+                                   []])
+            run[3].append((first[0], first[2], first[3]))
+            start = j
+
+    out = []
+    for span, (first, last, count, records) in sorted(runs.items()):
+        records.sort(key=lambda item: item[:2])
+        out.append((first, last, count, [record for p, i, record in records]))
+    return out
+
+
+def pairDiffs(diffs):
+    '''Every record in a diff dictionary ({user: {date: [records]}}), in
+    user and date order. '''
+    # Imported here since classes imports this module indirectly
+    from .classes import myuwDate
+    records = []
+    for user, dates in sorted(diffs.items()):
+        for date in sorted(dates.keys(), key=myuwDate):
+            records.extend(dates[date])
+    return records
+
+
+def writeJson(stream, diffs):
+    '''Write every record in a diff dictionary as a JSON list. '''
+    json.dump([record.toData() for record in pairDiffs(diffs)], stream,
+              indent=1)
+
+
+def writeJUnit(stream, pairs, diffs, timings=None, suiteName='myuw'):
+    '''Write a JUnit XML report with a test case for each (user, date) pair
+    in pairs, which fails if it has records in diffs. timings, if given, is
+    {user: {date: {phase: seconds}}}. '''
+    timings = timings or {}
+    byPair = {}
+    for user, dates in diffs.items():
+        for date, records in dates.items():
+            byPair[(user, str(date))] = records
+    suite = ElementTree.Element('testsuite', name=suiteName)
+    failures = 0
+    for user, date in pairs:
+        date = str(date)
+        records = byPair.get((user, date), [])
+        seconds = sum(timings.get(user, {}).get(date, {}).values())
+        case = ElementTree.SubElement(suite, 'testcase', classname=user,
+                                      name=date, time='%.3f' % seconds)
+        if records:
+            failures += 1
+            failure = ElementTree.SubElement(
+                case, 'failure',
+                message='%s differences' % len(records))
+            text = '\n'.join(formatRecords(records))
+            if isinstance(text, str):
+                text = text.decode('utf-8', 'replace')
+            failure.text = text
+    suite.set('tests', str(len(pairs)))
+    suite.set('failures', str(failures))
+    ElementTree.ElementTree(suite).write(stream, encoding='utf-8')
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+
+import threading
+from multiprocessing.managers import BaseManager
+
+from .classes import myuwDate
+
+# Work queue for parallel runs
+#
+# Instead of giving each worker a fixed chunk of pairs up front, the parent
+# serves a pairDispatcher and workers keep taking small batches from it until
+# it runs dry, so no worker sits idle while another has a long list left.
+#
+# Batches are user-affine: a worker keeps getting dates for the user it is
+# already on (so it only needs date overrides), and only moves on to another
+# user once that user is done. When it does move on, it takes the user with
+# the most work left. If another worker is already on that user, it takes
+# dates from the end of that user's list, leaving the start to the worker
+# that already has it.
+#
+# When workers are forked from the parent, the dispatcher is served from a
+# process of its own rather than a thread of the parent's, since forking a
+# process with threads is unsafe.
+#
+# The dispatcher can also limit how many workers work at once (see
+# concurrency.py). A worker that asks for a batch while the limit is taken
+# up by others is told to wait, and its browser sits idle until it asks
+# again.
+
+# Environment variable the parent passes the dispatcher's auth key in
+dispatchKeyVar = 'MYUW_DISPATCH_AUTHKEY'
+
+
+class pairDispatcher(object):
+    '''Hands out (user, date) pairs to workers in user-affine batches. Dates
+    are handed out as strings, in the same format as --single takes. '''
+
+    def __init__(self, pairs, batchSize, workers, pairCost=None):
+        '''pairs: list of (user, date) pairs to test.
+        batchSize: largest number of pairs to hand out at once.
+        workers: number of workers that will be taking pairs. Batches get
+        smaller once there isn't enough left to go around.
+        pairCost: optional function of (user, date) estimating how long
+        that pair will take, used to pick which user to move on to. '''
+        self.lock = threading.Lock()
+        self.batchSize = batchSize
+        self.workers = workers
+        self.remaining = {}
+        for user, date in pairs:
+            dates = self.remaining.setdefault(user, [])
+            date = str(date)
+            if date not in dates:
+                dates.append(date)
+        # Estimated time for each pair, by user then date
+        self.costs = {}
+        for user, dates in self.remaining.items():
+            dates.sort(key=myuwDate)
+            self.costs[user] = dict([
+                (date, pairCost(user, date) if pairCost else 1)
+                for date in dates])
+        # Worker ID -> user it is currently on
+        self.owners = {}
+        # Worker ID -> every pair handed to it
+        self.handedOut = {}
+        # Workers which have a batch they haven't finished yet
+        self.active = set()
+        self.limit = workers
+        self.batches = 0
+        self.stolen = 0
+
+    def pairsLeft(self):
+        '''Number of pairs that have not been handed out yet. '''
+        return sum([len(dates) for dates in self.remaining.values()])
+
+    def workLeft(self, user):
+        '''Estimated time for the dates left for user. '''
+        costs = self.costs[user]
+        return sum([costs[date] for date in self.remaining[user]])
+
+    def nextSize(self):
+        '''Size of the next batch. '''
+        share = self.pairsLeft() // self.workers
+        return max(1, min(self.batchSize, share))
+
+    def setLimit(self, limit):
+        '''Set how many workers may have a batch at once. '''
+        with self.lock:
+            self.limit = max(1, limit)
+
+    def take(self, workerId, currentUser):
+        '''Get the next batch for a worker, which is currently overridden to
+        currentUser. Asking for a batch means the worker has finished its
+        last one. Returns a list of (user, date) pairs, which will be empty
+        once everything has been handed out, or None if the worker should
+        wait and ask again. '''
+        with self.lock:
+            self.active.discard(workerId)
+            if not self.pairsLeft():
+                return []
+            if len(self.active) >= self.limit:
+                return None
+            size = self.nextSize()
+            user = currentUser
+            if not self.remaining.get(user):
+                self.owners.pop(workerId, None)
+                users = [u for u, dates in self.remaining.items() if dates]
+                if not users:
+                    return []
+                # Biggest user first, preferring one nobody is working on
+                busy = set(self.owners.values())
+                user = max(users, key=lambda u: (u not in busy,
+                                                 self.workLeft(u), u))
+
+            dates = self.remaining[user]
+            if user in self.owners.values() and \
+                    self.owners.get(workerId) != user:
+                # Steal from the end of someone else's user
+                batch = dates[-size:]
+                del dates[-size:]
+                self.stolen += len(batch)
+            else:
+                batch = dates[:size]
+                del dates[:size]
+                self.owners[workerId] = user
+
+            self.batches += 1
+            self.active.add(workerId)
+            batch = [(user, date) for date in batch]
+            self.handedOut.setdefault(workerId, []).extend(batch)
+            return batch
+
+    def requeue(self, workerId, finished):
+        '''Put back the pairs handed to a worker which died before
+        finishing them. finished is the set of (user, date) pairs it did
+        report. Returns the pairs put back. '''
+        with self.lock:
+            self.owners.pop(workerId, None)
+            self.active.discard(workerId)
+            missing = [pair for pair in self.handedOut.pop(workerId, [])
+                       if pair not in finished]
+            for user, date in missing:
+                self.remaining[user].append(date)
+            for dates in self.remaining.values():
+                dates.sort(key=myuwDate)
+            return missing
+
+    def drain(self):
+        '''Take every pair that was never handed out. '''
+        with self.lock:
+            left = []
+            for user, dates in sorted(self.remaining.items()):
+                left.extend([(user, date) for date in dates])
+                del dates[:]
+            return left
+
+    def report(self):
+        '''Describe how the pairs were handed out. '''
+        with self.lock:
+            return ('Dispatched pairs in %s batches, with %s pairs taken '
+                    'from another worker\'s user'
+                    % (self.batches, self.stolen))
+
+
+class dispatchManager(BaseManager):
+    '''Manager for connecting to the parent's pairDispatcher. '''
+
+dispatchManager.register('getDispatcher')
+
+
+def serveDispatcher(dispatcher, authkey, host='127.0.0.1', ownProcess=False):
+    '''Serve dispatcher to workers. Returns the (host, port) address workers
+    should connect to, and the dispatcher to use from then on.
+
+    By default it is served from a background thread of this process, and
+    the dispatcher to use is the one given. With ownProcess, it is served
+    from a child process instead and a proxy for it is returned, so that
+    this process keeps a single thread and can fork workers safely (a
+    forked child would otherwise get the server's listening socket and any
+    locks its threads held). ownProcess needs fork, since the child takes
+    dispatcher with it. '''
+    class serverManager(dispatchManager):
+        pass
+    serverManager.register('getDispatcher', callable=lambda: dispatcher)
+
+    manager = serverManager(address=(host, 0), authkey=authkey)
+    if ownProcess:
+        manager.start()
+        # The proxy keeps the manager, and so its process, alive
+        return manager.address, manager.getDispatcher()
+
+    server = manager.get_server()
+    thread = threading.Thread(target=server.serve_forever)
+    # Don't keep the test run alive once it's done
+    thread.daemon = True
+    thread.start()
+    return server.address, dispatcher
+
+
+def connectDispatcher(address, authkey):
+    '''Get a proxy for the dispatcher served at address, given as a
+    (host, port) tuple. '''
+    manager = dispatchManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.getDispatcher()
+
+
+def parseAddress(address):
+    '''Parse a host:port string into a (host, port) tuple. '''
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
@@ -15,12 +15,31 @@ class MyuwDateTypeError(TypeError):
 
 class LandingWaitTimedOut(Exception):
     def __init__(self, els):
+        '''els can be card elements or card names. '''
         cardNames = []
         for el in els:
-            cardName = getCardName(el)
+            if isinstance(el, basestring):
+                cardName = el
+            else:
+                cardName = getCardName(el)
             cardNames.append(cardName)
         self.cardsNotLoaded = cardNames
         super(LandingWaitTimedOut, self).__init__(
             'Waited too long for landing page to finish loading. The '
             'following cards did not load: %s' % (', '.join(cardNames))
         )
+
+
+class OverrideTimedOut(Exception):
+    def __init__(self, kind, value, timeout):
+        self.kind = kind
+        self.value = value
+        super(OverrideTimedOut, self).__init__(
+            'Waited more than %s seconds for %s override to %s to finish'
+            % (timeout, kind, value)
+        )
+
+
+class OverrideFailed(Exception):
+    '''Raised when an HTTP override could not be done, meaning we should
+    fall back to using the override form. '''
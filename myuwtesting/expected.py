@@ -1,11 +1,15 @@
 #!/usr/bin/python
 
+import sys
+import traceback
+
 from classes import myuwDate, myuwDateRange, cardPair, \
     cardAlways, cardNever, cardCDM, cardCD, errorCard, \
     cardProxy
 from cards import *
 from dates import *
 from thrive import ThriveCardExpected
+from diffs import diffRecord, errorDiff
 
 
 # Assemble actual lists of users and their expected cards
@@ -570,63 +574,96 @@ def getExpectedResults(user, date):
     return userCardsVisible
 
 
-def getSigDates(user, start=None, end=None, extras=False):
-    '''Get significant dates to test for the given user. Optionally filters
-    dates to only those between 'start' and 'end'. If 'extras' is true, then
-    it will include generic events in myuwDates. '''
-    # Expected cards for the given user
-    userCards = cardList[user]
-    # Convert start/end to myuwDate
-    if start:
-        start = myuwDate(start)
-    if end:
-        end = myuwDate(end)
-    sigDates = []
-
-    # Internal function to ensure date is in range
-    def checkDate(date):
-        if start and date < start:
+# Significant dates of each card, by id, worked out once per process since
+# cards (e.g. gmail) and their vis objects are shared between users. The
+# card is kept along with its dates so its id can't be reused.
+cardSigDates = {}
+
+
+def cardSignificantDates(card):
+    '''Get a card's significant dates as myuwDates, working them out only
+    the first time. '''
+    entry = cardSigDates.get(id(card))
+    if entry is None:
+        dates = [myuwDate(date)
+                 for date in getattr(card, 'significantDates', [])]
+        entry = (card, dates)
+        cardSigDates[id(card)] = entry
+    return entry[1]
+
+
+# Results of getAllSigDates, by arguments
+allSigDates = {}
+
+
+def getAllSigDates(start=None, end=None, extras=False, users=None):
+    '''Get significant dates to test for every user in one pass (or just
+    the users given). Optionally filters dates to only those between
+    'start' and 'end'. If 'extras' is true, then it will include generic
+    events in myuwDates. Returns a dictionary of user -> sorted list of
+    dates. Results are cached for the process, so copy a list before
+    changing it. '''
+    if users is None:
+        users = cardList.keys()
+    # Compare keys directly
+    startKey = myuwDate(start).key if start else None
+    endKey = myuwDate(end).key if end else None
+    key = (tuple(sorted(users)), startKey, endKey, bool(extras))
+    if key in allSigDates:
+        return allSigDates[key]
+
+    def inRange(date):
+        if startKey is not None and date.key < startKey:
             return False
-        if end and date > end:
+        if endKey is not None and date.key > endKey:
             return False
         return True
 
-    # Internal function to do duplicate checking then
-    # add to list
-    def addSigDate(date):
-        if sigDate not in sigDates:
-            sigDates.append(date)
-
-    def checkAndAdd(date):
-        if checkDate(date):
-            addSigDate(date)
-    # Go through each card collection (set of each
-    # different version a card might be in depending on
-    # date, as an alternative to natively supporting
-    # that in the card).
-    for cardColl in userCards.values():
-        # Go through each version of the card
-        for card in cardColl:
-            # Check each sigdate for each card and see if
-            # it falls within the desired range
-            if hasattr(card, 'significantDates'):
-                for sigDate in card.significantDates:
-                    checkAndAdd(sigDate)
-
+    extraDates = []
     if extras:
-        for sigDate in getAllDates():
-            if not(getattr(sigDate, 'nosig', False)):
-                checkAndAdd(sigDate)
-    outList = sigDates
+        extraDates = [date for date in getAllDates()
+                      if not(getattr(date, 'nosig', False)) and
+                      inRange(date)]
+
+    # Each card's dates in range, for cards shared between users
+    cardDatesInRange = {}
+    out = {}
+    for user in users:
+        # Key -> myuwDate, to drop duplicates
+        sigDates = {}
+        # Go through each card collection (set of each
+        # different version a card might be in depending on
+        # date, as an alternative to natively supporting
+        # that in the card).
+        for cardColl in cardList[user].values():
+            for card in cardColl:
+                if id(card) not in cardDatesInRange:
+                    cardDatesInRange[id(card)] = [
+                        date for date in cardSignificantDates(card)
+                        if inRange(date)]
+                for date in cardDatesInRange[id(card)]:
+                    sigDates.setdefault(date.key, date)
+
+        for date in extraDates:
+            sigDates.setdefault(date.key, date)
+
+        out[user] = [sigDates[sigKey] for sigKey in sorted(sigDates)]
+
+    allSigDates[key] = out
+    return out
+
 
-    outList.sort()
-    return outList
+def getSigDates(user, start=None, end=None, extras=False):
+    '''Get significant dates to test for the given user. Optionally filters
+    dates to only those between 'start' and 'end'. If 'extras' is true, then
+    it will include generic events in myuwDates. '''
+    return list(getAllSigDates(start, end, extras, [user])[user])
 
 
 def findDiffs(expected, actual):
     '''Given dictionaries of expected and actual cards (of the form
     {name: card}), find differences between which cards were found as well
-    as content of the cards. '''
+    as content of the cards. Returns a list of diffRecords. '''
 
     # Populate a dictionary of name: cardPair objects, where the cardPair
     # holds the expected and actual version of the card
@@ -642,7 +679,7 @@ def findDiffs(expected, actual):
             del onlyInExpected[cardName]
 
     # Calculate actual differences
-    diffs = ''
+    diffs = []
 
     # TODO: do the same thing for expected
     temp = {}
@@ -655,17 +692,14 @@ def findDiffs(expected, actual):
     onlyInActual = temp
 
     # Report cards which were found but not expected
-    if onlyInActual:
-        fmtdList = ', '.join([str(c.name) for c in onlyInActual.values()])
-        diffs += 'Found the following unexpected cards: %s\n' %fmtdList
+    for card in onlyInActual.values():
+        diffs.append(diffRecord('unexpected', card=str(card.name)))
     # Report cards which were expected but not found
-    if onlyInExpected:
-        fmtdList = ', '.join(onlyInExpected.keys())
-        diffs += 'Didn\'t find the following expected cards: %s\n' %fmtdList
+    for name in onlyInExpected.keys():
+        diffs.append(diffRecord('missing', card=name))
     # Report cards that gave errors when the card itself was unexpected
-    if unexpErrors:
-        fmtdList = ', '.join(unexpErrors.keys())
-        diffs += 'Unexpected cards showed with errors: %s\n' %fmtdList
+    for name in unexpErrors.keys():
+        diffs.append(diffRecord('unexpectedError', card=name))
 
     # Report differences between actual and expected data on the cards
     for name, pair in common.items():
@@ -674,20 +708,19 @@ def findDiffs(expected, actual):
         except:
             ei = sys.exc_info()
             eifmtd = traceback.format_exception(*ei)
-            pairDiff = 'Error when comparing two cards. The error was: %s' %eifmtd
+            pairDiff = [errorDiff('Error when comparing two cards. The error '
+                                  'was: %s' % eifmtd)]
 
         if pairDiff is None:
             raise TypeError('Diff for %s returned None\n' %name)
 
-        elif not(isinstance(pairDiff, basestring)):
+        elif not(isinstance(pairDiff, list)):
             raise TypeError(
-                'Diff for %s returned a non-string value "%s"\n' %(name, diffs)
+                'Diff for %s returned a non-list value "%s"\n'
+                % (name, pairDiff)
             )
-        elif pairDiff:
-            diffs += 'Found differences in card %s:\n' %name
-            pairDiffStr = ''
-            for pd in pairDiff.splitlines():
-                pairDiffStr += '\t%s\n' %pd
-            diffs += pairDiffStr
+        for record in pairDiff:
+            record.card = name
+        diffs.extend(pairDiff)
 
     return diffs
@@ -0,0 +1,353 @@
+#!/usr/bin/python
+
+import json
+
+# Card extraction schemas
+#
+# A card class can describe what it needs from its element as a dictionary
+# of field name -> field spec (see the field* functions below). Every schema
+# on the page is evaluated by one execute_script call, which returns a JSON
+# record for every card element instead of us making a WebDriver round trip
+# for every element, .text and get_attribute along the way.
+#
+# Each record is a dictionary with the card's own fields plus these reserved
+# keys, so schemas should not use them as field names:
+#     name: the card's id, or data-name if it has no id (like getCardName)
+#     visible: whether the card element is displayed
+#     text: rendered text of the whole card
+
+reservedKeys = ('name', 'visible', 'text')
+
+
+def fieldText(xpath):
+    '''Text of the first element matching xpath, or None if nothing
+    matched. '''
+    return ['text', xpath]
+
+
+def fieldTexts(xpath):
+    '''List of the text of every element matching xpath. '''
+    return ['texts', xpath]
+
+
+def fieldAttr(xpath, attr):
+    '''Attribute (or property, like get_attribute) of the first element
+    matching xpath, or None if nothing matched. '''
+    return ['attr', xpath, attr]
+
+
+def fieldExists(xpath):
+    '''True if at least one element matches xpath. '''
+    return ['exists', xpath]
+
+
+def fieldList(xpath, schema):
+    '''List of records, one for each element matching xpath, with schema
+    evaluated relative to that element. '''
+    return ['list', xpath, schema]
+
+
+def hasClass(className):
+    '''XPath predicate equivalent to the css selector .className, e.g.
+    './/div' + hasClass('pull-left') for div.pull-left. '''
+    return ('[contains(concat(" ", normalize-space(@class), " "), " %s ")]'
+            % className)
+
+
+def compileSchemas(cardClasses):
+    '''Given a dictionary of card name -> card class (e.g. cardDict), build
+    the card name -> schema dictionary passed to the extraction script.
+    Cards without a schema get an empty one, so they still get their name,
+    visibility and text. '''
+    schemas = {}
+    for name, cardClass in cardClasses.items():
+        schema = getattr(cardClass, 'extractSchema', {})
+        for key in reservedKeys:
+            if key in schema:
+                raise Exception('%s uses reserved field name %s in its '
+                                'extractSchema' % (cardClass.__name__, key))
+        schemas[name] = schema
+    return schemas
+
+
+# Functions shared by the scripts we run in the page
+scriptHelpers = '''
+function isVisible(el) {
+    if (!el.getClientRects || !el.getClientRects().length) {
+        return false;
+    }
+    var style = window.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none' &&
+        style.opacity !== '0';
+}
+
+function cardName(el) {
+    return el.id || el.getAttribute('data-name');
+}
+
+function visibleSpinners() {
+    return Array.prototype.filter.call(
+        document.querySelectorAll('i.fa-spin'), isVisible);
+}
+
+// Names of the (visible) cards containing each spinner
+function hungCardNames(spinners) {
+    var hung = [];
+    for (var i = 0; i < spinners.length; i++) {
+        var el = spinners[i].parentNode;
+        while (el && el.getAttribute && !cardName(el)) {
+            el = el.parentNode;
+        }
+        if (el && el.getAttribute && isVisible(el)) {
+            var name = cardName(el);
+            if (hung.indexOf(name) === -1) {
+                hung.push(name);
+            }
+        }
+    }
+    return hung;
+}
+'''
+
+# arguments[0]: list of xpaths to find card elements with
+# arguments[1]: card name -> schema dictionary
+# Returns a JSON string of the form {"cards": [record, ...], "hung": [...]}
+extractScript = scriptHelpers + '''
+var cardXpaths = arguments[0];
+var schemas = arguments[1];
+
+function nodes(ctx, xpath) {
+    var result = document.evaluate(xpath, ctx, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    var out = [];
+    for (var i = 0; i < result.snapshotLength; i++) {
+        out.push(result.snapshotItem(i));
+    }
+    return out;
+}
+
+function textOf(el) {
+    var text = el.innerText;
+    if (text === undefined || text === null) {
+        text = el.textContent || '';
+    }
+    return text.replace(/^\\s+|\\s+$/g, '');
+}
+
+function attrOf(el, attr) {
+    var value = el[attr];
+    if (value === undefined || value === null || typeof value === 'object') {
+        value = el.getAttribute(attr);
+    }
+    return (value === null || value === undefined) ? null : String(value);
+}
+
+function field(ctx, spec) {
+    var found = nodes(ctx, spec[1]);
+    switch (spec[0]) {
+        case 'text':
+            return found.length ? textOf(found[0]) : null;
+        case 'texts':
+            return found.map(textOf);
+        case 'attr':
+            return found.length ? attrOf(found[0], spec[2]) : null;
+        case 'exists':
+            return found.length > 0;
+        case 'list':
+            return found.map(function (el) {
+                return record(el, spec[2]);
+            });
+    }
+    throw new Error('Unknown field type ' + spec[0]);
+}
+
+function record(ctx, schema) {
+    var out = {};
+    for (var key in schema) {
+        out[key] = field(ctx, schema[key]);
+    }
+    return out;
+}
+
+var cards = [];
+cardXpaths.forEach(function (xpath) {
+    nodes(document, xpath).forEach(function (el) {
+        var name = cardName(el);
+        var visible = isVisible(el);
+        var text = visible ? textOf(el) : '';
+        var out = {};
+        // Only bother with the fields if cardFromData will use them
+        if (visible && text && schemas.hasOwnProperty(name)) {
+            out = record(el, schemas[name]);
+        }
+        out.name = name;
+        out.visible = visible;
+        out.text = text;
+        cards.push(out);
+    });
+});
+
+return JSON.stringify({cards: cards, hung: hungCardNames(visibleSpinners())});
+'''
+
+
+def extractPage(driver, cardxpaths, schemas):
+    '''Run the extraction script. Returns a (records, hungCardNames) tuple,
+    where records is a list of card records in page order. '''
+    result = json.loads(driver.execute_script(
+        extractScript, list(cardxpaths), schemas))
+    return result['cards'], result['hung']
+
+
+# Offline equivalent of the extraction script, which runs the same schemas
+# against an lxml tree of driver.page_source (or saved HTML) instead of the
+# live page. lxml has no layout engine, so visibility is judged from markup
+# alone: inline display:none/visibility:hidden, the hidden attribute, and
+# the hidden/hide classes, on the element or any of its ancestors.
+
+# Tags that start a new line in rendered text
+blockTags = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt',
+    'fieldset', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section',
+    'table', 'tr', 'ul',
+])
+
+# Tags whose content is never rendered
+skipTags = frozenset(['head', 'noscript', 'script', 'style', 'template'])
+
+hiddenClasses = frozenset(['hidden', 'hide'])
+
+spinnerXpath = '//i' + hasClass('fa-spin')
+
+
+def parseSource(source, baseUrl=None):
+    '''Parse page source into an lxml tree. If baseUrl is given, links are
+    made absolute like get_attribute('href') would give us. '''
+    # lxml is only needed for this parse mode
+    import lxml.html
+    root = lxml.html.fromstring(source)
+    if baseUrl:
+        root.make_links_absolute(baseUrl)
+    return root
+
+
+def treeHidden(el):
+    '''Check if the markup of this element (not its ancestors) hides it. '''
+    if el.get('hidden') is not None:
+        return True
+    style = (el.get('style') or '').replace(' ', '').lower()
+    if 'display:none' in style or 'visibility:hidden' in style:
+        return True
+    classes = (el.get('class') or '').split()
+    return bool(hiddenClasses.intersection(classes))
+
+
+def treeVisible(el):
+    '''Tree equivalent of is_displayed(). '''
+    while el is not None:
+        if treeHidden(el):
+            return False
+        el = el.getparent()
+    return True
+
+
+def treeText(el):
+    '''Tree equivalent of WebElement.text: rendered text with one line per
+    block, surrounding whitespace removed and blank lines dropped. '''
+    parts = []
+    _collectText(el, parts)
+    lines = [' '.join(line.split()) for line in ''.join(parts).split('\n')]
+    return '\n'.join([line for line in lines if line])
+
+
+def _collectText(el, parts):
+    '''Internal function for treeText. Appends el's rendered text (but not
+    its tail) to parts. '''
+    # Comments and processing instructions don't have a string tag
+    if not isinstance(el.tag, basestring):
+        return
+    tag = el.tag.lower()
+    if tag in skipTags or treeHidden(el):
+        return
+    if tag == 'br':
+        parts.append('\n')
+        return
+
+    block = tag in blockTags
+    if block:
+        parts.append('\n')
+    if el.text:
+        parts.append(el.text)
+    for child in el:
+        _collectText(child, parts)
+        if child.tail:
+            parts.append(child.tail)
+    if block:
+        parts.append('\n')
+
+
+def treeCardName(el):
+    '''Tree equivalent of getCardName. '''
+    return el.get('id') or el.get('data-name')
+
+
+def treeField(ctx, spec):
+    '''Evaluate one field spec against an lxml element. '''
+    kind = spec[0]
+    found = [el for el in ctx.xpath(spec[1])
+             if isinstance(getattr(el, 'tag', None), basestring)]
+    if kind == 'text':
+        return treeText(found[0]) if found else None
+    elif kind == 'texts':
+        return [treeText(el) for el in found]
+    elif kind == 'attr':
+        return found[0].get(spec[2]) if found else None
+    elif kind == 'exists':
+        return bool(found)
+    elif kind == 'list':
+        return [treeRecord(el, spec[2]) for el in found]
+    raise Exception('Unknown field type %s' % kind)
+
+
+def treeRecord(ctx, schema):
+    '''Evaluate a schema against an lxml element. '''
+    return dict([(key, treeField(ctx, spec)) for key, spec in schema.items()])
+
+
+def treeCardRecord(el, schema):
+    '''Make the same record the extraction script would for card element
+    el, including the reserved name/visible/text keys. '''
+    visible = treeVisible(el)
+    text = treeText(el) if visible else ''
+    record = {}
+    if visible and text:
+        record = treeRecord(el, schema)
+    record['name'] = treeCardName(el)
+    record['visible'] = visible
+    record['text'] = text
+    return record
+
+
+def extractTree(root, cardxpaths, schemas):
+    '''Tree equivalent of extractPage. Returns a (records, hungCardNames)
+    tuple. '''
+    records = []
+    for xpath in cardxpaths:
+        for el in root.xpath(xpath):
+            schema = schemas.get(treeCardName(el), {})
+            records.append(treeCardRecord(el, schema))
+
+    hung = []
+    for spinner in root.xpath(spinnerXpath):
+        if not treeVisible(spinner):
+            continue
+        el = spinner.getparent()
+        while el is not None and not treeCardName(el):
+            el = el.getparent()
+        if el is not None and treeVisible(el):
+            cardName = treeCardName(el)
+            if cardName not in hung:
+                hung.append(cardName)
+
+    return records, hung
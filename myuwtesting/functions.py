@@ -1,18 +1,21 @@
 #!/usr/bin/python
 
 import datetime
+import os
 from selenium.common.exceptions import WebDriverException
 from functools import wraps
 
+from .diffs import fieldDiff
+
 
 def uesc(func):
     '''Escape unicode from all arguments. '''
     @wraps(func)
     def inner(*args, **kwargs):
-        args = list(args)
-        for i, arg in enumerate(args):
-            if isinstance(arg, unicode):
-                args[i] = arg.encode('unicode-escape')
+        # Most calls have no unicode at all, so leave their arguments be
+        if any([isinstance(arg, unicode) for arg in args]):
+            args = [arg.encode('unicode-escape')
+                    if isinstance(arg, unicode) else arg for arg in args]
 
         for k, v in kwargs.items():
             if isinstance(v, unicode):
@@ -68,17 +71,17 @@ def packElement(func):
     return inner
 
 
-@uesc
 def formatDiffs(label, a, b):
     '''Format diffs.
-    If a and b are equal, return an empty string.
-    If not, then use 'label' to form a description of the differences.
-    Escapes unicode such as to not cause problems.
+    If a and b are equal, return an empty list.
+    If not, then return a list of one diffRecord for field 'label', with a
+    as the expected value and b as the actual one. Unicode is escaped when
+    the record is formatted.
     '''
     if a == b:
-        return ''
+        return []
     else:
-        return 'Different %s (%s vs %s)\n' % (label, a, b)
+        return [fieldDiff(label, a, b)]
 
 # Not finished TODO
 """
@@ -104,7 +107,7 @@ def formatListDiffs(label, a, b):
 
 def findDiffs(self, other):
     if hasattr(self, 'autoDiffs'):
-        diffs = ''
+        diffs = []
         for prop, label in self.autoDiffs.items():
             valueSelf = getattr(self, prop)
             valueOther = getattr(other, prop)
@@ -171,6 +174,49 @@ def driverRetry(driverFunc, numTries=3):
             raise ex
 
 
+def driverRss(driver):
+    '''Get the total resident memory, in bytes, of a WebDriver's service
+    (e.g. chromedriver) and the browser processes under it. Returns None if
+    this can't be found out, e.g. if psutil isn't installed. '''
+    try:
+        import psutil
+        pid = driver.service.process.pid
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+    except Exception:
+        return None
+
+    total = 0
+    for proc in procs:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            # Process went away while we were looking
+            pass
+    return total
+
+
+def hostLoad():
+    '''Get the 1 minute load average divided by the number of CPUs, so that
+    1.0 means every CPU is busy. Returns None if it isn't available (e.g.
+    on Windows). '''
+    try:
+        import multiprocessing
+        return os.getloadavg()[0] / multiprocessing.cpu_count()
+    except (AttributeError, OSError, NotImplementedError):
+        return None
+
+
+def hostMemoryUsed():
+    '''Get the percentage of the host's memory in use, or None if psutil
+    isn't installed. '''
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().percent
+
+
 def filterListVis(inList, date):
     '''Filter a list down to elements whose shouldAppear method returns true
     on that date. '''
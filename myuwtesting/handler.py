@@ -2,67 +2,220 @@
 
 import time
 
-from .cards import cardFromElement
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+from .cards import cardFromElement, cardFromData, cardDict
+from .extract import compileSchemas, extractPage, extractTree, parseSource, \
+    scriptHelpers
 from .functions import getCardName, isCardVisible, isVisibleFast
-from .testconfig import perf
+from .testconfig import parseMode, overrideTimeout, overrideBackend, \
+    landingWaitMode, landingMaxWait, landingQuietTime
 from .classes import myuwDate, hungCard
-from .exceptions import LandingWaitTimedOut
-from .perf import perfCounter
+from .exceptions import LandingWaitTimedOut, OverrideTimedOut, \
+    OverrideFailed
+from .override import httpOverrideClient
+from .perf import perfCounter, span, sleep
+
+
+# Async script for waiting for the landing page to load
+# arguments[0]: how long (ms) there must be no visible spinners
+# arguments[1]: how long (ms) to wait in total
+# Calls back with {ready: true} once loaded, or {ready: false, hung: [names]}
+# if it runs out of time.
+landingWaitScript = scriptHelpers + '''
+var quietMs = arguments[0];
+var timeoutMs = arguments[1];
+var done = arguments[arguments.length - 1];
+var quietTimer = null;
+var finished = false;
+var observer, deadline;
+
+function finish(result) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(deadline);
+    done(result);
+}
+
+function check() {
+    if (visibleSpinners().length) {
+        if (quietTimer !== null) {
+            clearTimeout(quietTimer);
+            quietTimer = null;
+        }
+    } else if (quietTimer === null) {
+        quietTimer = setTimeout(function () {
+            quietTimer = null;
+            if (!visibleSpinners().length) {
+                finish({ready: true, hung: []});
+            }
+        }, quietMs);
+    }
+}
+
+observer = new MutationObserver(check);
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, characterData: true
+});
+deadline = setTimeout(function () {
+    finish({ready: false, hung: hungCardNames(visibleSpinners())});
+}, timeoutMs);
+check();
+'''
 
 
 class mainMyuwHandler(object):
     '''Page object model handler for myuw. '''
 
-    # Go to override page and set override username
+    # Set override username
     def _changeUser(self, username):
         '''Set override username. You probably want setUser instead. '''
+        if self.overrideBackend == 'http':
+            timer = perfCounter('User override (http)')
+            try:
+                self._getOverrideClient().setUser(self.userUrl, username)
+            except OverrideFailed:
+                # Fall back to the form. The form may give the browser new
+                # cookies, so start over with a fresh client next time.
+                self.overrideClient = None
+                self.overrideFallbacks += 1
+            else:
+                self.cardsValid = False
+                self.currentUser = username
+                self._logOverride('user (http)', username, timer)
+                return
+
+        self._changeUserForm(username)
+
+    # Set override date
+    def _changeDate(self, dateStr):
+        '''Set override date. You probably want setDate instead. '''
+        if self.overrideBackend == 'http':
+            timer = perfCounter('Date override (http)')
+            try:
+                self._getOverrideClient().setDate(self.dateUrl, dateStr)
+            except OverrideFailed:
+                # Fall back to the form. The form may give the browser new
+                # cookies, so start over with a fresh client next time.
+                self.overrideClient = None
+                self.overrideFallbacks += 1
+            else:
+                self.cardsValid = False
+                self.currentDate = myuwDate(dateStr)
+                self._logOverride('date (http)', dateStr, timer)
+                return
+
+        self._changeDateForm(dateStr)
+
+    def _getOverrideClient(self):
+        '''Get the HTTP override client, making it if we don't have one.
+        Raises OverrideFailed if it can't be made (yet). '''
+        if self.overrideClient is None:
+            self.overrideClient = httpOverrideClient(self.driver,
+                                                     self.overrideTimeout)
+        return self.overrideClient
+
+    # Go to override page and set override username
+    def _changeUserForm(self, username):
+        '''Set override username using the form on the override page. '''
+        timer = perfCounter('User override')
         self.browseToPage(self.userUrl)
-        # XXX
-        time.sleep(.2)
-        userBox = self.driver.find_element_by_xpath(
-            '//input[@name="override_as"]')
+        userBox = self._waitForInput('//input[@name="override_as"]')
         userBox.send_keys(username)
         userBox.submit()
-        # XXX
-        time.sleep(.2)
+        self._waitForSubmit(userBox, 'user', username)
         self.currentUser = username
+        self._logOverride('user', username, timer)
 
     # Go to override page and set override date
-    def _changeDate(self, dateStr):
-        '''Set override date. You probably want setDate instead. '''
+    def _changeDateForm(self, dateStr):
+        '''Set override date using the form on the override page. '''
+        timer = perfCounter('Date override')
         self.browseToPage(self.dateUrl)
-        time.sleep(.2)
-        dateBox = self.driver.find_element_by_xpath('//input[@name="date"]')
+        dateBox = self._waitForInput('//input[@name="date"]')
         dateBox.clear()
         dateBox.send_keys(dateStr)
         dateBox.submit()
-        time.sleep(.2)
+        self._waitForSubmit(dateBox, 'date', dateStr)
         self.currentDate = myuwDate(dateStr)
+        self._logOverride('date', dateStr, timer)
+
+    def _waitForInput(self, xpath):
+        '''Wait for an override form input to be present, then return it. '''
+        wait = WebDriverWait(self.driver, self.overrideTimeout)
+        try:
+            return wait.until(expected_conditions.presence_of_element_located(
+                (By.XPATH, xpath)))
+        except TimeoutException:
+            raise OverrideTimedOut('form', xpath, self.overrideTimeout)
+
+    def _waitForSubmit(self, formInput, kind, value):
+        '''Wait for a submitted override form to finish. The old page going
+        stale tells us the post went through, and the new page being
+        complete tells us the server has finished handling it. '''
+        wait = WebDriverWait(self.driver, self.overrideTimeout)
+        try:
+            wait.until(expected_conditions.staleness_of(formInput))
+            wait.until(lambda driver: driver.execute_script(
+                'return document.readyState') == 'complete')
+        except TimeoutException:
+            raise OverrideTimedOut(kind, value, self.overrideTimeout)
+
+    def _logOverride(self, kind, value, timer):
+        '''Record how long an override took. '''
+        self.overrideTimes.append((kind, value, timer.endGetTime()))
+
+    def overrideTimingReport(self):
+        '''Summarize how long overrides took, per kind of override. '''
+        lines = ['Override timings:']
+        kinds = sorted(set([kind for kind, value, t in self.overrideTimes]))
+        for kind in kinds:
+            times = [t for k, value, t in self.overrideTimes if k == kind]
+            lines.append(
+                '  %s: %s overrides, mean %.3fs, max %.3fs, total %.3fs'
+                % (kind, len(times), sum(times) / len(times), max(times),
+                   sum(times))
+            )
+        if not kinds:
+            lines.append('  No overrides done')
+        if self.overrideFallbacks:
+            lines.append('  %s HTTP overrides fell back to the form'
+                         % self.overrideFallbacks)
+        return '\n'.join(lines)
 
     # Set user if it is different from the current user
     def setUser(self, username):
         '''Set override username only if that isn't already our username. '''
         if username != self.currentUser:
-            self._changeUser(username)
+            with span('override user', 'override', user=username,
+                      backend=self.overrideBackend):
+                self._changeUser(username)
 
     # Set date if it is different from the current date
     def setDate(self, newDate):
         '''Set override date only if that isn't already our date. '''
         newDate = myuwDate(newDate)
+        # The date override takes the time as well, so this also handles
+        # dates which only differ by time.
         if self.currentDate != newDate:
-            self._changeDate(newDate.getDateOverride())
-
-        try:
-            timeOverride = newDate.getTimeOverride()
-            self._changeTime(timeOverride)
-        except AttributeError:
-            pass
+            with span('override date', 'override', date=str(newDate),
+                      backend=self.overrideBackend):
+                self._changeDate(newDate.getDateOverride())
 
     # Go to landing page
     def browseLanding(self):
         '''Browse back to the landing page. '''
-        self.browseToPage(self.landingUrl)
-        self.waitForLanding()
+        with span('landing get', 'landing'):
+            self.browseToPage(self.landingUrl)
+        with span('landing wait', 'landing', mode=self.landingWaitMode):
+            self.waitForLanding()
 
     def browseToPage(self, url):
         '''Browse to a specific URL, and indicate that cards will need
@@ -76,7 +229,10 @@ class mainMyuwHandler(object):
     # Can also take a user and date to override assumed
     # javerage/2013-04-15
     def __init__(self, driver, baseUrl, date=myuwDate('2013-04-15'),
-                 user='javerage', userUrl=None, dateUrl=None):
+                 user='javerage', userUrl=None, dateUrl=None,
+                 parseMode=parseMode, overrideTimeout=overrideTimeout,
+                 overrideBackend=overrideBackend,
+                 landingWaitMode=landingWaitMode):
         '''
         Constructor for mainMyuwHandler.
         baseUrl: root URL for the site.
@@ -84,6 +240,16 @@ class mainMyuwHandler(object):
         override.
         userUrl: user override page. Defaults to baseUrl + 'users/'.
         dateUrl: Same for date page. Defaults to baseUrl + 'admin/dates'.
+        parseMode: 'script' to read every card with one execute_script call,
+        'tree' to parse one page_source fetch locally with lxml, or
+        'element' to have each card walk its WebElement.
+        overrideTimeout: longest time in seconds to wait for an override
+        to finish before raising OverrideTimedOut.
+        overrideBackend: 'http' to post overrides directly, sharing the
+        browser's session, falling back to the form if that fails. 'form'
+        to always fill in the form in the browser.
+        landingWaitMode: 'observer' to have the page tell us when it has
+        finished loading, or 'poll' to keep checking for loading gears.
         '''
 
         self.cardsValid = False
@@ -96,51 +262,93 @@ class mainMyuwHandler(object):
         self.driver = driver
         self.currentUser = user
         self.currentDate = date
+        self.parseMode = parseMode
+        self.overrideTimeout = overrideTimeout
+        # (kind, value, seconds) for each override done
+        self.overrideTimes = []
+        self.overrideBackend = overrideBackend
+        self.overrideClient = None
+        self.overrideFallbacks = 0
+        self.landingWaitMode = landingWaitMode
+        self.landingMaxWait = landingMaxWait
+        self.landingQuietTime = landingQuietTime
+        self.scriptTimeoutSet = False
+
+    # Various search strings to use for finding cards
+    cardxpaths = (
+        # Notices
+        '//div[@id="notice_banner_location"]/div',
+        # Calendar on mobile
+        '//div[@id="calendar_banner_location_mobile"]/div',
+        # Calendar on desktop
+        '//div[@id="calendar_banner_location_desktop"]/div',
+        # PCE message
+        '//div[@id="pce_banner_location"]/div',
+        # Left column on desktop layout, only column on mobile
+        '//div[@id="landing_content_cards"]/div',
+        # Right column on desktop layout
+        '//div[@id="landing_accounts_cards"]/div',
+        # Email link
+        '//div[@id="app_header"]//div[@id="uwemail"]'
+    )
+
+    # Extraction schemas for every known card, see myuwtesting.extract
+    schemas = compileSchemas(cardDict)
 
     def _parsePage(self):
         '''Internal function for parsing cards. '''
-        # If requested, set up timing
-        '''
-        if perf:
-            allParseTimer = perfCounter('Parsing all cards')
-        '''
-        cardEls = []
-        # Various search strings to use for finding cards
-        cardxpaths = (
-            # Notices
-            '//div[@id="notice_banner_location"]/div',
-            # Calendar on mobile
-            '//div[@id="calendar_banner_location_mobile"]/div',
-            # Calendar on desktop
-            '//div[@id="calendar_banner_location_desktop"]/div',
-            # PCE message
-            '//div[@id="pce_banner_location"]/div',
-            # Left column on desktop layout, only column on mobile
-            '//div[@id="landing_content_cards"]/div',
-            # Right column on desktop layout
-            '//div[@id="landing_accounts_cards"]/div',
-            # Email link
-            '//div[@id="app_header"]//div[@id="uwemail"]'
-        )
+        if self.parseMode == 'script':
+            self._parsePageScript()
+        elif self.parseMode == 'tree':
+            self._parsePageTree()
+        else:
+            self._parsePageElements()
 
-        self.driver.find_elements_by_css_selector('i.fa-spin')
+        # Mark the card list as being fresh
+        self.cardsValid = True
+
+    def _parsePageScript(self):
+        '''Parse cards using the extraction script, which gets everything
+        we need from the page in a single WebDriver call. '''
+        with span('extract script', 'parse'):
+            records, hungNames = extractPage(self.driver, self.cardxpaths,
+                                             self.schemas)
+        self._cards = {}
+        for record in records:
+            self._cards.update(cardFromData(record, self.currentDate))
+
+        for cardName in hungNames:
+            self._cards[cardName] = hungCard(cardName)
+
+    def _parsePageTree(self):
+        '''Parse cards from a single page_source fetch. Everything after
+        the fetch is local work on an lxml tree. '''
+        with span('page_source', 'parse'):
+            source = self.driver.page_source
+        self._cards = cardsFromSource(source, self.currentDate,
+                                      self.driver.current_url)
+
+    def _parsePageElements(self):
+        '''Parse cards by walking each card's WebElement. '''
+        cardEls = []
 
         # Cards that didn't finish loading
         failedCards = []
-        spinners = self.driver.find_elements_by_css_selector('i.fa-spin')
-
-        spinners = filter(isVisibleFast, spinners)
-        for el in spinners:
-            cardName = None
-            while cardName is None:
-                el = el.find_element_by_xpath('..')
-                cardName = getCardName(el)
-            else:
-                failedCards.append(el)
+        with span('find cards', 'parse'):
+            spinners = self.driver.find_elements_by_css_selector('i.fa-spin')
+
+            spinners = filter(isVisibleFast, spinners)
+            for el in spinners:
+                cardName = None
+                while cardName is None:
+                    el = el.find_element_by_xpath('..')
+                    cardName = getCardName(el)
+                else:
+                    failedCards.append(el)
 
-        # Using each search string above, find cards
-        for xpath in cardxpaths:
-            cardEls += self.driver.find_elements_by_xpath(xpath)
+            # Using each search string above, find cards
+            for xpath in self.cardxpaths:
+                cardEls += self.driver.find_elements_by_xpath(xpath)
 
         # Iterate over each card element
         self._cards = {}
@@ -154,14 +362,6 @@ class mainMyuwHandler(object):
             cardName = getCardName(cardEl)
             self._cards[cardName] = hungCard(cardName)
 
-        # Mark the card list as being fresh
-        self.cardsValid = True
-        '''
-        if perf:
-            allParseTime = allParseTimer.endFmt()
-            print allParseTime
-        '''
-
     @property
     def cards(self):
         '''Get cards. Only parses if they haven't already been parsed. '''
@@ -172,14 +372,43 @@ class mainMyuwHandler(object):
     def waitForLanding(self):
         '''
         Wait for landing to finish loading. If this times out, it will raise
-        a LandingWaitTimedOut exception, which accepts a list of elements that
-        did not finish loading. The presence of the loading gear is used to
-        determine that an element has not finished loading. Waits 1 second
-        after the last loading gear has disappeared.
+        a LandingWaitTimedOut exception with the cards that did not finish
+        loading. The presence of the loading gear is used to determine that
+        an element has not finished loading.
         '''
+        if self.landingWaitMode == 'observer':
+            try:
+                self._waitForLandingObserver()
+                return
+            except WebDriverException:
+                # e.g. the script itself timed out or the page navigated
+                # away under it. Polling copes with both.
+                pass
+        self._waitForLandingPoll()
+
+    def _waitForLandingObserver(self):
+        '''Wait for landing using a MutationObserver in the page, which
+        reports back as soon as there have been no visible loading gears
+        for landingQuietTime seconds. '''
+        if not self.scriptTimeoutSet:
+            # Give the script a little longer than it gives itself
+            self.driver.set_script_timeout(self.landingMaxWait + 5)
+            self.scriptTimeoutSet = True
+
+        result = self.driver.execute_async_script(
+            landingWaitScript,
+            int(self.landingQuietTime * 1000),
+            int(self.landingMaxWait * 1000)
+        )
+        if not result['ready']:
+            raise LandingWaitTimedOut(result['hung'])
+
+    def _waitForLandingPoll(self):
+        '''Wait for landing by polling for loading gears. Waits a further
+        half second after the last loading gear has disappeared. '''
         # I don't know if selenium's implicit wait can wait until
         # an element is *not* found, so do it manually
-        maxTime = 10
+        maxTime = self.landingMaxWait
         loadTimer = perfCounter('Page load')
         els = []
         while loadTimer.elapsedTime < maxTime:
@@ -200,7 +429,7 @@ class mainMyuwHandler(object):
                 # If not, then the page finished loading
                 else:
                     break
-            time.sleep(.8)
+            sleep(.8, 'landing poll sleep')
 
         else:
             # If the loop ends due to running out of time, throw our
@@ -219,12 +448,26 @@ class mainMyuwHandler(object):
         # If the loop ended due to there being no more loading gears,
         # it will hit this code instead.
         loadTimer.end()
-        '''
-        if perf:
-            print loadTimer.formatted
-        '''
 
         # Sleep a little longer just in case we have a card that
         # hasn't quite finished but isn't displaying the loading
         # gear either.
-        time.sleep(.5)
+        sleep(.5, 'landing settle sleep')
+
+
+def cardsFromSource(source, date, baseUrl=None,
+                    cardxpaths=mainMyuwHandler.cardxpaths,
+                    schemas=mainMyuwHandler.schemas):
+    '''Parse cards out of landing page source, e.g. from driver.page_source
+    or a saved HTML file, as they would appear on date. Returns a dictionary
+    of card name -> card, like mainMyuwHandler.cards. '''
+    root = parseSource(source, baseUrl)
+    records, hungNames = extractTree(root, cardxpaths, schemas)
+    cards = {}
+    for record in records:
+        cards.update(cardFromData(record, date))
+
+    for cardName in hungNames:
+        cards[cardName] = hungCard(cardName)
+
+    return cards
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+import json
+import os
+
+from .classes import myuwDate
+
+# Run history
+#
+# How long each user/date pair took on previous runs, broken down into
+# phases, stored as JSON in testconfig.historyFile:
+#     {user: {date: {phase: seconds, ...}, ...}, ...}
+# Parallel runs use it to estimate how long each pair will take, so that
+# pairs can be split between workers with their run times balanced.
+
+# Phases timed for each pair, in the order they happen
+phases = ('override', 'load', 'parse', 'diff')
+
+# Phases which don't depend on what was tested before the pair. Override
+# time depends on the order pairs are tested in, so schedulePairs counts
+# overrides separately.
+pagePhases = ('load', 'parse', 'diff')
+
+
+def dateKey(date):
+    '''Normalize a date so that e.g. 2013-2-5 and 2013-02-05 match. '''
+    return str(myuwDate(date))
+
+
+def loadHistory(path):
+    '''Load run history, or return an empty history if there isn't any (or
+    the file can't be read). '''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def saveHistory(history, path):
+    '''Save run history. Writes to a temporary file first, so an interrupted
+    run doesn't leave a truncated history behind. '''
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.rename(tmpPath, path)
+
+
+def mergeTimings(history, timings):
+    '''Add timings ({user: {date: {phase: seconds}}}) to history, replacing
+    anything already there for the same pairs. '''
+    for user, dates in timings.items():
+        userHistory = history.setdefault(user, {})
+        for date, times in dates.items():
+            userHistory[dateKey(date)] = times
+
+
+def median(values):
+    '''Median of a non-empty list of numbers. '''
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def pageTime(times):
+    '''Time spent on a pair outside of overrides. '''
+    return sum([times.get(phase, 0) for phase in pagePhases])
+
+
+class pairEstimator(object):
+    '''Estimates how long a pair will take (outside of overrides) from run
+    history. Pairs without history are estimated from the median of that
+    user's other pairs, then the median of all pairs, then default. Can be
+    used as the pairCost argument of schedulePairs. '''
+
+    def __init__(self, history, default):
+        self.history = history
+        self.default = default
+        self.userMedians = {}
+        allTimes = []
+        for user, dates in history.items():
+            userTimes = [pageTime(times) for times in dates.values()]
+            if userTimes:
+                self.userMedians[user] = median(userTimes)
+                allTimes.extend(userTimes)
+        self.overallMedian = median(allTimes) if allTimes else None
+        self.known = 0
+        self.guessed = 0
+
+    def __call__(self, user, date):
+        times = self.history.get(user, {}).get(dateKey(date))
+        if times is not None:
+            self.known += 1
+            return pageTime(times)
+
+        self.guessed += 1
+        if user in self.userMedians:
+            return self.userMedians[user]
+        if self.overallMedian is not None:
+            return self.overallMedian
+        return self.default
+
+    def report(self):
+        '''Describe how many estimates came from history. '''
+        return ('Estimated %s pairs from run history, guessed %s'
+                % (self.known, self.guessed))
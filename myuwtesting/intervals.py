@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+import heapq
+from bisect import bisect_right
+
+# Interval lists
+#
+# Sets of dates are kept as sorted lists of disjoint, non-touching
+# (start, end) tuples of myuwDate keys (see myuwDate), each covering
+# start <= key < end. Checking a date is a bisect, and union, intersection
+# and difference are linear merges. minKey and maxKey stand in for "forever"
+# in either direction.
+
+minKey = 0
+maxKey = 10 ** 15
+
+# Every date
+everything = [(minKey, maxKey)]
+
+
+def normalize(intervals):
+    '''Sort intervals and merge any which overlap or touch, dropping empty
+    ones. '''
+    out = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+def contains(intervals, key):
+    '''Check if key is in an interval list. '''
+    i = bisect_right(intervals, (key, maxKey)) - 1
+    return i >= 0 and intervals[i][0] <= key < intervals[i][1]
+
+
+def union(*lists):
+    '''Union of interval lists, in one sweep over them merged in order. '''
+    out = []
+    for start, end in heapq.merge(*lists):
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+def intersect(a, b):
+    '''Intersection of two interval lists. '''
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            out.append((start, end))
+        # Move on from whichever interval ends first
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def difference(a, b):
+    '''Dates in interval list a but not in b. '''
+    return intersect(a, complement(b))
+
+
+def complement(intervals):
+    '''Dates not in an interval list. '''
+    out = []
+    prev = minKey
+    for start, end in intervals:
+        if start > prev:
+            out.append((prev, start))
+        prev = end
+    if prev < maxKey:
+        out.append((prev, maxKey))
+    return out
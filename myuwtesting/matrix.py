@@ -0,0 +1,181 @@
+#!/usr/bin/python
+
+import csv
+import datetime
+
+from . import expected
+from .classes import myuwDate, dateKey
+from .testconfig import defaultStartDate, defaultEndDate
+from .timeline import timelinePoints
+
+# Visibility matrix
+#
+# Whether each expected card of each user shows on each date between two
+# dates, as a boolean numpy array with a row per card and a column per
+# date. The dates are every day in the range plus every significant date
+# with a time, the same as the timeline uses. Cards whose visibility
+# compiles to an interval list (see myuwCard.visIntervals) get their whole
+# row from one searchsorted over the dates' keys. Any others are asked
+# date by date.
+#
+# From the matrix, dates where a user has exactly the same expected cards
+# (duplicate columns) and dates where a user has two expected cards with
+# the same name (which getExpectedResults raises an exception for) are
+# found without going through the cards again.
+#
+# numpy is only needed for this, so everything else works without it.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# myuwDate key of the Unix epoch, for turning keys into datetime64
+epochKey = dateKey(datetime.date(1970, 1, 1))
+
+
+def intervalMask(compiled, keys):
+    '''Boolean array of which keys (a numpy array of myuwDate keys) are in
+    an interval list. '''
+    if not compiled:
+        return numpy.zeros(len(keys), dtype=bool)
+    starts = numpy.array([start for start, end in compiled], dtype=numpy.int64)
+    ends = numpy.array([end for start, end in compiled], dtype=numpy.int64)
+    i = numpy.searchsorted(starts, keys, side='right') - 1
+    return (i >= 0) & (keys < ends[numpy.maximum(i, 0)])
+
+
+def cardRow(card, keys):
+    '''Which of keys card shows on. Dates where shouldAppear raises an
+    exception count as not showing. '''
+    compiled = card.visIntervals()
+    if compiled is not None:
+        return intervalMask(compiled, keys), True
+    row = numpy.zeros(len(keys), dtype=bool)
+    for i, key in enumerate(keys):
+        try:
+            row[i] = bool(card.shouldAppear(myuwDate.fromKey(int(key))))
+        except Exception:
+            pass
+    return row, False
+
+
+class visibilityMatrix(object):
+    '''Card x date visibility matrix. rows[i] is the (user, name, index)
+    of the card for values[i], where index is its place in
+    expected.cardList[user][name], and keys[j] is the myuwDate key of the
+    date for values[:, j]. '''
+
+    def __init__(self, rows, keys, values, compiledRows=0):
+        self.rows = rows
+        self.keys = keys
+        self.values = values
+        # How many rows came from interval lists
+        self.compiledRows = compiledRows
+
+    @classmethod
+    def build(cls, start=defaultStartDate, end=defaultEndDate, users=None):
+        '''Work out the matrix for the given users (or every user in
+        expected.cardList) between start and end. '''
+        if numpy is None:
+            raise ImportError('numpy is needed for the visibility matrix')
+        if users is None:
+            users = sorted(expected.cardList.keys())
+        points, timePoints = timelinePoints(start, end)
+        keys = numpy.array(points, dtype=numpy.int64)
+
+        rows = []
+        for user in users:
+            for name, cardColl in sorted(expected.cardList[user].items()):
+                for i in range(len(cardColl)):
+                    rows.append((user, name, i))
+
+        values = numpy.zeros((len(rows), len(keys)), dtype=bool)
+        compiledRows = 0
+        for r, (user, name, i) in enumerate(rows):
+            card = expected.cardList[user][name][i]
+            values[r], compiled = cardRow(card, keys)
+            compiledRows += compiled
+        return cls(rows, keys, values, compiledRows)
+
+    @property
+    def dates(self):
+        '''The columns' dates as a datetime64 array. '''
+        return (self.keys - epochKey).astype('datetime64[s]')
+
+    def userRows(self, user):
+        return [r for r, row in enumerate(self.rows) if row[0] == user]
+
+    def users(self):
+        return sorted(set([row[0] for row in self.rows]))
+
+    def duplicateDates(self, user):
+        '''Groups of dates on which user has exactly the same expected
+        cards, as lists of myuwDates in date order. Only groups of more than
+        one date are given. '''
+        columns = self.values[self.userRows(user)].T
+        if not len(columns):
+            return []
+        # Label each distinct column, then group dates by label
+        unique, labels = numpy.unique(columns, axis=0, return_inverse=True)
+        order = numpy.argsort(labels, kind='mergesort')
+        splits = numpy.nonzero(numpy.diff(labels[order]))[0] + 1
+        groups = []
+        for group in numpy.split(order, splits):
+            if len(group) > 1:
+                groups.append([myuwDate.fromKey(int(self.keys[j]))
+                               for j in group])
+        return sorted(groups)
+
+    def overlaps(self):
+        '''(user, name, dates) for every card name a user has more than one
+        expected card showing for at once, with the dates it happens. '''
+        out = []
+        byName = {}
+        for r, (user, name, i) in enumerate(self.rows):
+            byName.setdefault((user, name), []).append(r)
+        for (user, name), rowIndexes in sorted(byName.items()):
+            if len(rowIndexes) < 2:
+                continue
+            counts = self.values[rowIndexes].sum(axis=0)
+            clashes = numpy.nonzero(counts > 1)[0]
+            if len(clashes):
+                out.append((user, name, [myuwDate.fromKey(int(self.keys[j]))
+                                         for j in clashes]))
+        return out
+
+    def save(self, path):
+        '''Save the matrix as a numpy .npz file. '''
+        numpy.savez_compressed(
+            path,
+            users=numpy.array([row[0] for row in self.rows]),
+            names=numpy.array([row[1] for row in self.rows]),
+            indexes=numpy.array([row[2] for row in self.rows]),
+            dates=self.dates,
+            values=self.values,
+        )
+
+    def writeCsv(self, f):
+        '''Write the matrix to a file object as CSV, with a row per card and
+        a column per date. '''
+        writer = csv.writer(f)
+        writer.writerow(['user', 'card', 'index'] +
+                        [str(myuwDate.fromKey(int(key))) for key in self.keys])
+        for row, values in zip(self.rows, self.values):
+            writer.writerow(list(row) + [int(value) for value in values])
+
+    def summary(self):
+        '''Describe the matrix, the dates each user has the same expected
+        cards on and any overlapping expected cards. '''
+        lines = ['Visibility matrix: %s cards x %s dates (%s cards checked '
+                 'date by date)' % (len(self.rows), len(self.keys),
+                                    len(self.rows) - self.compiledRows)]
+        for user in self.users():
+            groups = self.duplicateDates(user)
+            repeated = sum([len(group) - 1 for group in groups])
+            lines.append('    %s: %s dates have the same expected cards as '
+                         'an earlier date' % (user, repeated))
+        for user, name, dates in self.overlaps():
+            lines.append('    %s has more than one %s card on %s' % (
+                user, name, ', '.join([str(date) for date in dates])))
+        return '\n'.join(lines)
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+
+import re
+from HTMLParser import HTMLParser, HTMLParseError
+from urlparse import urljoin, urlparse
+
+from selenium.common.exceptions import WebDriverException
+
+from .classes import myuwDate
+from .exceptions import OverrideFailed, MyuwDateTypeError
+
+# Hidden CSRF field on the override forms
+csrfRe = re.compile(
+    r'''name=["']csrfmiddlewaretoken["'][^>]*value=["']([^"']+)["']''')
+
+
+def samePage(a, b):
+    '''Check if two URLs are for the same page, ignoring any query and a
+    trailing slash. '''
+    a = urlparse(a)
+    b = urlparse(b)
+    return (a.netloc == b.netloc and
+            a.path.rstrip('/') == b.path.rstrip('/'))
+
+
+class inputValueParser(HTMLParser):
+    '''Finds the value of the first input with a given name. '''
+
+    def __init__(self, name):
+        HTMLParser.__init__(self)
+        self.name = name
+        self.value = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'input' and attrs.get('name') == self.name and \
+                self.value is None:
+            self.value = attrs.get('value') or ''
+
+
+def inputValue(html, name):
+    '''Get the value of the input called name on a page, or None if there
+    isn't one. '''
+    parser = inputValueParser(name)
+    try:
+        parser.feed(html)
+        parser.close()
+    except HTMLParseError:
+        return None
+    return parser.value
+
+
+def sameText(shown, value):
+    '''Check if a value shown on an override page is value. '''
+    return shown.strip() == value
+
+
+def sameDate(shown, dateStr):
+    '''Check if a date shown on the date override page is dateStr, time
+    included. '''
+    try:
+        return myuwDate(shown.strip()) == myuwDate(dateStr)
+    except (MyuwDateTypeError, ValueError):
+        return False
+
+
+class httpOverrideClient(object):
+    '''Posts user/date overrides straight to the override pages over a
+    pooled keep-alive HTTP session, instead of having the browser load and
+    render the form. The session shares the browser's cookies, so the
+    override applies to the browser's session too.
+
+    Needs the requests package. Any failure raises OverrideFailed, so the
+    caller can fall back to the form. '''
+
+    def __init__(self, driver, timeout, poolSize=2):
+        '''driver: WebDriver whose session we should share. It must have
+        already loaded a page from the server so that it has a session.
+        timeout: seconds to wait for each HTTP request. '''
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from requests.cookies import CookieConflictError
+        except ImportError:
+            raise OverrideFailed('the requests package is not installed')
+
+        # Errors which mean the override should be done with the form
+        # instead: the request failing, the session having more than one
+        # cookie with a name we need, or the browser not taking cookies.
+        self.requestErrors = (requests.RequestException, CookieConflictError,
+                              WebDriverException)
+        self.driver = driver
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolSize,
+                              pool_maxsize=poolSize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Tokens scraped from override pages, by URL
+        self.csrfTokens = {}
+        self.syncFromDriver()
+
+    def syncFromDriver(self):
+        '''Copy the WebDriver's cookies into our session. '''
+        try:
+            cookies = self.driver.get_cookies()
+        except WebDriverException as ex:
+            raise OverrideFailed("couldn't get the browser's cookies: %s"
+                                 % ex)
+        if not cookies:
+            raise OverrideFailed('the browser does not have a session yet')
+        for cookie in cookies:
+            # Leave the domain out, since cookie jars treat hosts without
+            # dots (e.g. localhost) specially and we only talk to one server.
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     path=cookie.get('path', '/'))
+
+    def syncToDriver(self):
+        '''Copy any cookies the server set or changed back into the
+        WebDriver, so the browser's session stays the same as ours. '''
+        driverCookies = dict([(c['name'], c['value'])
+                              for c in self.driver.get_cookies()])
+        for cookie in self.session.cookies:
+            if driverCookies.get(cookie.name) != cookie.value:
+                self.driver.add_cookie({
+                    'name': cookie.name,
+                    'value': cookie.value,
+                    'path': cookie.path or '/',
+                })
+
+    def getCsrfToken(self, url):
+        '''Get a CSRF token for posting to url. Uses the csrftoken cookie if
+        there is one, otherwise fetches the form once and caches it. '''
+        token = self.session.cookies.get('csrftoken')
+        if token:
+            return token
+        if url not in self.csrfTokens:
+            response = self.session.get(url, timeout=self.timeout,
+                                        allow_redirects=False)
+            if response.status_code != 200:
+                # e.g. redirected to a login page
+                raise OverrideFailed('getting %s gave HTTP status %s'
+                                     % (url, response.status_code))
+            match = csrfRe.search(response.text)
+            if not match:
+                raise OverrideFailed('no CSRF token on %s' % url)
+            self.csrfTokens[url] = match.group(1)
+        return self.csrfTokens[url]
+
+    def post(self, url, field, value, same=sameText):
+        '''Post value as the override form's field, and check that the
+        override took effect: the override page we get back fills the field
+        in with the override in effect, which must be value (as compared by
+        same). Redirects are only followed back to the override page itself,
+        since a session which has expired is redirected to a login page
+        instead. '''
+        try:
+            data = {field: value,
+                    'csrfmiddlewaretoken': self.getCsrfToken(url)}
+            response = self.session.post(url, data=data,
+                                         headers={'Referer': url},
+                                         timeout=self.timeout,
+                                         allow_redirects=False)
+            if response.is_redirect:
+                location = urljoin(url, response.headers['Location'])
+                if not samePage(location, url):
+                    raise OverrideFailed('posting to %s redirected to %s'
+                                         % (url, location))
+                response = self.session.get(location, timeout=self.timeout,
+                                            allow_redirects=False)
+        except self.requestErrors as ex:
+            raise OverrideFailed('posting to %s failed: %s' % (url, ex))
+
+        if response.status_code != 200:
+            raise OverrideFailed('posting to %s gave HTTP status %s'
+                                 % (url, response.status_code))
+        shown = inputValue(response.text, field)
+        if shown is None:
+            raise OverrideFailed('%s does not show the %s in effect'
+                                 % (url, field))
+        if not same(shown, value):
+            raise OverrideFailed('%s shows %s %s rather than %s'
+                                 % (url, field, shown, value))
+        try:
+            self.syncToDriver()
+        except self.requestErrors as ex:
+            raise OverrideFailed("couldn't copy cookies back to the browser: "
+                                 "%s" % ex)
+
+    def setUser(self, userUrl, username):
+        '''Post a user override. '''
+        self.post(userUrl, 'override_as', username)
+
+    def setDate(self, dateUrl, dateStr):
+        '''Post a date override. dateStr should be in the format given by
+        myuwDate.getDateOverride. '''
+        self.post(dateUrl, 'date', dateStr, sameDate)
@@ -1,7 +1,11 @@
 #!/usr/bin/python
 
+import json
+import os
 import time
 
+from . import testconfig
+
 # Class for measuring how long certain things take
 class perfCounter(object):
     def __init__(self, label = None):
@@ -34,3 +38,158 @@ class perfCounter(object):
     def endFmt(self):
         self.end()
         return self.formatted
+
+
+# Timing spans
+#
+# A span is a named stretch of time spent in one process, with a category
+# and any arguments worth seeing alongside it (the user, date, card, ...).
+# Spans opened inside other spans nest inside them, so a run breaks down as
+# run -> worker -> pair -> override/landing/parse/diff -> individual
+# overrides, waits, sleeps and cards. Fixed sleeps go through sleep() so
+# the time they take shows up as well.
+#
+# Spans are only recorded when testconfig.perf or testconfig.traceFile is
+# set, and otherwise cost one attribute check.
+#
+# testconfig.countCommands also turns spans on, since WebDriver commands
+# are put down to the spans open when they run (see commands.py), but the
+# spans aren't kept unless perf or traceFile is set too.
+#
+# Each span is kept as a Chrome trace event ("complete" event, with times
+# in microseconds), so workers can send theirs to the parent as JSON and
+# the parent can write them all out as one trace for chrome://tracing or
+# Perfetto.
+
+class traceSpan(object):
+    '''A span being timed. Use as a context manager. '''
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **args):
+        '''Add arguments to the span, e.g. once we know which card it was
+        for. '''
+        self.args.update(args)
+
+    def __enter__(self):
+        self.startTime = time.time()
+        self.tracer.stack.append(self)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.tracer.stack.pop()
+        if excType is not None:
+            self.args['error'] = excType.__name__
+        self.tracer.add(self.name, self.cat, self.startTime, time.time(),
+                        **self.args)
+        return False
+
+
+class noSpan(object):
+    '''Stand-in for traceSpan when spans aren't being recorded. '''
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+nullSpan = noSpan()
+
+
+class spanTracer(object):
+    '''Records spans for the current process as trace events. '''
+
+    def __init__(self, enabled = False, keepEvents = True):
+        self.enabled = enabled
+        # Whether to keep finished spans, rather than only tracking which
+        # are open
+        self.keepEvents = keepEvents
+        self.events = []
+        # Spans open right now, innermost last
+        self.stack = []
+
+    def span(self, name, cat = '', **args):
+        '''Context manager which records the time spent in it. '''
+        if not self.enabled:
+            return nullSpan
+        return traceSpan(self, name, cat, args)
+
+    def add(self, name, cat, start, end, pid = None, **args):
+        '''Record a span which has already finished, with start and end as
+        given by time.time(). pid defaults to this process. '''
+        if not (self.enabled and self.keepEvents):
+            return
+        self.events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int(start * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': pid or os.getpid(),
+            'tid': 0,
+            'args': args,
+        })
+
+    def sleep(self, seconds, name = 'sleep'):
+        '''time.sleep, recorded as a span. '''
+        with self.span(name, 'sleep', seconds = seconds):
+            time.sleep(seconds)
+
+    def drain(self):
+        '''Get every event recorded so far and forget them. '''
+        events = self.events
+        self.events = []
+        return events
+
+
+# The tracer for this process
+tracer = spanTracer(
+    bool(testconfig.perf or testconfig.traceFile or testconfig.countCommands),
+    bool(testconfig.perf or testconfig.traceFile))
+span = tracer.span
+sleep = tracer.sleep
+
+
+def processNameEvent(pid, name):
+    '''Trace metadata event naming a process. '''
+    return {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+            'args': {'name': name}}
+
+
+def writeTrace(path, events, processNames = None):
+    '''Write events as a Chrome trace-event JSON file. processNames is
+    {pid: name} for the processes in it. '''
+    meta = [processNameEvent(pid, name)
+            for pid, name in sorted((processNames or {}).items())]
+    events = sorted(events, key = lambda event: (event['pid'], event['ts'],
+                                                 -event['dur']))
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': meta + events,
+                   'displayTimeUnit': 'ms'}, f)
+
+
+def spanSummary(events):
+    '''Summarize where the time went: the count, total and mean time of
+    each kind of span, longest total first. Spans nest, so the totals
+    overlap. '''
+    byName = {}
+    for event in events:
+        byName.setdefault((event['cat'], event['name']), []).append(
+            event['dur'] / 1000000.0)
+    lines = ['Span timings:']
+    totals = sorted([(sum(times), key, times)
+                     for key, times in byName.items()], reverse = True)
+    for total, (cat, name), times in totals:
+        lines.append('  %s (%s): %s spans, mean %.3fs, total %.3fs'
+                     % (name, cat, len(times), total / len(times), total))
+    if not totals:
+        lines.append('  No spans recorded')
+    return '\n'.join(lines)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+import json
+
+# Worker result protocol
+#
+# Workers (main.py --single/--queue) write one JSON record per line to
+# stdout as they go, flushing after each one, so the parent sees results
+# as soon as each pair is done and keeps everything a worker finished even
+# if it crashes later. Every record has a "type":
+#     ready: the worker has got through a stage of starting up. Has stage,
+#            which is "driver" once its browser is up and "landing" once
+#            its first landing page has loaded, and time, the seconds that
+#            stage took.
+#     pair: one user/date pair was tested. Has user, date, diffs (list of
+#           diffRecords as given by toData, see diffs.py), timings
+#           ({phase: seconds}), hung (names of cards that didn't finish
+#           loading) and errors (tracebacks).
+#     spans: timing spans the worker recorded (see perf.py). Has events, a
+#            list of Chrome trace events. Only sent if spans are enabled.
+#     commands: WebDriver command counts (see commands.py). Has counts, as
+#               given by commandCounter.drain. Only sent if counting is
+#               enabled.
+#     error: something went wrong outside of any one pair. Has text.
+#     done: the worker finished cleanly. Has pairs, the number it tested.
+# Any other line the parent gets (e.g. a stray print) is read as an
+# output record with the line as its text.
+
+
+def pairRecord(user, date, diffs, timings, hung, errors):
+    '''Make a record for a tested pair. '''
+    return {
+        'type': 'pair',
+        'user': user,
+        'date': str(date),
+        'diffs': diffs,
+        'timings': timings,
+        'hung': hung,
+        'errors': errors,
+    }
+
+
+def readyRecord(stage, seconds):
+    '''Make a record for a worker getting through a stage of starting
+    up. '''
+    return {'type': 'ready', 'stage': stage, 'time': seconds}
+
+
+def spansRecord(events):
+    '''Make a record for timing spans recorded since the last one. '''
+    return {'type': 'spans', 'events': events}
+
+
+def commandsRecord(counts):
+    '''Make a record for WebDriver commands counted since the last one. '''
+    return {'type': 'commands', 'counts': counts}
+
+
+def errorRecord(text):
+    '''Make a record for an error which isn't tied to a pair. '''
+    return {'type': 'error', 'text': text}
+
+
+def doneRecord(pairs):
+    '''Make the record a worker sends last when it finishes cleanly. '''
+    return {'type': 'done', 'pairs': pairs}
+
+
+def writeRecord(stream, record):
+    '''Write a record as one line, and flush it so the parent gets it right
+    away rather than when the buffer fills up. '''
+    stream.write(json.dumps(record) + '\n')
+    stream.flush()
+
+
+def readRecord(line):
+    '''Parse a line from a worker's stdout into a record. '''
+    line = line.rstrip('\n')
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None
+    if not isinstance(record, dict) or 'type' not in record:
+        record = {'type': 'output', 'text': line}
+    return record
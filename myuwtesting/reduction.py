@@ -0,0 +1,86 @@
+#!/usr/bin/python
+
+from .classes import myuwDate
+from .testconfig import overrideCosts
+from .timeline import getTimeline
+
+# Date reduction for auto date runs
+#
+# getTestDates gives every significant date of every card, which includes
+# a date just before, at the start, at the end and just after each range.
+# Many of those dates have exactly the same expected cards with the same
+# expected content for a user. Dates are grouped into runs of consecutive
+# dates with the same expected state, and only the first and last date of
+# each run are kept, so the dates on both sides of every change are still
+# tested.
+
+
+def expectedState(user, date):
+    '''What testing user on date would check: the expected cards, and each
+    one's dateState. Dates whose expected state can't be worked out get one
+    of their own. '''
+    try:
+        cards = getTimeline().getExpectedResults(user, date)
+        return [(name, id(card), card.dateState(date))
+                for name, card in sorted(cards.items())]
+    except Exception:
+        return ('unknown', str(date))
+
+
+def reduceDates(user, dates):
+    '''Reduce a user's test dates to the first and last of each run of
+    dates with the same expected state. Returns (kept, removed) lists, each
+    in date order. '''
+    # [state, dates] for each run
+    runs = []
+    for date in sorted(dates, key=myuwDate):
+        state = expectedState(user, date)
+        if runs and state == runs[-1][0]:
+            runs[-1][1].append(date)
+        else:
+            runs.append([state, [date]])
+
+    kept = []
+    removed = []
+    for state, run in runs:
+        kept.append(run[0])
+        if len(run) > 1:
+            kept.append(run[-1])
+        removed.extend(run[1:-1])
+    return kept, removed
+
+
+def reduceTestDates(testDates):
+    '''Reduce the dates for every user in testDates ({user: [dates]}).
+    Returns the reduced dictionary, and a dictionary of the dates removed
+    for each user. '''
+    reduced = {}
+    removed = {}
+    for user, dates in testDates.items():
+        reduced[user], removed[user] = reduceDates(user, dates)
+    return reduced, removed
+
+
+def reductionReport(testDates, removed, pairCost=None, costs=overrideCosts):
+    '''Describe how many pairs reducing testDates would remove, and roughly
+    how much time that would save. pairCost, if given, estimates the time
+    to test a pair, as with schedulePairs. Each removed pair also saves a
+    date override. '''
+    total = sum([len(dates) for dates in testDates.values()])
+    removedCount = sum([len(dates) for dates in removed.values()])
+    saved = 0
+    for user, dates in removed.items():
+        for date in dates:
+            if pairCost is None:
+                saved += costs['page']
+            else:
+                saved += pairCost(user, date)
+            saved += costs['date']
+
+    lines = ['Date reduction would skip %s of %s pairs, saving about %.1f '
+             'minutes' % (removedCount, total, saved / 60.0)]
+    for user, dates in sorted(removed.items()):
+        if dates:
+            lines.append('    %s: %s' % (
+                user, ', '.join([str(myuwDate(date)) for date in dates])))
+    return '\n'.join(lines)
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+from .classes import myuwDate
+from .testconfig import overrideCosts
+
+# Scheduling of user/date pairs across parallel workers
+#
+# Each worker has to override the user whenever it moves on to a different
+# user, and the date whenever it moves on to a different date. A change of
+# time on the same day is still a date override, but it is counted
+# separately since RegStatusCard's significant dates are minutes apart.
+
+
+def overrideKind(curUser, curDate, user, date):
+    '''What overrides are needed to go from one pair to the next. Returns a
+    (userOverride, dateKind) tuple, where dateKind is 'date', 'time' or
+    None. '''
+    userOverride = (user != curUser)
+    if date == curDate:
+        dateKind = None
+    elif (date.year, date.month, date.day) == \
+            (curDate.year, curDate.month, curDate.day):
+        dateKind = 'time'
+    else:
+        dateKind = 'date'
+    return userOverride, dateKind
+
+
+def countOverrides(chunk, startUser, startDate):
+    '''Count the overrides needed to test the (user, date) pairs in chunk in
+    order, starting from startUser and startDate. Returns a dictionary of
+    'user', 'date' and 'time' counts. '''
+    counts = {'user': 0, 'date': 0, 'time': 0}
+    curUser = startUser
+    curDate = myuwDate(startDate)
+    for user, date in chunk:
+        date = myuwDate(date)
+        userOverride, dateKind = overrideKind(curUser, curDate, user, date)
+        if userOverride:
+            counts['user'] += 1
+        if dateKind:
+            counts[dateKind] += 1
+        curUser = user
+        curDate = date
+    return counts
+
+
+def chunkCost(chunk, startUser, startDate, pairCost=None, costs=overrideCosts):
+    '''Estimated time to test the pairs in chunk in order. pairCost, if
+    given, is called with (user, date) to estimate the time to load, parse
+    and check that pair. Otherwise costs['page'] is used for every pair. '''
+    counts = countOverrides(chunk, startUser, startDate)
+    total = sum([costs[kind] * count for kind, count in counts.items()])
+    if pairCost is None:
+        total += costs['page'] * len(chunk)
+    else:
+        total += sum([pairCost(user, date) for user, date in chunk])
+    return total
+
+
+def schedulePairs(pairs, n, startUser, startDate, pairCost=None,
+                  costs=overrideCosts, tolerance=0.1):
+    '''Order (user, date) pairs and divide them among n workers so that each
+    worker does as few user/date overrides as possible while the workers'
+    estimated run times stay balanced. Returns a list of at most n chunks,
+    each a list of (user, date) pairs in the order they should be tested.
+
+    Pairs are grouped by user (starting with the user the browser starts
+    on) with each user's dates in order, then cut into n contiguous chunks
+    of roughly equal estimated cost. Each chunk's cost counts its first
+    overrides from startUser and startDate, where the worker which gets it
+    starts. A cut which lands within tolerance (as a fraction of one
+    worker's share) of the boundary between two users is moved onto that
+    boundary, so that user isn't split between two workers for the sake of
+    a small imbalance. '''
+    byUser = {}
+    for user, date in pairs:
+        byUser.setdefault(user, {})
+        # Use the string form to drop duplicate dates
+        byUser[user].setdefault(str(myuwDate(date)), date)
+
+    ordered = []
+    for user in sorted(byUser, key=lambda u: (u != startUser, u)):
+        # Sorting by date keeps times on the same day next to each other
+        for date in sorted(byUser[user].values(), key=myuwDate):
+            ordered.append((user, date))
+    if not ordered:
+        return []
+
+    # Cost of each pair after the one before it (linked), and as the first
+    # pair of a chunk (fresh), since each chunk goes to a worker which
+    # starts from startUser and startDate. Also where users change.
+    linked = []
+    fresh = []
+    boundaries = set()
+    prevUser, prevDate = startUser, startDate
+    for i, (user, date) in enumerate(ordered):
+        if i and user != prevUser:
+            boundaries.add(i)
+        linked.append(chunkCost([(user, date)], prevUser, prevDate,
+                                pairCost, costs))
+        fresh.append(chunkCost([(user, date)], startUser, startDate,
+                               pairCost, costs))
+        prevUser, prevDate = user, date
+
+    # Cost of the pairs from each pair on, each following the one before
+    suffix = [0] * (len(ordered) + 1)
+    for i in reversed(range(len(ordered))):
+        suffix[i] = suffix[i + 1] + linked[i]
+
+    def rest(i):
+        '''Cost of the pairs from i on, given to a fresh worker. '''
+        if i == len(ordered):
+            return 0
+        return fresh[i] + suffix[i + 1]
+
+    # Cut one chunk at a time, each as close as it can get to the share
+    # each of the workers after it gets of the pairs left after it
+    cuts = []
+    start = 0
+    for k in range(1, n):
+        share = rest(start) / float(n - k + 1)
+        # How much more the chunk would cost than that share, if it was cut
+        # before each pair after start. This only goes up.
+        gaps = {}
+        cost = fresh[start]
+        for b in range(start + 1, len(ordered) + 1):
+            gaps[b] = cost - rest(b) / float(n - k)
+            if gaps[b] > share * tolerance or b == len(ordered):
+                break
+            cost += linked[b]
+
+        def closest(cuts):
+            return min(cuts, key=lambda b: (abs(gaps[b]), b))
+        cut = closest(gaps)
+
+        # Snap to a nearby boundary between users
+        near = [b for b in gaps
+                if b in boundaries and abs(gaps[b]) <= share * tolerance]
+        if near:
+            cut = closest(near)
+
+        if cut >= len(ordered):
+            break
+        cuts.append(cut)
+        start = cut
+
+    chunks = []
+    start = 0
+    for cut in cuts + [len(ordered)]:
+        chunks.append(ordered[start:cut])
+        start = cut
+    return chunks
+
+
+def scheduleReport(chunks, baseChunks, startUser, startDate):
+    '''Describe how many overrides chunks needs, compared to baseChunks
+    (e.g. the pairs split up in order with splitList). '''
+    def totals(chunkList):
+        counts = {'user': 0, 'date': 0, 'time': 0}
+        for chunk in chunkList:
+            for kind, count in countOverrides(chunk, startUser,
+                                              startDate).items():
+                counts[kind] += count
+        return counts
+
+    counts = totals(chunks)
+    baseCounts = totals(baseChunks)
+    total = sum(counts.values())
+    saved = sum(baseCounts.values()) - total
+    return ('Scheduled %s pairs across %s workers with %s overrides '
+            '(%s user, %s date, %s time), %s fewer than splitting in order'
+            % (sum([len(c) for c in chunks]), len(chunks), total,
+               counts['user'], counts['date'], counts['time'], saved))
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+
+import errno
+import heapq
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+import traceback
+
+# Event loop for supervising worker processes
+#
+# Reads every worker's stdout and stderr as soon as there is anything to
+# read, so a worker never blocks on a full pipe and the parent doesn't need
+# a thread per pipe or a polling loop. Lines and exits are passed to the
+# callbacks as they happen, and delayed calls (e.g. staggered worker
+# starts) are timers in the same loop rather than sleeps.
+#
+# Processes can either be started from a command line (spawn), or be forked
+# copies of this process which run a function (fork). Forked processes
+# start with everything this process has already imported and built.
+
+
+class forkedProcess(object):
+    '''Handle for a process started with os.fork, with the parts of the
+    subprocess.Popen interface the supervisor uses. '''
+
+    def __init__(self, pid, stdout, stderr):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+
+    def setStatus(self, status):
+        '''Set returncode from a wait status, the same way Popen does. '''
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                # Already reaped somewhere else
+                self.returncode = 0
+            else:
+                if pid == self.pid:
+                    self.setStatus(status)
+        return self.returncode
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.ECHILD:
+                    raise
+                self.returncode = 0
+            else:
+                self.setStatus(status)
+        return self.returncode
+
+    def terminate(self):
+        os.kill(self.pid, signal.SIGTERM)
+
+
+class supervisedProcess(object):
+    '''A process started by a workerSupervisor. '''
+
+    def __init__(self, proc, data):
+        self.proc = proc
+        # Whatever the caller wants to keep with the process
+        self.data = data
+        # fd -> stream name, for the pipes that are still open
+        self.streams = {}
+        # fd -> file object
+        self.files = {}
+        # fd -> partial line read so far
+        self.buffers = {}
+        self.exited = False
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+
+class workerSupervisor(object):
+    '''Starts worker processes and runs the loop which handles their output.
+
+    onLine(process, stream, line) is called for each complete line a process
+    writes, where stream is 'stdout' or 'stderr'. onExit(process) is called
+    once a process has exited and all of its output has been handled. '''
+
+    # Longest time to block waiting for output, so exits are noticed even
+    # if something else holds a worker's pipes open
+    pollInterval = 1.0
+    # Time to give processes to exit after SIGTERM before killing them
+    killGrace = 5.0
+
+    def __init__(self, onLine, onExit, deadline=None):
+        '''deadline: seconds from now after which every process is stopped,
+        or None for no deadline. '''
+        self.onLine = onLine
+        self.onExit = onExit
+        self.deadline = None
+        if deadline:
+            self.deadline = time.time() + deadline
+        self.processes = []
+        # fd -> supervisedProcess
+        self.fds = {}
+        # Heap of (when, order, func)
+        self.timers = []
+        self.timerCount = 0
+        # Why the processes were stopped, if they were
+        self.cancelled = None
+        self.killAt = None
+
+    def spawn(self, args, data=None, **popenArgs):
+        '''Start a process with its stdout and stderr piped to us. data is
+        kept as the process's data attribute. '''
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, **popenArgs)
+        return self.addProcess(proc, data)
+
+    def fork(self, target, data=None, env=None, preexec_fn=None):
+        '''Start a forked copy of this process which calls target() and
+        exits, with its stdout and stderr piped to us. If env is given, it
+        replaces the child's environment. preexec_fn is called in the child
+        before target, as with spawn. Not available on Windows. '''
+        outRead, outWrite = os.pipe()
+        errRead, errWrite = os.pipe()
+        # Anything still buffered would otherwise be written by both of us
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self.runChild(target, env, preexec_fn,
+                          [outRead, errRead] + list(self.fds),
+                          outWrite, errWrite)
+
+        os.close(outWrite)
+        os.close(errWrite)
+        proc = forkedProcess(pid, os.fdopen(outRead, 'rb'),
+                             os.fdopen(errRead, 'rb'))
+        return self.addProcess(proc, data)
+
+    @staticmethod
+    def runChild(target, env, preexec_fn, closeFds, outFd, errFd):
+        '''Run target in a forked child, and exit without ever returning to
+        the caller (whose event loop belongs to the parent). '''
+        code = 1
+        try:
+            os.dup2(outFd, 1)
+            os.dup2(errFd, 2)
+            for fd in closeFds + [outFd, errFd]:
+                os.close(fd)
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+            if preexec_fn is not None:
+                preexec_fn()
+            target()
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def addProcess(self, proc, data):
+        '''Start handling the output of a process we've started. '''
+        process = supervisedProcess(proc, data)
+        for name, stream in (('stdout', proc.stdout),
+                             ('stderr', proc.stderr)):
+            fd = stream.fileno()
+            process.streams[fd] = name
+            process.files[fd] = stream
+            process.buffers[fd] = ''
+            self.fds[fd] = process
+        self.processes.append(process)
+        return process
+
+    def callLater(self, delay, func):
+        '''Call func from the loop after delay seconds. '''
+        self.timerCount += 1
+        heapq.heappush(self.timers,
+                       (time.time() + delay, self.timerCount, func))
+
+    def cancel(self, reason):
+        '''Stop every process and any pending timers. The reason is kept in
+        the cancelled attribute, for onExit to see. '''
+        if self.cancelled is None:
+            self.cancelled = reason
+        self.timers = []
+        for process in self.processes:
+            if not process.exited and process.proc.poll() is None:
+                try:
+                    process.proc.terminate()
+                except OSError:
+                    pass
+        self.killAt = time.time() + self.killGrace
+
+    def running(self):
+        '''Check if there is anything left for the loop to do. '''
+        return bool(self.timers) or \
+            any([not p.exited for p in self.processes])
+
+    def run(self):
+        '''Run the loop until every process has exited and every timer has
+        gone off. If interrupted (e.g. with ctrl-c), the processes are
+        stopped before the exception is passed on. '''
+        try:
+            while self.running():
+                self.runOnce()
+        except BaseException:
+            self.cancel('interrupted')
+            self.reapAll()
+            raise
+
+    def runOnce(self):
+        '''Wait for output or the next timer, and handle whatever is
+        ready. '''
+        now = time.time()
+        if self.deadline is not None and now >= self.deadline:
+            self.deadline = None
+            self.cancel('deadline')
+        if self.cancelled is not None and time.time() >= self.killAt:
+            self.killAll()
+
+        timeout = self.pollInterval
+        if self.timers:
+            timeout = min(timeout, max(0, self.timers[0][0] - now))
+        if self.deadline is not None:
+            timeout = min(timeout, max(0, self.deadline - now))
+
+        if self.fds:
+            try:
+                ready = select.select(list(self.fds), [], [], timeout)[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+        else:
+            time.sleep(timeout)
+            ready = []
+
+        for fd in ready:
+            self.readFd(fd)
+
+        while self.timers and self.timers[0][0] <= time.time():
+            func = heapq.heappop(self.timers)[2]
+            func()
+
+        self.checkExits()
+
+    def readFd(self, fd):
+        '''Read what's available on fd and pass on any complete lines. '''
+        process = self.fds[fd]
+        try:
+            data = os.read(fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ''
+
+        stream = process.streams[fd]
+        if not data:
+            # EOF, so pass on anything left without a newline
+            rest = process.buffers.pop(fd)
+            if rest:
+                self.onLine(process, stream, rest)
+            self.closeFd(fd)
+            return
+
+        lines = (process.buffers[fd] + data).split('\n')
+        process.buffers[fd] = lines.pop()
+        for line in lines:
+            self.onLine(process, stream, line + '\n')
+
+    def closeFd(self, fd):
+        process = self.fds.pop(fd)
+        del process.streams[fd]
+        process.buffers.pop(fd, None)
+        process.files.pop(fd).close()
+
+    def checkExits(self):
+        '''Handle processes which have closed their pipes, or have exited
+        while something else (like a browser they started) still holds
+        their pipes open. '''
+        for process in self.processes:
+            if process.exited or process.proc.poll() is None:
+                continue
+            if process.streams:
+                # Read what's left without blocking, then stop listening
+                for fd in list(process.streams):
+                    while fd in process.streams and \
+                            select.select([fd], [], [], 0)[0]:
+                        self.readFd(fd)
+                    if fd in process.streams:
+                        rest = process.buffers.get(fd)
+                        if rest:
+                            self.onLine(process, process.streams[fd], rest)
+                        self.closeFd(fd)
+            process.exited = True
+            self.onExit(process)
+
+    def killAll(self):
+        '''Kill processes that didn't exit after being terminated. '''
+        for process in self.processes:
+            if not process.exited and process.proc.poll() is None:
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+    def reapAll(self):
+        '''Wait for every process after cancelling, without handling any
+        more output. '''
+        end = time.time() + self.killGrace
+        for process in self.processes:
+            while process.proc.poll() is None and time.time() < end:
+                time.sleep(0.1)
+        self.killAll()
+        for process in self.processes:
+            process.proc.wait()
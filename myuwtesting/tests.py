@@ -5,29 +5,40 @@ import time
 import os
 import sys
 import traceback
-import json
-import subprocess
 
 from selenium.webdriver import Firefox, Chrome, PhantomJS
+from selenium.common.exceptions import WebDriverException
 
 
 from .classes import myuwDate
 from .exceptions import LandingWaitTimedOut
-from .functions import splitList, driverRetry
+from .functions import splitList, driverRetry, driverRss
 from . import expected
 from .testconfig import parallel, perf, defaultStartDate, defaultEndDate
 from . import testconfig
 from .handler import mainMyuwHandler
+from .schedule import schedulePairs, scheduleReport
+from .dispatch import pairDispatcher, serveDispatcher, connectDispatcher, \
+    dispatchKeyVar
+from .history import loadHistory, saveHistory, mergeTimings, pairEstimator, \
+    median
+from .perf import perfCounter, tracer, span, sleep, writeTrace, \
+    spanSummary
+from .protocol import pairRecord, readyRecord, spansRecord, commandsRecord, \
+    errorRecord, doneRecord, writeRecord, readRecord
+from .commands import counter, instrumentDriver
+from .supervisor import workerSupervisor
+from .concurrency import concurrencyController
+from .timeline import getTimeline
+from .reduction import reduceTestDates
+from .diffs import diffRecord, errorDiff, formatRecords, diffRuns, \
+    writeJson, writeJUnit
 
 
 def getTestDates(start = defaultStartDate, end = defaultEndDate):
     '''Get test dates based off expected cards and known dates. '''
-    userList = expected.cardList.keys()
-    tcDict = {}
-    for user in userList:
-        sd = expected.getSigDates(user, start, end, True)
-        tcDict[user] = sd
-    return tcDict
+    sigDates = expected.getAllSigDates(start, end, True)
+    return dict([(user, list(dates)) for user, dates in sigDates.items()])
 
 
 class mainMyuwTestCase(unittest.TestCase):
@@ -57,31 +68,88 @@ class mainMyuwTestCase(unittest.TestCase):
             self.driverSetup()
         self.diffs = {}
         self.errors = []
+        self.driverRestarts = 0
+        self.hungCards = []
+        # Phase timings for each pair: {user: {date: {phase: seconds}}}
+        self.timings = {}
 
     def checkPara(self):
         return testconfig.parallel
 
     def driverSetup(self):
-        self.driver = driverRetry(self.driverFunc)
-        self.driver.maximize_window()
+        with span('driver start', 'driver'):
+            self.driver = driverRetry(self.driverFunc)
+            if testconfig.countCommands:
+                instrumentDriver(self.driver)
+            self.driver.maximize_window()
         self.pageHandler = mainMyuwHandler(self.driver, self.baseUrl,
             self.defaultDate, self.defaultUser)
 
         self.currentUser = self.defaultUser
         self.currentDate = self.defaultDate
-
+        # Page loads since this driver was started
+        self.pageLoads = 0
 
     def tearDown(self):
         if not(self.parallel):
+            self.reportPerf()
             self.driverTeardown()
 
+    def reportPerf(self):
+        '''Print timing information if the perf option is set. '''
+        if perf:
+            print self.pageHandler.overrideTimingReport()
+            print 'Restarted the browser %s times' % self.driverRestarts
+
     def driverTeardown(self):
-        self.driver.close()
+        with span('driver quit', 'driver'):
+            self.driver.quit()
+
+    def driverAlive(self):
+        '''Check if the browser is still responding. '''
+        try:
+            self.driver.current_url
+        except Exception:
+            return False
+        return True
+
+    def restartDriver(self):
+        '''Replace the driver with a fresh one. The new browser has no
+        overrides, so the page handler starts over from the defaults. '''
+        overrideTimes = self.pageHandler.overrideTimes
+        try:
+            self.driverTeardown()
+        except Exception:
+            # It's probably already dead
+            pass
+        self.driverSetup()
+        self.pageHandler.overrideTimes = overrideTimes
+        self.driverRestarts += 1
+
+    def recycleDriverIfNeeded(self):
+        '''Restart the driver if it has done driverMaxPages page loads, or
+        its processes are using more than driverMaxRss megabytes. '''
+        maxPages = testconfig.driverMaxPages
+        if maxPages and self.pageLoads >= maxPages:
+            self.restartDriver()
+            return
+
+        maxRss = testconfig.driverMaxRss
+        if maxRss:
+            rss = driverRss(self.driver)
+            if rss is not None and rss > maxRss * 1024 * 1024:
+                self.restartDriver()
 
     # Run tests and report discrepancies between expected and actual results
     def test_runtests(self):
-        self.runAllUsers()
-        diffs = self.getFormattedDiffs()
+        with span('run', 'run'):
+            self.runAllUsers()
+        self.reportSpans()
+        self.saveTimings(self.timings)
+        pairs = [(user, date) for user in self.usersToTest
+                 for date in self.testDates[user]]
+        self.writeDiffReports(pairs, self.timings)
+        diffs = self.getFormattedDiffs(pairs)
         if diffs:
             errString  = 'Found differences between actual and expected data:\n'
             errString += diffs
@@ -98,23 +166,114 @@ class mainMyuwTestCase(unittest.TestCase):
     def runTestsForUser(self, user):
         '''Run tests for a specific user'''
         dates = self.testDates[user]
-        self.setUser(user)
         for date in dates:
-            self.setDate(date)
+            self.runPair(user, date)
+
+    def runPair(self, user, date):
+        '''Run tests for one user and date. '''
+        with span('pair', 'pair', user=user, date=str(date)):
+            self._runPair(user, date)
+
+    def _runPair(self, user, date):
+        '''Run tests for one user and date. You probably want runPair
+        instead. If the browser dies along the way, start a new one and try
+        again (up to pairRetries times), so the rest of our pairs can still
+        be tested. '''
+        # Set these up front so errors get logged under the right pair
+        self.currentUser = user
+        self.currentDate = date
+        timings = {}
+        errors = []
+        self.hungCards = []
+        retries = testconfig.pairRetries
+        while True:
+            self.recycleDriverIfNeeded()
             try:
-                self.browseLanding()
-            except LandingWaitTimedOut as e:
-                pass
-                # Handled elsewhere now
+                self.loadPair(user, date, timings)
+            except Exception:
+                ei = sys.exc_info()
+                if retries > 0 and not(self.driverAlive()):
+                    retries -= 1
+                    self.restartDriver()
+                    continue
+                errors.append(''.join(traceback.format_exception(*ei)))
+                self.logDiffCurrent(
+                    'Encountered an error loading the page, the error '
+                    'was: \n%s' % errors[-1]
+                )
+                self.pairFinished(user, date, None, errors)
+                return
+            else:
+                break
 
+        timer = perfCounter()
+        with span('diff', 'diff'):
             try:
                 self.checkDiffs()
             except:
                 ei = sys.exc_info()
                 eifmtd = traceback.format_exception(*ei)
+                errors.append(''.join(eifmtd))
                 self.logDiffCurrent(
-                    'Encountered an error checking diffs, the error was: \n%s' %eifmtd
+                    'Encountered an error checking diffs, the error was: '
+                    '\n%s' %eifmtd
                 )
+        timings['diff'] = timer.endGetTime()
+        self.pairFinished(user, date, timings, errors)
+
+    def pairFinished(self, user, date, timings, errors):
+        '''Called once a pair is done. timings is None if the page could
+        not be loaded, in which case the timings would be misleading. '''
+        if timings is not None:
+            self.timings.setdefault(user, {})[str(date)] = timings
+
+    def loadPair(self, user, date, timings = None):
+        '''Override user and date, then load and parse the landing page.
+        If timings is given, the time taken by each phase is stored in it.
+        '''
+        if timings is None:
+            timings = {}
+        timer = perfCounter()
+        with span('override', 'override'):
+            self.setUser(user)
+            self.setDate(date)
+        timings['override'] = timer.endGetTime()
+
+        timer = perfCounter()
+        self.pageLoads += 1
+        # Names of cards that didn't finish loading
+        self.hungCards = []
+        with span('landing', 'landing'):
+            try:
+                self.browseLanding()
+            except LandingWaitTimedOut as e:
+                # Reported as diffs elsewhere
+                self.hungCards = e.cardsNotLoaded
+        timings['load'] = timer.endGetTime()
+
+        # Parse now rather than in checkDiffs, so that a browser which
+        # died will show up here
+        timer = perfCounter()
+        with span('parse', 'parse'):
+            self.pageHandler.cards
+        timings['parse'] = timer.endGetTime()
+
+    @staticmethod
+    def saveTimings(timings):
+        '''Add pair timings to the run history file, if there is one. '''
+        if not testconfig.historyFile or not timings:
+            return
+        history = loadHistory(testconfig.historyFile)
+        mergeTimings(history, timings)
+        saveHistory(history, testconfig.historyFile)
+
+    @staticmethod
+    def pairEstimator():
+        '''Get a pairEstimator based on the run history file. '''
+        history = {}
+        if testconfig.historyFile:
+            history = loadHistory(testconfig.historyFile)
+        return pairEstimator(history, testconfig.overrideCosts['page'])
 
     def browseLanding(self):
         '''Browse the landing page'''
@@ -136,55 +295,90 @@ class mainMyuwTestCase(unittest.TestCase):
 
     # Report differences
     def logDiffs(self, user, date, diffs):
-        '''Given a username, date, and string of differences, put these
-        differences in the appropriate location in the diffs dictionary,
-        with each line being considered a different diff. '''
+        '''Given a username, date, and either a list of diffRecords or a
+        string describing a problem, put these differences in the
+        appropriate location in the diffs dictionary. '''
+        if isinstance(diffs, basestring):
+            diffs = [errorDiff(diffs)] if diffs.strip() else []
         if diffs:
-            # Might get more than one at a time, separated
-            # by linefeeds.
-            for diff in diffs.split('\n'):
-                # Ignore empty lines
-                if diff:
-                    # Make sure user exists in diffs dictionary, else create
-                    if user not in self.diffs:
-                        self.diffs[user] = {}
-                    userDiffs = self.diffs[user]
-                    # Make sure date exists in user's dictionary
-                    if date not in userDiffs:
-                        userDiffs[date] = []
-                    dateDiffs = userDiffs[date]
-
-                    # Add diff
-                    dateDiffs.append(diff)
-
-    def getFormattedDiffs(self):
-        '''Returns formatted version of the diff dictionary. '''
-        return self.formatDiffsFull(self.diffs)
+            for diff in diffs:
+                diff.user = user
+                diff.date = date
+            # Make sure user and date exist in diffs dictionary, else
+            # create them
+            userDiffs = self.diffs.setdefault(user, {})
+            userDiffs.setdefault(date, []).extend(diffs)
+
+    def getFormattedDiffs(self, pairs = None):
+        '''Returns formatted version of the diff dictionary. pairs is every
+        (user, date) pair tested, so that a date which passed splits up the
+        ranges of dates that repeated diffs are reported over. '''
+        testedDates = None
+        if pairs is not None:
+            testedDates = {}
+            for user, date in pairs:
+                testedDates.setdefault(user, []).append(date)
+        return self.formatDiffsFull(self.diffs,
+                                    compress = testconfig.compressDiffs,
+                                    testedDates = testedDates)
 
     @staticmethod
-    def formatDiffsFull(diffs, indentChar = '  '):
+    def formatDiffsFull(diffs, indentChar = '  ', compress = False,
+                        testedDates = None):
         '''Given a diff dictionary, format them with indentChar used to
-        indicate nesting. '''
-        diffStr = ''
+        indicate nesting. If compress is set, the same diff on a run of
+        consecutive tested dates (by default, dates in diffs) is only shown
+        once for the whole run. testedDates is {user: [dates]}. '''
+        lines = []
         # Use myuwDate to sort the dates, since a string won't necessarily
         # do that (e.g. "2013-12-20" < "2013-6-20")
         dateSortKey = lambda date: myuwDate(date)
         for user, dates in sorted(diffs.items()):
-            diffStr += 'Failures for user %s:\n' %user
-
-            for date in sorted(dates.keys(), key = dateSortKey):
-                diffs = dates[date]
-                diffStr += '\tOn date %s:\n' %date
-
-                for diff in diffs:
-                    # Newline is already there
-                    for diffline in diff.splitlines():
-                        diffLine = '\t\t' + diffline + '\n'
-                        #diffStr += indentChar + '%s\n' %diff
-                        diffStr += diffLine
-        diffStr = diffStr.replace('\t', indentChar)
-        return diffStr
+            lines.append('Failures for user %s:' %user)
 
+            if compress:
+                runs = diffRuns(dates, (testedDates or {}).get(user))
+            else:
+                runs = [(date, date, 1, dates[date])
+                        for date in sorted(dates.keys(), key = dateSortKey)]
+            for first, last, count, records in runs:
+                if count == 1:
+                    lines.append('\tOn date %s:' %first)
+                else:
+                    lines.append('\tOn dates %s .. %s (%s dates):'
+                                 % (first, last, count))
+                lines.extend(['\t\t' + line
+                              for line in formatRecords(records)])
+        if not lines:
+            return ''
+        return '\n'.join(lines).replace('\t', indentChar) + '\n'
+
+    def reportSpans(self, processNames = None):
+        '''Write every timing span recorded in this process (including any
+        merged in from workers) to testconfig.traceFile if it is set, and
+        print a summary of them if the perf option is set. Also prints the
+        WebDriver command counts if countCommands is set. processNames is
+        {pid: name} for the trace. '''
+        events = tracer.drain()
+        if testconfig.traceFile:
+            names = {os.getpid(): 'main'}
+            names.update(processNames or {})
+            writeTrace(testconfig.traceFile, events, names)
+        if perf:
+            print spanSummary(events)
+        if testconfig.countCommands:
+            print counter.report()
+
+    def writeDiffReports(self, pairs, timings):
+        '''Write the diffs to testconfig.diffJson and testconfig.diffJUnit,
+        if they are set. pairs is every (user, date) pair tested, and
+        timings the phase timings for each. '''
+        if testconfig.diffJson:
+            with open(testconfig.diffJson, 'w') as f:
+                writeJson(f, self.diffs)
+        if testconfig.diffJUnit:
+            with open(testconfig.diffJUnit, 'w') as f:
+                writeJUnit(f, pairs, self.diffs, timings)
 
     # Log diff for the current user and date
     def logDiffCurrent(self, diff):
@@ -203,7 +397,8 @@ class mainMyuwTestCase(unittest.TestCase):
             ei = sys.exc_info()
             self.logDiffCurrent(''.join(traceback.format_exception(*ei)))
         else:
-            expectedCards = expected.getExpectedResults(self.currentUser, self.currentDate)
+            expectedCards = getTimeline().getExpectedResults(
+                self.currentUser, self.currentDate)
             #if perf:
             #   diffTimer = perfCounter('Diff checking')
             diffs = expected.findDiffs(expectedCards, actualCards)
@@ -214,26 +409,162 @@ class mainMyuwTestCase(unittest.TestCase):
 
 
 class jsonMyuwTestCase(mainMyuwTestCase):
-    def getJsonDiffs(self):
-        '''Dump raw diff dictionary as json. Return None if there are no diffs. '''
-        diffDict = self.diffs
-        if diffDict:
-            return json.dumps(diffDict)
-        else:
-            return None
+    '''Test case which reports each pair on stdout as it finishes, using
+    the records in protocol. '''
+
+    def setUp(self):
+        timer = perfCounter()
+        super(jsonMyuwTestCase, self).setUp()
+        writeRecord(sys.stdout, readyRecord('driver', timer.endGetTime()))
+        self.landingReady = False
+
+    def loadPair(self, user, date, timings = None):
+        '''Load the pair, and report that we're ready once the first landing
+        page has loaded. '''
+        if timings is None:
+            timings = {}
+        super(jsonMyuwTestCase, self).loadPair(user, date, timings)
+        if not self.landingReady:
+            self.landingReady = True
+            writeRecord(sys.stdout, readyRecord('landing', timings['load']))
+
+    def runPair(self, user, date):
+        '''Run the pair, then send the spans it recorded and the commands
+        it counted. '''
+        super(jsonMyuwTestCase, self).runPair(user, date)
+        sendSpans()
+        sendCommandCounts()
+
+    def pairFinished(self, user, date, timings, errors):
+        '''Report the pair, then forget it so memory use stays flat. '''
+        diffs = [diff.toData()
+                 for diff in self.diffs.get(user, {}).pop(date, [])]
+        writeRecord(sys.stdout, pairRecord(
+            user, date, diffs, timings or {},
+            self.hungCards, errors))
+        self.pairsDone += 1
 
     def _test_json_out(self):
         '''Run tests, but report results in json.'''
+        self.pairsDone = 0
         self.runAllUsers()
-        diffs = self.getJsonDiffs()
-        if diffs:
-            print diffs
 
     def checkPara(self):
         return False
 
+    def reportPerf(self):
+        '''stdout is reserved for the json results in this mode. '''
+        pass
+
+def sendSpans():
+    '''Send the parent any timing spans recorded since last time. '''
+    events = tracer.drain()
+    if events:
+        writeRecord(sys.stdout, spansRecord(events))
+
+
+def sendCommandCounts():
+    '''Send the parent any WebDriver commands counted since last time. '''
+    counts = counter.drain()
+    if counts:
+        writeRecord(sys.stdout, commandsRecord(counts))
+
+
+def runJsonTest(test):
+    '''Run a jsonMyuwTestCase instance as a worker. unittest's own output
+    is thrown away, and any errors or failures are reported as records
+    instead, followed by a done record. '''
+    # A forked worker starts with whatever spans and counts the parent had,
+    # and with the parent's open spans (e.g. the run), which its own spans
+    # and commands must not be put down to
+    tracer.drain()
+    tracer.stack = []
+    counter.drain()
+    with open(os.devnull, 'w') as devnull:
+        result = unittest.TextTestRunner(stream = devnull).run(test)
+    for failedTest, text in result.errors + result.failures:
+        writeRecord(sys.stdout, errorRecord(text))
+    sendSpans()
+    sendCommandCounts()
+    writeRecord(sys.stdout, doneRecord(getattr(test, 'pairsDone', 0)))
+
+
+def runSingleWorker(pairs):
+    '''Run a worker which tests the given (user, date string) pairs, as
+    with --single. '''
+    userDates = {}
+    for user, date in pairs:
+        userDates.setdefault(user, []).append(date)
+
+    class singleTestCase(jsonMyuwTestCase):
+        '''Test class for --single mode'''
+        testDates = userDates
+        usersToTest = userDates.keys()
+
+    runJsonTest(singleTestCase('_test_json_out'))
+
+
+def runQueueWorker(address):
+    '''Run a worker which takes its pairs from the dispatcher at address, a
+    (host, port) tuple, as with --queue. '''
+    class queueTestCase(queueMyuwTestCase):
+        '''Test class for --queue mode'''
+        dispatchAddress = address
+
+    runJsonTest(queueTestCase('_test_json_out'))
+
+
+class queueMyuwTestCase(jsonMyuwTestCase):
+    '''Worker for queue dispatch mode. Instead of having fixed testDates,
+    keeps taking batches of pairs from the parent's dispatcher until there
+    are none left. Subclasses should set dispatchAddress. '''
+    # (host, port) of the parent's dispatcher
+    dispatchAddress = None
+
+    def runAllUsers(self):
+        '''Run tests for every pair the dispatcher gives us. '''
+        dispatcher = connectDispatcher(self.dispatchAddress,
+                                       os.environ[dispatchKeyVar])
+        workerId = os.getpid()
+        while True:
+            batch = dispatcher.take(workerId, self.currentUser)
+            if batch is None:
+                # Too many other workers are busy right now
+                sleep(testconfig.queueWaitTime, 'queue wait sleep')
+                continue
+            if not batch:
+                break
+            for user, date in batch:
+                self.runPair(user, date)
+
+
+class workerProcess(object):
+    '''What we know about a worker process, kept as the data of its
+    supervisedProcess. '''
+
+    def __init__(self, args, env = None, pairs = None):
+        '''args, env: what it was started with, to start a replacement.
+        pairs: the (user, date string) pairs it was given, if they were
+        given up front. '''
+        self.args = args
+        self.env = env
+        self.pairs = pairs
+        # (user, date string) pairs it has reported
+        self.reported = set()
+        self.stderr = []
+        # Whether it sent a done record
+        self.finished = False
+        self.startTime = time.time()
+
+
 class parallelTestCase(mainMyuwTestCase):
 
+    # Diffs for untested pairs when the supervisor stopped the workers
+    cancelReasons = {
+        'deadline': 'Not tested because the run went past runDeadline',
+        'interrupted': 'Not tested because the run was interrupted',
+    }
+
     @staticmethod
     def mergeDiffs(diffDicts):
         '''Merge multiple dicts of differences together. '''
@@ -251,6 +582,219 @@ class parallelTestCase(mainMyuwTestCase):
 
         return out
 
+    def startWorker(self, args, env = None, pairs = None):
+        '''Start a worker with the given main.py arguments. With
+        workerStart = 'fork', the worker is forked from this process and
+        given its pairs (or the dispatcher's address) directly rather than
+        through the arguments. Its output is handled by the supervisor from
+        then on. '''
+        worker = workerProcess(args, env, pairs)
+        # Reduce priority of child process (doesn't work on Windows)
+        lowerPriority = lambda: os.nice(15)
+        if self.forkWorkers():
+            if pairs is not None:
+                target = lambda: runSingleWorker(pairs)
+            else:
+                target = lambda: runQueueWorker(self.dispatchAddress)
+            process = self.supervisor.fork(target, worker, env = env,
+                                           preexec_fn = lowerPriority)
+        else:
+            mainFile = 'main.py'
+            process = self.supervisor.spawn(
+                ['python', mainFile] + args,
+                worker,
+                env = env,
+                preexec_fn = lowerPriority,
+            )
+        self.workerNames[process.pid] = 'worker %s' % (
+            len(self.workerNames) + 1)
+        return process
+
+    @staticmethod
+    def forkWorkers():
+        '''Check if workers are forked from this process, rather than
+        started as new processes. '''
+        return testconfig.workerStart == 'fork' and hasattr(os, 'fork')
+
+    def startWorkers(self, workerArgs):
+        '''Start workers given as a list of (args, env, pairs) tuples, one
+        at a time to even out load and reduce bottlenecks. The next worker
+        is started once the last one has loaded its first landing page, or
+        has its browser up while pages are loading quickly, or after
+        parallelDelay seconds at the most. '''
+        self.pendingWorkers = list(workerArgs)
+        self.rampStart = time.time()
+        self.startNextWorker()
+
+    def startNextWorker(self):
+        '''Start the next of the workers passed to startWorkers. '''
+        if not self.pendingWorkers or self.supervisor.cancelled is not None:
+            return
+        args, env, pairs = self.pendingWorkers.pop(0)
+        process = self.startWorker(args, env, pairs)
+        self.lastStarted = process.data
+        if not self.pendingWorkers:
+            self.rampTime = time.time() - self.rampStart
+            return
+
+        def timedOut(worker = process.data):
+            if self.lastStarted is worker:
+                self.startNextWorker()
+        self.supervisor.callLater(testconfig.parallelDelay, timedOut)
+
+    def loadsAreFast(self):
+        '''Check if landing pages have recently been loading in less than
+        rampLatency seconds. '''
+        recent = self.loadTimes[-5:]
+        return bool(testconfig.rampLatency and recent and
+                    median(recent) < testconfig.rampLatency)
+
+    def workerReady(self, worker, stage, seconds):
+        '''Deal with a worker getting through a stage of starting up. '''
+        if stage == 'landing':
+            self.loadTimes.append(seconds)
+        if worker is not self.lastStarted:
+            return
+        if stage == 'landing' or (stage == 'driver' and self.loadsAreFast()):
+            self.startNextWorker()
+
+    def startStaticWorkers(self, udpairs):
+        '''Split the pairs up front and give each worker its own share on
+        the command line. '''
+        # Order and split the pairs to keep overrides to a minimum, and
+        # balance the workers using how long each pair took last time
+        estimator = self.pairEstimator()
+        datesplits = schedulePairs(udpairs, testconfig.parallelNum,
+                                   self.defaultUser, self.defaultDate,
+                                   estimator)
+        print estimator.report()
+        print scheduleReport(datesplits,
+                             splitList(udpairs, testconfig.parallelNum),
+                             self.defaultUser, self.defaultDate)
+
+        workerArgs = []
+        for datepairs in datesplits:
+            pairs = [(user, str(date)) for user, date in datepairs]
+            pairArgs = ['%s:%s' % pair for pair in pairs]
+            workerArgs.append((['--single'] + pairArgs, None, pairs))
+        self.startWorkers(workerArgs)
+
+    def startQueueWorkers(self, udpairs):
+        '''Serve the pairs from a queue, which each worker keeps taking
+        batches from until it is empty. '''
+        workers = min(testconfig.parallelNum, len(udpairs))
+        self.dispatcher = pairDispatcher(udpairs, testconfig.queueBatchSize,
+                                         workers, self.pairEstimator())
+        authkey = os.urandom(16).encode('hex')
+        # Keep this process single threaded if workers are forked from it
+        address, self.dispatcher = serveDispatcher(
+            self.dispatcher, authkey, ownProcess = self.forkWorkers())
+        self.dispatchAddress = address
+
+        # Pass the key in the environment rather than on the command line,
+        # where other users could see it
+        env = dict(os.environ)
+        env[dispatchKeyVar] = authkey
+
+        if testconfig.adaptiveConcurrency:
+            self.controller = concurrencyController(
+                testconfig.concurrencyStart, workers)
+            self.dispatcher.setLimit(self.controller.limit)
+            self.supervisor.callLater(testconfig.concurrencyInterval,
+                                      self.updateConcurrency)
+        self.startWorkers([(['--queue', '%s:%s' % address], env, None)]
+                          * workers)
+
+    def updateConcurrency(self):
+        '''Let the controller adjust how many workers work at once, then
+        check again later while workers are still running. '''
+        self.dispatcher.setLimit(self.controller.update())
+        if any([not p.exited for p in self.supervisor.processes]):
+            self.supervisor.callLater(testconfig.concurrencyInterval,
+                                      self.updateConcurrency)
+
+    def handleLine(self, process, stream, line):
+        '''Deal with a line of output from a worker as soon as we get
+        it. '''
+        if stream == 'stderr':
+            process.data.stderr.append(line)
+        else:
+            self.handleRecord(process.data, readRecord(line))
+
+    def handleRecord(self, worker, record):
+        '''Deal with a record from a worker. '''
+        kind = record['type']
+        if kind == 'pair':
+            user, date = record['user'], record['date']
+            worker.reported.add((user, date))
+            if record['diffs']:
+                self.diffs.setdefault(user, {})[date] = [
+                    diffRecord.fromData(data) for data in record['diffs']]
+            if record['timings']:
+                self.runTimings.setdefault(user, {})[date] = record['timings']
+                self.loadTimes.append(record['timings']['load'])
+                if self.controller is not None:
+                    self.controller.addPage(record['timings']['load'],
+                                            bool(record['hung']))
+            self.pairsDone += 1
+            if testconfig.showProgress:
+                print '[%s/%s] %s on %s: %s' % (
+                    self.pairsDone, self.pairsTotal, user, date,
+                    '%s diffs' % len(record['diffs']) if record['diffs']
+                    else 'OK')
+        elif kind == 'spans':
+            tracer.events.extend(record['events'])
+        elif kind == 'commands':
+            counter.merge(record['counts'])
+        elif kind == 'ready':
+            self.workerReady(worker, record['stage'], record['time'])
+        elif kind == 'done':
+            worker.finished = True
+        elif kind == 'error':
+            self.errors.append(record['text'])
+        else:
+            self.errors.append('Unexpected output: %s\n' % record['text'])
+
+    def workerExited(self, process):
+        '''Deal with a worker once it has exited and we've read all its
+        output. If it didn't finish, its untested pairs go back in the queue
+        for a replacement worker, or are reported as failures. '''
+        worker = process.data
+        code = process.proc.returncode
+        tracer.add('worker', 'worker', worker.startTime, time.time(),
+                   pid = process.pid, code = code)
+        if worker.stderr:
+            self.errors.append(''.join(worker.stderr))
+        if worker.finished:
+            return
+
+        if self.dispatcher is not None:
+            missing = self.dispatcher.requeue(process.pid, worker.reported)
+        else:
+            missing = [pair for pair in worker.pairs
+                       if pair not in worker.reported]
+        if not missing:
+            return
+
+        if self.supervisor.cancelled is not None:
+            reason = self.cancelReasons[self.supervisor.cancelled]
+            for user, date in missing:
+                self.logDiffs(user, date, reason)
+            return
+
+        if self.workerRestarts < testconfig.workerRestarts:
+            self.workerRestarts += 1
+            if self.dispatcher is not None:
+                self.startWorker(worker.args, worker.env)
+            else:
+                pairArgs = ['%s:%s' % pair for pair in missing]
+                self.startWorker(['--single'] + pairArgs, pairs = missing)
+            return
+
+        for user, date in missing:
+            self.logDiffs(user, date, 'Worker exited with code %s before '
+                          'testing this pair' % code)
+
     # Run tests and report discrepancies between expected and actual results
     def test_runtests(self):
         '''Run all tests as defined in testDates and usersToTest.
@@ -258,10 +802,6 @@ class parallelTestCase(mainMyuwTestCase):
         is set. usersToTest should be a list of usernames to test with,
         while testDates should be a dictionary mapping usernames to a list
         of dates which they should be tested on. '''
-        # List for holding diffs. These will each be a string of json.
-        diffList = []
-        # List for holding each Popen instance.
-        processes = []
         # User-date pairs
         udpairs = []
         if self.usersToTest:
@@ -273,102 +813,60 @@ class parallelTestCase(mainMyuwTestCase):
             if not(dates):
                 continue
             for date in dates:
-                pair = '%s:%s' %(user, date)
-                udpairs.append(pair)
-
-        datesplits = splitList(udpairs, testconfig.parallelNum)
-
-        for datepairs in datesplits:
-            mainFile = 'main.py'
-
-            process = subprocess.Popen(
-                ['python', mainFile, '--single'] + datepairs,
-                stdout = subprocess.PIPE,
-                stderr = subprocess.PIPE,
-                # Reduce priority of child process (doesn't work on Windows)
-                preexec_fn = lambda: os.nice(15),
-            )
-            processes.append(process)
-
-            # Stagger processes to even out load and reduce bottlenecks
-            time.sleep(testconfig.parallelDelay)
-
-        # Wait for every process to finish
-        finished = False
-        while not(finished):
-            # XXX
-            time.sleep(2)
-
-            # Set finished to True, but if any process is not finished
-            # then set it back to false
-            finished = True
-            for proc in processes:
-                # Returns None if process is not finished, otherwise
-                # gives the exit code
-                if proc.poll() is None:
-                    finished = False
-
-            # Grab output from each process
-            # The unittest stuff as well as any errors will go to stderr,
-            # while the actual output will
-            # go to stdout which we read from here
-            for proc in processes:
-                try:
-                    (stdout, stderr) = proc.communicate()
-                    if stderr:
-                        errs = ''
-                        errLines = stderr.split('\n')
-                        # Filter out anything that isn't an error
-                        # There has to be a better way to do this, but right now
-                        # it's more important to make sure errors will be seen
-                        # if they exist.
-                        for line in errLines:
-                            if len(line) == 0:
-                                continue
-                            if line == 'E':
-                                continue
-                            if line[0] in ('.', 'F'):
-                                continue
-                            if line[0:4] == '----':
-                                continue
-                            if line[0:3] in ('Ran', 'Run'):
-                                continue
-                            if line[0:6] == 'FAILED':
-                                continue
-                            if line[0:2] == 'OK':
-                                continue
-                            #print 'Line: <start>%s<end>' %line
-                            errs += line + '\n'
-
-                        # If there is something left, report it
-                        if errs:
-                            #print 'Got errors:\n%s' %stderr
-                            self.errors.append(errs)
-
-                    if stdout:
-                        diffList.append(stdout)
-
-                # If the process's output has already hit EOF, then don't worry
-                # about it. This just means we already got the data from that
-                # particular process.
-                except ValueError:
-                    pass
-
-        diffDicts = []
-        # For each json diff, convert it to a real dictionary
-        for diffJson in diffList:
-            try:
-                diffDict = json.loads(diffJson)
-            except ValueError:
-                raise ValueError('Could not decode json object from %s' %diffJson)
+                udpairs.append((user, date))
+
+        # Build (or load) the expected timeline before starting workers, so
+        # forked workers start with it and others can load it from disk
+        getTimeline()
+
+        self.supervisor = workerSupervisor(self.handleLine,
+                                           self.workerExited,
+                                           testconfig.runDeadline)
+        self.dispatcher = None
+        self.dispatchAddress = None
+        self.controller = None
+        self.runTimings = {}
+        # Landing page load times, in the order we heard about them
+        self.loadTimes = []
+        self.lastStarted = None
+        # Time taken to start every worker, once they're all started
+        self.rampTime = None
+        self.pairsDone = 0
+        self.pairsTotal = len(udpairs)
+        self.workerRestarts = 0
+        # pid -> name of every worker started, for the trace
+        self.workerNames = {}
+
+        with span('run', 'run', pairs = len(udpairs)):
+            if testconfig.dispatch == 'queue':
+                self.startQueueWorkers(udpairs)
             else:
-                diffDicts.append(diffDict)
-
-        # Combine dictionaries into one, like what we would get from the
-        # non-parallelized version
-        fullDiffs = self.mergeDiffs(diffDicts)
+                self.startStaticWorkers(udpairs)
+
+            # Handle output as it comes until every worker is done
+            self.supervisor.run()
+        self.reportSpans(self.workerNames)
+
+        if self.rampTime is not None:
+            print 'Started %s workers in %.1f seconds' % (
+                len(self.supervisor.processes) - self.workerRestarts,
+                self.rampTime)
+        self.saveTimings(self.runTimings)
+        if self.controller is not None:
+            print self.controller.report()
+            if testconfig.concurrencyLog:
+                self.controller.writeTimeline(testconfig.concurrencyLog)
+        if self.dispatcher is not None:
+            print self.dispatcher.report()
+            # Only left over if every worker died, or we stopped them
+            reason = self.cancelReasons.get(self.supervisor.cancelled,
+                                            'No worker was left to test '
+                                            'this pair')
+            for user, date in self.dispatcher.drain():
+                self.logDiffs(user, date, reason)
+        self.writeDiffReports(udpairs, self.runTimings)
         # Format them like how they would normally be formatted
-        diffStr = self.formatDiffsFull(fullDiffs)
+        diffStr = self.getFormattedDiffs(udpairs)
         if self.errors:
             errStr = 'Got errors from children: \n'
             for err in self.errors:
@@ -385,9 +883,17 @@ class autoDateMyuwTestCase(parallelTestCase):
 
     startDate = defaultStartDate
     endDate = defaultEndDate
+    # Only test the first and last of each run of dates on which a user has
+    # the same expected cards (see myuwtesting.reduction)
+    reduceDates = testconfig.reduceDates
 
     @property
     def testDates(self):
-        return getTestDates(self.startDate, self.endDate)
+        if getattr(self, '_testDates', None) is None:
+            testDates = getTestDates(self.startDate, self.endDate)
+            if self.reduceDates:
+                testDates = reduceTestDates(testDates)[0]
+            self._testDates = testDates
+        return self._testDates
 
 
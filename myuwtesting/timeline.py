@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+import bisect
+import hashlib
+import json
+import os
+
+from . import expected
+from .classes import myuwDate
+from .dates import getAllDates
+from .testconfig import defaultStartDate, defaultEndDate
+from . import testconfig
+
+# Compiled expected results
+#
+# expected.getExpectedResults asks every card of a user whether it should
+# appear, every time it is called. Since the expected cards only change
+# when the code changes, the answer for every user is worked out once for
+# every day between a start and end date (and every time of day that a
+# significant date falls on), and kept as a sorted list of interval starts,
+# each mapped to the cards visible from then until the next start. Looking
+# up a date is then a bisect.
+#
+# The timeline is saved in testconfig.timelineCache, keyed by a hash of the
+# sources the expected cards come from, so workers and later runs can load
+# it rather than building it again. Cards are saved as (name, index) pairs
+# into expected.cardList[user][name].
+
+# Sources whose changes can change the expected cards
+sourceFiles = ('expected.py', 'cards.py', 'dates.py', 'thrive.py',
+               'classes.py', 'intervals.py')
+
+
+def timeKey(date):
+    '''Sortable integer for a date (its myuwDate key). '''
+    return myuwDate(date).key
+
+
+def sourceHash(start, end):
+    '''Hash of the expected card sources and the date range, which a saved
+    timeline must match to be used. '''
+    h = hashlib.sha1()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in sourceFiles:
+        with open(os.path.join(folder, name), 'rb') as f:
+            h.update(f.read())
+    h.update('%s %s' % (myuwDate(start), myuwDate(end)))
+    return h.hexdigest()
+
+
+def timelinePoints(start, end):
+    '''Dates between start and end (inclusive) to work out the expected
+    cards on: every day, plus every significant date with a time. Returns
+    a sorted list of timeKeys, and the set of those which have a time. '''
+    start = myuwDate(start)
+    end = myuwDate(end)
+    points = set()
+    day = start
+    while day <= end:
+        points.add(timeKey(day))
+        day = day + 1
+
+    dates = getAllDates()
+    for userCards in expected.cardList.values():
+        for cardColl in userCards.values():
+            for card in cardColl:
+                dates.extend(expected.cardSignificantDates(card))
+
+    timePoints = set()
+    for date in dates:
+        date = myuwDate(date)
+        if date.hasTime and start <= date <= end:
+            timePoints.add(timeKey(date))
+    points.update(timePoints)
+    return sorted(points), timePoints
+
+
+def visibleCardIds(user, date):
+    '''The expected cards for user on date as a sorted list of
+    [name, index] pairs, or None if they can't be worked out (e.g. two
+    expected cards with the same name). '''
+    try:
+        visible = expected.getExpectedResults(user, date)
+    except Exception:
+        return None
+    ids = []
+    for name, card in visible.items():
+        for i, candidate in enumerate(expected.cardList[user][name]):
+            if candidate is card:
+                ids.append([name, i])
+    return sorted(ids)
+
+
+class expectedTimeline(object):
+    '''Expected cards for every user between two dates, as intervals.
+
+    Dates outside the range, at a time of day that wasn't compiled, or in
+    an interval where the cards couldn't be worked out are passed on to
+    expected.getExpectedResults. '''
+
+    def __init__(self, key, start, end, timePoints, users):
+        '''users: {user: (starts, states)}, where starts is a sorted list
+        of timeKeys and states[i] is the list of card ids visible from
+        starts[i] until starts[i + 1] (or None). '''
+        self.key = key
+        self.start = timeKey(start)
+        self.end = timeKey(end)
+        self.timePoints = set(timePoints)
+        self.users = users
+
+    @classmethod
+    def build(cls, start, end):
+        '''Compile the timeline for every user in expected.cardList. '''
+        points, timePoints = timelinePoints(start, end)
+        dates = [myuwDate.fromKey(point) for point in points]
+        users = {}
+        for user in expected.cardList:
+            starts = []
+            states = []
+            for point, date in zip(points, dates):
+                state = visibleCardIds(user, date)
+                if not states or state != states[-1]:
+                    starts.append(point)
+                    states.append(state)
+            users[user] = (starts, states)
+        return cls(sourceHash(start, end), start, end, timePoints, users)
+
+    @classmethod
+    def load(cls, path, start, end):
+        '''Load a saved timeline, or return None if there isn't one for the
+        current sources and range. '''
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get('key') != sourceHash(start, end):
+            return None
+        users = dict([(user, (entry['starts'], entry['states']))
+                      for user, entry in data['users'].items()])
+        return cls(data['key'], start, end, data['timePoints'], users)
+
+    def save(self, path):
+        '''Save the timeline. Writes to a temporary file first, so workers
+        never see half of one. '''
+        data = {
+            'key': self.key,
+            'timePoints': sorted(self.timePoints),
+            'users': dict([(user, {'starts': starts, 'states': states})
+                           for user, (starts, states) in self.users.items()]),
+        }
+        tmpPath = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmpPath, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmpPath, path)
+
+    def lookup(self, user, date):
+        '''Card ids visible for user on date, or None if the timeline can't
+        say. '''
+        if user not in self.users:
+            return None
+        date = myuwDate(date)
+        key = timeKey(date)
+        if key < self.start or key > self.end:
+            return None
+        if date.hasTime and key not in self.timePoints:
+            return None
+        starts, states = self.users[user]
+        i = bisect.bisect_right(starts, key) - 1
+        if i < 0:
+            return None
+        return states[i]
+
+    def getExpectedResults(self, user, date):
+        '''Same as expected.getExpectedResults, using the timeline where it
+        can. '''
+        ids = self.lookup(user, date)
+        if ids is None:
+            return expected.getExpectedResults(user, date)
+        userCards = expected.cardList[user]
+        return dict([(name, userCards[name][i]) for name, i in ids])
+
+
+# Timelines already built or loaded by this process, by (start, end)
+timelines = {}
+
+
+def getTimeline(start=defaultStartDate, end=defaultEndDate):
+    '''Get the expected timeline between start and end, loading it from
+    testconfig.timelineCache if it is there and up to date, or building
+    (and saving) it if not. '''
+    rangeKey = (str(myuwDate(start)), str(myuwDate(end)))
+    if rangeKey in timelines:
+        return timelines[rangeKey]
+
+    path = testconfig.timelineCache
+    timeline = None
+    if path:
+        timeline = expectedTimeline.load(path, start, end)
+    if timeline is None:
+        timeline = expectedTimeline.build(start, end)
+        if path:
+            timeline.save(path)
+    timelines[rangeKey] = timeline
+    return timeline
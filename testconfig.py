@@ -1,8 +1,17 @@
 #!/usr/bin/python
 
 # Some settings
-# Enable this to do some performance profiling
+# Enable this to do some performance profiling: record timing spans (see
+# myuwtesting/perf.py) and print where the time went at the end of a run
 perf = False
+# File to write the timing spans of a run to as a Chrome trace (open it in
+# chrome://tracing or Perfetto), with every parallel process merged in.
+# Setting this records spans even when perf is off. None to not write it.
+traceFile = None
+# Count and time every WebDriver command, by the card class and phase
+# (override, landing, parse, diff) it was for, and print which card classes
+# cost the most round trips at the end of a run (see myuwtesting/commands.py)
+countCommands = False
 # Run each user in parallel
 parallel = True
 # Split tests into parallel processes
@@ -13,12 +22,126 @@ parallelNum = 9
 # Number of concurrent tests running at any given time will be at most
 # the number of users to test times parallelDateSplit
 
-# Delay between starting processes for parallel mode
+# Rough cost (in seconds) of each kind of override, and of loading and
+# checking a page, used to decide how to split pairs between processes.
+overrideCosts = {
+    'user': 1.5,
+    'date': 1.5,
+    'time': 1.5,
+    'page': 3.0,
+}
+
+# How to hand out user/date pairs to parallel processes
+# 'queue': processes keep taking small batches from a queue in the parent
+#          until it is empty, so none of them sit idle while others have
+#          a long list left
+# 'static': split the pairs between processes up front
+dispatch = 'queue'
+# Most pairs to hand out at once in queue mode
+queueBatchSize = 8
+
+# In queue mode, adjust how many processes work at once while the run goes
+# on, based on page load times, hung cards and host load. parallelNum
+# processes are started, starting with concurrencyStart of them working,
+# and the limit is updated every concurrencyInterval seconds. The limit
+# over time and the throughput at each limit are written to
+# concurrencyLog (None to not write it).
+adaptiveConcurrency = True
+concurrencyStart = 4
+concurrencyInterval = 15
+concurrencyLog = 'concurrency.log'
+# Load average per CPU over which the host counts as overloaded, and the
+# limit is cut. The processes' own browsers add to the load, so this is
+# well over 1.0, which they reach as soon as they keep every CPU busy.
+concurrencyMaxHostLoad = 2.5
+# Seconds a process waits before asking again when it is over the limit
+queueWaitTime = 1
+
+# File to keep how long each user/date pair took in, so later parallel
+# runs can balance their workers. Set to None to disable.
+historyFile = 'run-history.json'
+
+# How to start parallel processes
+# 'fork': fork them from this process, which has already imported the card
+#         classes and built the expected data, and hand them their pairs
+#         directly rather than on the command line (not on Windows, where
+#         'exec' is used instead)
+# 'exec': start each one as a new python main.py process
+workerStart = 'fork'
+
+# Number of times to start a replacement for a parallel process which
+# exits before testing all of its pairs
+workerRestarts = 2
+# Print a line for each pair as parallel processes finish them
+showProgress = True
+
+# Parallel processes are started one at a time. The next one is started
+# once the last one has loaded its first landing page, or once its browser
+# is up if landing pages have been taking less than rampLatency seconds to
+# load (None to always wait for the landing page). parallelDelay is the
+# longest time to wait between starting processes.
+rampLatency = 2
 parallelDelay = 3
+# Stop every parallel process if the run takes longer than this many
+# seconds, reporting whatever wasn't tested. None for no limit.
+runDeadline = None
+
+# Restart each worker's browser after this many page loads, or once it
+# (including its driver) uses more than this many megabytes of memory.
+# Set either to 0 to disable. The memory check needs psutil.
+driverMaxPages = 300
+driverMaxRss = 2048
+# Number of times to restart a dead browser and retry the same user/date
+pairRetries = 2
 
 # For auto date tests, restrict dates to this range
 defaultStartDate = '2013-1-7'
 defaultEndDate = '2013-12-17'
 
+# File to keep the expected cards for every user and date in that range in,
+# so they only need working out again when the expected data changes.
+# Set to None to work them out every run.
+timelineCache = 'expected-timeline.json'
+
+# For auto date tests, only test the first and last of each run of dates on
+# which a user has the same expected cards with the same expected content.
+# --dump-dates shows which dates this would skip.
+reduceDates = False
+
+# How to read cards off the landing page
+# 'script': one execute_script call returns everything every card needs
+# 'tree': fetch page_source once and parse it locally with lxml (needs lxml)
+# 'element': each card walks its own WebElements (one round trip per lookup)
+parseMode = 'script'
+
+# Longest time (in seconds) to wait for a user/date override to go through
+overrideTimeout = 10
+
+# How to do user/date overrides
+# 'http': post the override directly with the browser's cookies over a
+#         keep-alive connection (needs requests), falling back to the form
+# 'form': fill in the override form in the browser
+overrideBackend = 'http'
+
+# How to wait for the landing page to finish loading
+# 'observer': the page reports back once there have been no visible loading
+#             gears for landingQuietTime seconds
+# 'poll': check for loading gears every 0.8 seconds
+landingWaitMode = 'observer'
+# Longest time (in seconds) to wait before reporting cards as hung
+landingMaxWait = 10
+landingQuietTime = 0.3
+
+# In the report at the end of a run, show a difference found on a run of
+# consecutive tested dates once for the whole run rather than under every
+# date. Set to False to list every date in full.
+compressDiffs = True
+
+# Files to also write the differences found to, as JSON (a list of diff
+# records, see myuwtesting/diffs.py) and as JUnit XML (a test case for each
+# user/date pair). None to not write them.
+diffJson = None
+diffJUnit = None
+
 # Testing URL
 testUrl = 'http://localhost:8081'
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+import unittest
+
+from myuwtesting import concurrency
+from myuwtesting.concurrency import concurrencyController
+from myuwtesting.dispatch import pairDispatcher
+
+
+class concurrencyControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        # Host readings the controller sees, instead of the real ones
+        self.load = None
+        self.memory = None
+        self.realHost = concurrency.hostLoad, concurrency.hostMemoryUsed
+        concurrency.hostLoad = lambda: self.load
+        concurrency.hostMemoryUsed = lambda: self.memory
+
+    def tearDown(self):
+        concurrency.hostLoad, concurrency.hostMemoryUsed = self.realHost
+
+    def interval(self, controller, loadTimes, hung=0):
+        '''Finish pages taking loadTimes, hung of them with hung cards, and
+        update as if a minute had gone by. '''
+        for i, loadTime in enumerate(loadTimes):
+            controller.addPage(loadTime, i < hung)
+        controller.lastUpdate -= 60
+        return controller.update()
+
+    def test_additive_increase(self):
+        controller = concurrencyController(2, 4)
+        limits = [self.interval(controller, [2, 2]) for i in range(4)]
+        self.assertEqual(limits, [3, 4, 4, 4])
+        self.assertEqual(controller.timeline[0]['pagesPerMinute'], 2)
+
+    def test_increase_with_busy_host(self):
+        '''Workers keeping every CPU busy isn't congestion by itself. '''
+        self.load = 1.4
+        controller = concurrencyController(2, 6)
+        limits = [self.interval(controller, [2, 2]) for i in range(4)]
+        self.assertEqual(limits, [3, 4, 5, 6])
+        self.assertEqual([entry['congestion']
+                          for entry in controller.timeline], [None] * 4)
+
+    def test_no_pages_no_change(self):
+        controller = concurrencyController(2, 4)
+        self.assertEqual(self.interval(controller, []), 2)
+        self.assertEqual(controller.timeline[0]['loadMedian'], None)
+
+    def test_multiplicative_decrease(self):
+        controller = concurrencyController(10, 10)
+        self.interval(controller, [2, 2, 2])
+        self.assertEqual(self.interval(controller, [3, 3.5, 4]), 7)
+        self.assertEqual(controller.timeline[-1]['congestion'],
+                         'slow pages')
+        # The baseline is the best median seen, not the latest
+        self.assertEqual(controller.baseline, 2)
+        self.assertEqual(self.interval(controller, [2.9]), 8)
+
+    def test_congestion_reasons(self):
+        controller = concurrencyController(4, 8, maxHostLoad=2.5)
+        self.assertEqual(self.interval(controller, [1] * 10, hung=1), 2)
+        self.assertEqual(controller.timeline[-1]['congestion'], 'hung cards')
+        self.load = 3
+        self.assertEqual(self.interval(controller, [1]), 1)
+        self.assertEqual(controller.timeline[-1]['congestion'], 'host load')
+        self.load = 0.5
+        self.memory = 95
+        self.assertEqual(self.interval(controller, [1]), 1)
+        self.assertEqual(controller.timeline[-1]['congestion'],
+                         'host memory')
+        self.memory = 50
+        self.assertEqual(self.interval(controller, [1]), 2)
+
+    def test_start_within_bounds(self):
+        self.assertEqual(concurrencyController(9, 4).limit, 4)
+        self.assertEqual(concurrencyController(0, 4).limit, 1)
+
+
+class dispatcherLimitTest(unittest.TestCase):
+
+    def test_workers_wait_over_limit(self):
+        pairs = [('a', '2013-01-0%s' % day) for day in range(1, 7)]
+        dispatcher = pairDispatcher(pairs, 1, 3)
+        dispatcher.setLimit(2)
+        self.assertTrue(dispatcher.take(0, 'a'))
+        self.assertTrue(dispatcher.take(1, 'a'))
+        self.assertEqual(dispatcher.take(2, 'a'), None)
+        # Asking again means worker 0 finished its batch
+        self.assertTrue(dispatcher.take(0, 'a'))
+        self.assertEqual(dispatcher.take(2, 'a'), None)
+        dispatcher.setLimit(0)
+        self.assertEqual(dispatcher.limit, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
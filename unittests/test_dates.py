@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import unittest
+from datetime import date, timedelta
+
+from myuwtesting import dates
+from myuwtesting.classes import myuwDate
+
+
+def linearDateToQtr(date):
+    '''dateToQtr as it was before the calendar was indexed, scanning every
+    quarter. '''
+    date = myuwDate(date)
+    if date < myuwDate('2013-01-01'):
+        return 'AU12'
+    for qtr, start in dates.FirstDayQtr.items():
+        try:
+            end = dates.LastDayQtr[qtr]
+            if start <= date < end + 1:
+                return qtr
+        except:
+            continue
+    raise Exception("Couldn't find quarter for date %s" % date)
+
+
+def linearDateToTerm(date):
+    '''dateToTerm on top of linearDateToQtr. '''
+    date = myuwDate(date)
+    qtr = linearDateToQtr(date)
+    if qtr[0:2] == 'SU':
+        if date >= dates.SummerBTermBegins[qtr]:
+            return 'SB' + qtr[2:4]
+        return 'SA' + qtr[2:4]
+    return qtr
+
+
+def everyDay(first, last):
+    '''Every date from first to last, as strings. '''
+    day = first
+    while day <= last:
+        yield str(day)
+        day += timedelta(days=1)
+
+
+class calendarTest(unittest.TestCase):
+
+    def test_matches_linear_lookup(self):
+        for day in everyDay(date(2012, 11, 1), date(2014, 3, 25)):
+            self.assertEqual(dates.dateToQtr(day), linearDateToQtr(day), day)
+            self.assertEqual(dates.dateToTerm(day), linearDateToTerm(day),
+                             day)
+
+    def test_past_term(self):
+        for day in everyDay(date(2013, 2, 15), date(2014, 3, 25)):
+            when = myuwDate(day)
+            qtr = linearDateToQtr(when)
+            if 'SU' not in qtr:
+                expected = linearDateToQtr(when - 40)
+            else:
+                expected = linearDateToTerm(when - 10)
+            self.assertEqual(dates.getPastTerm(day), expected, day)
+
+    def test_after_last_quarter(self):
+        self.assertRaises(Exception, dates.dateToQtr, '2014-03-26')
+        self.assertRaises(Exception, linearDateToQtr, '2014-03-26')
+
+    def test_term_intervals(self):
+        '''Every day falls in the intervals named after its quarter and
+        term. '''
+        found = {}
+        for name, start, end in dates.termIntervals():
+            found.setdefault(name, []).append((start, end))
+        for day in everyDay(date(2012, 11, 1), date(2014, 3, 25)):
+            key = myuwDate(day).key
+            for name in (dates.dateToQtr(day), dates.dateToTerm(day)):
+                self.assertTrue(any([start <= key < end
+                                     for start, end in found[name]]),
+                                (day, name))
+
+    def test_previous_qtr(self):
+        self.assertEqual(dates.previousQtr('WI13'), 'AU12')
+        self.assertEqual(dates.previousQtr('WI00'), 'AU99')
+        self.assertEqual(dates.previousQtr('AU13'), 'SU13')
+
+
+if __name__ == '__main__':
+    unittest.main()
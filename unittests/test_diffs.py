@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+import json
+import unittest
+
+from myuwtesting.diffs import diffRecord, fieldDiff, noteDiff, errorDiff, \
+    formatRecords, diffRuns
+
+
+def forCard(record, card):
+    '''Set the card a record is for, as expected.findDiffs does. '''
+    record.card = card
+    return record
+
+
+class diffRecordTest(unittest.TestCase):
+
+    def roundTrip(self, record):
+        '''Send a record through JSON the way a worker does. '''
+        return diffRecord.fromData(json.loads(json.dumps(record.toData())))
+
+    def test_round_trip(self):
+        records = [
+            forCard(fieldDiff('Title', u'Caf\xe9', 'Cafe'), 'EventsCard'),
+            forCard(fieldDiff('Count', 3, None), 'GradeCard'),
+            forCard(noteDiff('Links are out of order'), 'ToolsCard'),
+            errorDiff('Traceback (most recent call last):\n  ...'),
+            diffRecord('unexpected', card='HFSCard'),
+            diffRecord('missing', card='TextbookCard', user='javerage',
+                       date='2013-04-15'),
+        ]
+        for record in records:
+            copy = self.roundTrip(record)
+            self.assertEqual(copy.canonical(), record.canonical())
+            self.assertEqual(copy.message(), record.message())
+            self.assertEqual(copy.user, record.user)
+            self.assertEqual(copy.date, record.date)
+            # Sending it again changes nothing
+            self.assertEqual(self.roundTrip(copy).toData(), copy.toData())
+
+    def test_unicode_escaped_once(self):
+        copy = self.roundTrip(fieldDiff('Title', u'Caf\xe9', 'Cafe'))
+        self.assertEqual(copy.message(), 'Different Title (Caf\\xe9 vs Cafe)')
+
+    def test_date_sent_as_text(self):
+        data = diffRecord('note', text='x', date=12).toData()
+        self.assertEqual(data['date'], '12')
+        self.assertNotIn('expected', data)
+
+
+class formatRecordsTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(formatRecords([]), [])
+
+    def test_card_lists_share_a_line(self):
+        records = [diffRecord('unexpected', card='A'),
+                   diffRecord('unexpected', card='B'),
+                   diffRecord('missing', card='C'),
+                   diffRecord('unexpected', card='D')]
+        self.assertEqual(formatRecords(records), [
+            'Found the following unexpected cards: A, B',
+            "Didn't find the following expected cards: C",
+            'Found the following unexpected cards: D',
+        ])
+
+    def test_content_under_card(self):
+        records = [forCard(fieldDiff('Title', 'a', 'b'), 'A'),
+                   forCard(noteDiff('two\nlines'), 'A'),
+                   forCard(errorDiff('broke'), 'B'),
+                   forCard(noteDiff('again'), 'A')]
+        self.assertEqual(formatRecords(records), [
+            'Found differences in card A:',
+            '\tDifferent Title (a vs b)',
+            '\ttwo',
+            '\tlines',
+            'Found differences in card B:',
+            '\tbroke',
+            'Found differences in card A:',
+            '\tagain',
+        ])
+
+    def test_pair_errors_unindented(self):
+        records = [errorDiff('Traceback\n\n  line'),
+                   diffRecord('missing', card='A')]
+        self.assertEqual(formatRecords(records), [
+            'Traceback',
+            '  line',
+            "Didn't find the following expected cards: A",
+        ])
+
+
+def missing(card):
+    '''Record for an expected card which wasn't found. '''
+    return diffRecord('missing', card=card)
+
+
+class diffRunsTest(unittest.TestCase):
+
+    def runs(self, dates, testedDates=None):
+        '''diffRuns with the records replaced by their card names. '''
+        return [(first, last, count, [r.card for r in records])
+                for first, last, count, records
+                in diffRuns(dates, testedDates)]
+
+    def test_consecutive_dates_grouped(self):
+        dates = {
+            '2013-01-01': [missing('A'), missing('B')],
+            '2013-01-02': [missing('A')],
+            '2013-1-3': [missing('A')],
+        }
+        self.assertEqual(self.runs(dates), [
+            ('2013-01-01', '2013-01-01', 1, ['B']),
+            ('2013-01-01', '2013-1-3', 3, ['A']),
+        ])
+
+    def test_tested_date_breaks_run(self):
+        dates = {
+            '2013-01-01': [missing('A')],
+            '2013-01-05': [missing('A')],
+        }
+        self.assertEqual(self.runs(dates), [
+            ('2013-01-01', '2013-01-05', 2, ['A']),
+        ])
+        self.assertEqual(self.runs(dates, ['2013-01-01', '2013-01-03',
+                                           '2013-01-05']), [
+            ('2013-01-01', '2013-01-01', 1, ['A']),
+            ('2013-01-05', '2013-01-05', 1, ['A']),
+        ])
+
+    def test_records_keep_their_order(self):
+        dates = {
+            '2013-01-01': [missing('C'), missing('A'), missing('B')],
+            '2013-01-02': [missing('B'), missing('C'), missing('A')],
+        }
+        self.assertEqual(self.runs(dates), [
+            ('2013-01-01', '2013-01-02', 2, ['C', 'A', 'B']),
+        ])
+
+    def test_field_values_compared(self):
+        dates = {
+            '2013-01-01': [forCard(fieldDiff('Title', 'a', 'b'), 'A')],
+            '2013-01-02': [forCard(fieldDiff('Title', 'a', 'c'), 'A')],
+        }
+        runs = diffRuns(dates)
+        self.assertEqual([(first, count) for first, last, count, records
+                          in runs],
+                         [('2013-01-01', 1), ('2013-01-02', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
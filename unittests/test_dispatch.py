@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+import unittest
+
+from myuwtesting.dispatch import pairDispatcher, parseAddress
+
+dates = ['2013-01-01', '2013-02-01', '2013-03-01', '2013-04-01',
+         '2013-05-01', '2013-06-01']
+
+
+def pairs(users):
+    '''Every date for each user in users, given as {user: number of
+    dates}. '''
+    return [(user, date) for user, n in sorted(users.items())
+            for date in dates[:n]]
+
+
+class pairDispatcherTest(unittest.TestCase):
+
+    def test_keeps_worker_on_its_user(self):
+        dispatcher = pairDispatcher(pairs({'a': 4, 'b': 6}), 2, 1)
+        self.assertEqual(dispatcher.take(0, 'a'),
+                         [('a', '2013-01-01'), ('a', '2013-02-01')])
+        self.assertEqual(dispatcher.take(0, 'a'),
+                         [('a', '2013-03-01'), ('a', '2013-04-01')])
+        self.assertEqual([user for user, date in dispatcher.take(0, 'a')],
+                         ['b', 'b'])
+
+    def test_moves_to_biggest_free_user(self):
+        dispatcher = pairDispatcher(pairs({'a': 2, 'b': 6, 'c': 4}), 1, 2)
+        self.assertEqual(dispatcher.take(0, 'x'), [('b', '2013-01-01')])
+        # b is taken, so the next worker gets c even though b is bigger
+        self.assertEqual(dispatcher.take(1, 'x'), [('c', '2013-01-01')])
+
+    def test_moves_to_most_work_left(self):
+        costs = {'a': 10, 'b': 1, 'c': 3}
+        dispatcher = pairDispatcher(pairs({'a': 1, 'b': 6, 'c': 3}), 6, 1,
+                                    lambda user, date: costs[user])
+        order = []
+        batch = dispatcher.take(0, 'x')
+        while batch:
+            order.append(batch[0][0])
+            batch = dispatcher.take(0, batch[0][0])
+        self.assertEqual(order, ['a', 'c', 'b'])
+
+    def test_steals_from_the_end(self):
+        dispatcher = pairDispatcher(pairs({'a': 6}), 2, 2)
+        self.assertEqual(dispatcher.take(0, 'a'),
+                         [('a', '2013-01-01'), ('a', '2013-02-01')])
+        self.assertEqual(dispatcher.take(1, 'x'),
+                         [('a', '2013-05-01'), ('a', '2013-06-01')])
+        self.assertEqual(dispatcher.take(0, 'a'), [('a', '2013-03-01')])
+        self.assertEqual(dispatcher.stolen, 2)
+
+    def test_batches_shrink_at_the_end(self):
+        dispatcher = pairDispatcher(pairs({'a': 6, 'b': 6}), 4, 3)
+        sizes = []
+        while True:
+            batch = dispatcher.take(0, 'a')
+            if not batch:
+                break
+            sizes.append(len(batch))
+        self.assertEqual(sizes, [4, 2, 2, 1, 1, 1, 1])
+
+    def test_every_pair_once(self):
+        expected = pairs({'a': 6, 'b': 3, 'c': 5, 'd': 1}) + \
+            [('a', '2013-01-01')]
+        dispatcher = pairDispatcher(expected, 3, 3)
+        handed = []
+        current = ['x', 'x', 'x']
+        done = [False] * 3
+        while not all(done):
+            for worker in range(3):
+                batch = dispatcher.take(worker, current[worker])
+                if batch:
+                    handed.extend(batch)
+                    current[worker] = batch[-1][0]
+                else:
+                    done[worker] = True
+        self.assertEqual(sorted(handed), sorted(set(expected)))
+        self.assertEqual(dispatcher.drain(), [])
+
+    def test_requeue(self):
+        dispatcher = pairDispatcher(pairs({'a': 6}), 3, 2)
+        batch = dispatcher.take(0, 'a')
+        self.assertEqual(dispatcher.requeue(0, set(batch[:1])), batch[1:])
+        self.assertEqual(dispatcher.requeue(0, set()), [])
+        self.assertEqual(dispatcher.drain(),
+                         [('a', date) for date in dates[1:]])
+
+    def test_parse_address(self):
+        self.assertEqual(parseAddress('127.0.0.1:8123'), ('127.0.0.1', 8123))
+
+
+if __name__ == '__main__':
+    unittest.main()
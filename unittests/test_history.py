@@ -0,0 +1,48 @@
+#!/usr/bin/python
+
+import unittest
+
+from myuwtesting.history import dateKey, median, mergeTimings, pairEstimator
+
+history = {
+    'javerage': {
+        '2013-01-01': {'override': 9, 'load': 2, 'parse': 1, 'diff': 1},
+        '2013-02-01': {'load': 6},
+        '2013-03-01': {'load': 3, 'parse': 2},
+    },
+    'jinter': {
+        '2013-01-01': {'load': 10},
+    },
+}
+
+
+class historyTest(unittest.TestCase):
+
+    def test_date_key(self):
+        self.assertEqual(dateKey('2013-2-5'), dateKey('2013-02-05'))
+
+    def test_median(self):
+        self.assertEqual(median([3, 1, 2]), 2)
+        self.assertEqual(median([4, 1, 2, 3]), 2.5)
+
+    def test_merge_timings(self):
+        merged = {'javerage': {'2013-02-01': {'load': 1}}}
+        mergeTimings(merged, {'javerage': {'2013-2-1': {'load': 2}},
+                              'jnew': {'2013-03-01': {'load': 3}}})
+        self.assertEqual(merged, {'javerage': {'2013-02-01': {'load': 2}},
+                                  'jnew': {'2013-03-01': {'load': 3}}})
+
+    def test_estimates(self):
+        estimate = pairEstimator(history, 7)
+        # Known pairs leave out override time
+        self.assertEqual(estimate('javerage', '2013-1-1'), 4)
+        self.assertEqual(estimate('jinter', '2013-01-01'), 10)
+        # Then the user's median, then everyone's
+        self.assertEqual(estimate('javerage', '2013-04-01'), 5)
+        self.assertEqual(estimate('jnew', '2013-04-01'), 5.5)
+        self.assertEqual((estimate.known, estimate.guessed), (2, 2))
+        self.assertEqual(pairEstimator({}, 7)('jnew', '2013-04-01'), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
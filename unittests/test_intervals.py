@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+import random
+import unittest
+
+from myuwtesting import intervals
+
+
+def randomList(rand, size=40):
+    '''Random interval list within 0 .. size. '''
+    bounds = sorted(rand.sample(range(1, size), rand.randint(0, 10) * 2))
+    return intervals.normalize(zip(bounds[::2], bounds[1::2]))
+
+
+def members(intervalList, size=40):
+    '''Keys below size in an interval list, found the slow way. '''
+    return set([key for key in range(size)
+                if any([start <= key < end for start, end in intervalList])])
+
+
+class intervalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = random.Random(19)
+
+    def assertNormal(self, intervalList):
+        self.assertEqual(intervalList, intervals.normalize(intervalList))
+
+    def test_normalize(self):
+        self.assertEqual(intervals.normalize([(5, 8), (1, 3), (3, 4),
+                                              (6, 7), (9, 9)]),
+                         [(1, 4), (5, 8)])
+
+    def test_union(self):
+        self.assertEqual(intervals.union([(1, 3), (8, 9)], [(3, 5)],
+                                         [(0, 2), (7, 8)]),
+                         [(0, 5), (7, 9)])
+        self.assertEqual(intervals.union(), [])
+        for i in range(200):
+            lists = [randomList(self.rand)
+                     for j in range(self.rand.randint(1, 4))]
+            result = intervals.union(*lists)
+            self.assertNormal(result)
+            self.assertEqual(members(result),
+                             set().union(*[members(l) for l in lists]))
+
+    def test_intersect_and_difference(self):
+        for i in range(200):
+            a = randomList(self.rand)
+            b = randomList(self.rand)
+            both = intervals.intersect(a, b)
+            self.assertNormal(both)
+            self.assertEqual(members(both), members(a) & members(b))
+            onlyA = intervals.difference(a, b)
+            self.assertEqual(members(onlyA), members(a) - members(b))
+
+    def test_complement(self):
+        self.assertEqual(intervals.complement([]), intervals.everything)
+        self.assertEqual(intervals.complement(intervals.everything), [])
+        self.assertEqual(intervals.complement([(3, 5)]),
+                         [(intervals.minKey, 3), (5, intervals.maxKey)])
+
+    def test_contains(self):
+        for i in range(50):
+            a = randomList(self.rand)
+            inside = members(a)
+            for key in range(40):
+                self.assertEqual(intervals.contains(a, key), key in inside)
+
+
+if __name__ == '__main__':
+    unittest.main()
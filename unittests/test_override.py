@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+import threading
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from urlparse import parse_qs
+
+from selenium.common.exceptions import WebDriverException
+
+from myuwtesting.exceptions import OverrideFailed
+from myuwtesting.override import httpOverrideClient, samePage, inputValue
+
+
+# Override page, showing the override in effect in the form's input. The
+# posted value shows up elsewhere on the page too, like the user list and
+# hidden elements on the real pages.
+formPage = '''<h2>Overriding as %(posted)s</h2>
+<div style="display:none">none</div>
+<form method="post">
+<input type="hidden" name="csrfmiddlewaretoken" value="token">
+<input name="%(field)s" value="%(current)s"></form>'''
+
+# Form field for each override page
+fields = {'/users/': 'override_as', '/admin/dates': 'date'}
+
+
+class fakeServer(BaseHTTPRequestHandler):
+    '''Override pages. What they do with a post depends on the server's
+    mode. '''
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body='', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def page(self, posted=''):
+        field = fields[self.path]
+        return formPage % {'field': field, 'posted': posted,
+                           'current': self.server.current[field]}
+
+    def do_GET(self):
+        self.send(200, self.page())
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length'))
+        posted = parse_qs(self.rfile.read(length))[fields[self.path]][0]
+        mode = self.server.mode
+        if mode == 'login':
+            self.send(302, headers=[('Location', '/login/?next=/users/')])
+        elif mode == 'error':
+            self.send(200, 'Something went wrong')
+        elif mode == 'stale':
+            # The override didn't take, but the page still mentions it
+            self.send(200, self.page(posted))
+        else:
+            self.server.current[fields[self.path]] = posted
+            if mode == 'redirect':
+                self.send(302, headers=[('Location', self.path)])
+            else:
+                self.send(200, self.page(posted))
+
+
+class fakeDriver(object):
+    '''Just enough of a WebDriver for the override client. '''
+
+    def __init__(self, failAdd=False):
+        self.cookies = [{'name': 'sessionid', 'value': 'abc', 'path': '/'}]
+        self.failAdd = failAdd
+
+    def get_cookies(self):
+        return self.cookies
+
+    def add_cookie(self, cookie):
+        if self.failAdd:
+            raise WebDriverException('no such window')
+        self.cookies.append(cookie)
+
+
+class httpOverrideTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), fakeServer)
+        self.server.mode = 'ok'
+        self.server.current = {'override_as': 'javerage',
+                               'date': '2013-04-15 00:00:01'}
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  args=(0.05, ))
+        thread.daemon = True
+        thread.start()
+        base = 'http://127.0.0.1:%s' % self.server.server_port
+        self.url = base + '/users/'
+        self.dateUrl = base + '/admin/dates'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def client(self, driver=None):
+        return httpOverrideClient(driver or fakeDriver(), 5)
+
+    def test_override_shown(self):
+        self.client().setUser(self.url, 'jinter')
+        self.assertEqual(self.server.current['override_as'], 'jinter')
+
+    def test_redirect_back_to_form(self):
+        self.server.mode = 'redirect'
+        self.client().setUser(self.url, 'jinter')
+        self.assertEqual(self.server.current['override_as'], 'jinter')
+
+    def test_redirect_to_login(self):
+        self.server.mode = 'login'
+        self.assertRaises(OverrideFailed,
+                          self.client().setUser, self.url, 'jinter')
+
+    def test_error_page(self):
+        self.server.mode = 'error'
+        self.assertRaises(OverrideFailed,
+                          self.client().setUser, self.url, 'jinter')
+
+    def test_stale_user(self):
+        self.server.mode = 'stale'
+        self.assertRaises(OverrideFailed,
+                          self.client().setUser, self.url, 'none')
+
+    def test_date_override_shown(self):
+        client = self.client()
+        client.setDate(self.dateUrl, '2013-06-19 00:00:01')
+        client.setDate(self.dateUrl, '2013-06-19 14:30:00')
+        self.assertEqual(self.server.current['date'], '2013-06-19 14:30:00')
+
+    def test_stale_time(self):
+        self.server.mode = 'stale'
+        self.assertRaises(OverrideFailed, self.client().setDate,
+                          self.dateUrl, '2013-04-15 14:30:00')
+
+    def test_cookie_conflict(self):
+        client = self.client()
+        # The same cookie for two domains, as the server and the browser
+        # can end up setting
+        client.session.cookies.set('csrftoken', 'a', domain='a.example')
+        client.session.cookies.set('csrftoken', 'b', domain='b.example')
+        self.assertRaises(OverrideFailed, client.setUser, self.url, 'jinter')
+
+    def test_browser_refuses_cookie(self):
+        client = self.client(fakeDriver(failAdd=True))
+        client.session.cookies.set('messages', 'new')
+        self.assertRaises(OverrideFailed, client.setUser, self.url, 'jinter')
+
+    def test_input_value(self):
+        html = '''<input value='2013-1-1' type="text" name="date"/>
+        <input name="date" value="2013-2-1">'''
+        self.assertEqual(inputValue(html, 'date'), '2013-1-1')
+        self.assertEqual(inputValue('<input name="date">', 'date'), '')
+        self.assertEqual(inputValue(html, 'override_as'), None)
+
+    def test_same_page(self):
+        self.assertTrue(samePage('http://a/users', 'http://a/users/?x=1'))
+        self.assertFalse(samePage('http://a/login/', 'http://a/users/'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+import unittest
+from StringIO import StringIO
+
+from myuwtesting.protocol import pairRecord, errorRecord, doneRecord, \
+    writeRecord, readRecord
+
+
+class flushCounter(StringIO):
+    '''StringIO which counts flushes. '''
+
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        StringIO.flush(self)
+
+
+class protocolTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        records = [
+            pairRecord('javerage', '2013-04-15', [{'kind': 'missing',
+                                                   'card': 'A'}],
+                       {'load': 2.0}, ['B'], ['Traceback\n  ...']),
+            errorRecord(u'Caf\xe9\nbroke'),
+            doneRecord(2),
+        ]
+        stream = flushCounter()
+        for record in records:
+            writeRecord(stream, record)
+        self.assertEqual(stream.flushes, len(records))
+        lines = stream.getvalue().splitlines(True)
+        self.assertEqual(len(lines), len(records))
+        self.assertEqual([readRecord(line) for line in lines], records)
+
+    def test_other_lines_are_output(self):
+        for line in ('Loading...\n', '[1, 2]\n', '{"user": "a"}\n', '\n',
+                     '{"type": "pair"\n'):
+            self.assertEqual(readRecord(line),
+                             {'type': 'output', 'text': line[:-1]})
+
+    def test_pair_date_as_text(self):
+        record = pairRecord('javerage', 12, [], {}, [], [])
+        self.assertEqual(record['date'], '12')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import random
+import unittest
+from datetime import date, timedelta
+
+from myuwtesting.classes import myuwDate
+from myuwtesting.functions import splitList
+from myuwtesting.history import pairEstimator
+from myuwtesting.schedule import countOverrides, chunkCost, schedulePairs
+
+costs = {'user': 1.5, 'date': 1.5, 'time': 1.5, 'page': 3.0}
+
+users = ['javerage', 'jinter', 'jnew', 'none', 'eight', 'botgrad']
+dates = ['2013-03-10', '2013-03-27', '2013-04-15', '2013-04-15 00:01:00',
+         '2013-06-19', '2013-08-28', '2013-12-18']
+
+
+def allPairs():
+    '''Every user with every date, in date order as main.py gives them. '''
+    return [(user, date) for date in dates for user in users]
+
+
+def overrideTotal(chunks):
+    '''Overrides needed for every chunk, each starting on javerage. '''
+    return sum([sum(countOverrides(chunk, 'javerage',
+                                   '2013-04-15').values())
+                for chunk in chunks])
+
+
+class schedulePairsTest(unittest.TestCase):
+
+    def test_every_pair_once(self):
+        pairs = allPairs()
+        for n in range(1, 8):
+            chunks = schedulePairs(pairs + pairs[:5], n, 'javerage',
+                                   '2013-04-15', costs=costs)
+            self.assertTrue(0 < len(chunks) <= n)
+            self.assertTrue(all(chunks))
+            scheduled = sum(chunks, [])
+            self.assertEqual(sorted(scheduled), sorted(pairs))
+
+    def test_grouped_by_user(self):
+        chunks = schedulePairs(allPairs(), 1, 'none', '2013-04-15',
+                               costs=costs)
+        ordered = chunks[0]
+        self.assertEqual(ordered[0][0], 'none')
+        seen = []
+        for user, date in ordered:
+            if not seen or seen[-1] != user:
+                self.assertNotIn(user, seen)
+                seen.append(user)
+        for user in users:
+            userDates = [myuwDate(date) for u, date in ordered if u == user]
+            self.assertEqual(userDates, sorted(userDates))
+
+    def test_fewer_overrides_than_in_order(self):
+        pairs = allPairs()
+        for n in (1, 2, 3, 4):
+            chunks = schedulePairs(pairs, n, 'javerage', '2013-04-15',
+                                   costs=costs)
+            self.assertTrue(overrideTotal(chunks) <
+                            overrideTotal(splitList(pairs, n)))
+
+    def test_user_not_split_for_small_imbalance(self):
+        pairs = [(user, date) for user in ('javerage', 'jinter')
+                 for date in dates]
+        chunks = schedulePairs(pairs, 2, 'javerage', '2013-04-15',
+                               costs=costs)
+        self.assertEqual([set([user for user, date in chunk])
+                          for chunk in chunks],
+                         [set(['javerage']), set(['jinter'])])
+
+    def test_cut_within_a_user(self):
+        '''A worker which starts partway through a user still has to
+        override to that user. '''
+        days = ['2013-01-%02d' % day for day in range(1, 13)]
+        for n, size in ((2, 6), (3, 4), (4, 3)):
+            chunks = schedulePairs([('jinter', day) for day in days], n,
+                                   'javerage', '2013-04-15', costs=costs)
+            self.assertEqual([len(chunk) for chunk in chunks], [size] * n)
+            self.assertEqual(len(set([chunkCost(chunk, 'javerage',
+                                                '2013-04-15', costs=costs)
+                                      for chunk in chunks])), 1)
+
+    def test_empty(self):
+        self.assertEqual(schedulePairs([], 3, 'javerage', '2013-04-15'), [])
+
+    def test_balanced_by_estimates(self):
+        '''Chunks cost the same to within the pairs on either side of each
+        cut, and the snapping tolerance. '''
+        rand = random.Random(9)
+        history = {}
+        for user in users:
+            day = date(2013, 1, 1)
+            for i in range(rand.randint(5, 40)):
+                day += timedelta(days=rand.randint(1, 5))
+                history.setdefault(user, {})[str(day)] = {
+                    'load': rand.uniform(0.5, 6), 'parse': rand.uniform(0, 3),
+                    'diff': rand.uniform(0, 1)}
+        pairs = [(user, day) for user in history for day in history[user]]
+        estimate = pairEstimator(history, costs['page'])
+        largest = max([estimate(user, day) for user, day in pairs]) + \
+            sum([cost for kind, cost in costs.items() if kind != 'page'])
+        for tolerance in (0, 0.1):
+            for n in range(2, 7):
+                chunks = schedulePairs(pairs, n, 'javerage', '2013-04-15',
+                                       estimate, costs, tolerance)
+                self.assertEqual(len(chunks), n)
+                chunkCosts = [chunkCost(chunk, 'javerage', '2013-04-15',
+                                        estimate, costs)
+                              for chunk in chunks]
+                share = sum(chunkCosts) / n
+                for cost in chunkCosts:
+                    self.assertTrue(abs(cost - share) <=
+                                    2 * (largest + tolerance * share),
+                                    (tolerance, n, chunkCosts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import unittest
+
+from myuwtesting.classes import myuwCard, myuwDate, visAlways, visAfter, \
+    visBefore, visUnion, visSub
+from myuwtesting import expected
+
+
+class extraDatesCard(myuwCard):
+    '''Card shown on every date, with a date of its own. '''
+    visCheck = visAlways
+    extraSigDates = [myuwDate('2013-04-07')]
+
+
+class plainCard(myuwCard):
+    visCheck = visAlways
+
+
+class significantDatesTest(unittest.TestCase):
+
+    def test_extra_dates_stay_with_their_card(self):
+        before = list(visAlways.significantDates)
+        card = extraDatesCard()
+        self.assertEqual(card.significantDates, [myuwDate('2013-04-07')])
+        # Asking again must not add them again, or give them to the vis
+        # object other cards share
+        self.assertEqual(card.significantDates, [myuwDate('2013-04-07')])
+        self.assertEqual(visAlways.significantDates, before)
+        self.assertEqual(plainCard().significantDates, before)
+
+    def test_collections_keep_child_dates(self):
+        # Together these cover every date, but the dates where each one
+        # changes are still tested
+        after = visAfter(myuwDate('2013-01-10'))
+        before = visBefore(myuwDate('2013-03-01'))
+        union = visUnion(after, before)
+        self.assertTrue(union.shouldAppear(myuwDate('2012-06-01')))
+        self.assertEqual(union.significantDates,
+                         after.sigDates + before.sigDates)
+        self.assertEqual(visSub(after, before).significantDates,
+                         after.sigDates + before.sigDates)
+
+    def test_card_dates_worked_out_once(self):
+        card = extraDatesCard()
+        first = expected.cardSignificantDates(card)
+        self.assertTrue(expected.cardSignificantDates(card) is first)
+
+
+if __name__ == '__main__':
+    unittest.main()